@@ -0,0 +1,305 @@
+"""
+Shared loading and derived-column stage for the cooling analysis (data.py, fit.py).
+
+A log is read once (CSV from emu.sh/sampler.py, or the binary .cpulog), cleaned,
+and the derived quantities are computed in one vectorized pass:
+
+    Thermal_Resistance_Calculated  R_th = (T_case - T_ambient) / P_cpu
+    Delta_T_C                      T_case - T_ambient
+    Segment_ID                     one id per (Set_PPT_W, Mprime_Threads) run
+    Elapsed_S                      seconds since the first sample
+    Temp_Slope_C_per_S             trailing least-squares slope of CPU_Temp_C within the segment
+    Steady_State                   True once the segment's temperature has settled
+
+summarize_segments() then reduces each segment's steady-state rows to robust
+statistics (medians, IQR), so the model is fitted on one point per segment
+instead of on every raw sample including the transient after each PPT change.
+"""
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+COL_TIMESTAMP = 'Timestamp'
+COL_ACTUAL_PPT = 'CPU_Power_W_Actual'
+COL_SET_PPT = 'Set_PPT_W'
+COL_CPU_TEMP = 'CPU_Temp_C'
+COL_FAN_RPM = 'CPU_Fan_RPM'
+COL_AMBIENT_TEMP = 'Ambient_Temp_C'
+COL_MPRIME_THREADS = 'Mprime_Threads'
+COL_SEGMENT = 'Segment'
+COL_PHASE = 'Phase'
+COL_RTH = 'Thermal_Resistance_Calculated'
+COL_DELTA_T = 'Delta_T_C'
+COL_SEGMENT_ID = 'Segment_ID'
+COL_ELAPSED = 'Elapsed_S'
+COL_TEMP_SLOPE = 'Temp_Slope_C_per_S'
+COL_STEADY = 'Steady_State'
+
+NUMERIC_COLUMNS = [COL_ACTUAL_PPT, COL_SET_PPT, COL_CPU_TEMP, COL_FAN_RPM,
+                   COL_AMBIENT_TEMP, COL_MPRIME_THREADS, COL_SEGMENT]
+REQUIRED_COLUMNS = [COL_ACTUAL_PPT, COL_CPU_TEMP, COL_FAN_RPM, COL_AMBIENT_TEMP]
+
+# Bump when the loading/derivation logic changes so cached datasets are rebuilt.
+ANALYSIS_VERSION = 2
+
+# Steady-state test: over a trailing window of STEADY_WINDOW_S seconds within one
+# segment, the temperature trend must be below STEADY_MAX_SLOPE_C_PER_MIN and its
+# standard deviation below STEADY_MAX_STD_C.
+STEADY_WINDOW_S = 10.0
+STEADY_MAX_SLOPE_C_PER_MIN = 3.0
+STEADY_MAX_STD_C = 0.5
+# Segments with fewer steady rows than this are left out of the fit.
+MIN_STEADY_SAMPLES = 3
+
+DEFAULT_LOG_FILE = "cpu_cooling_data_controlled.csv"
+PROCESSED_CSV_FILE = "cpu_cooling_data_processed.csv"
+
+
+@dataclass
+class CoolingDataset:
+    """A loaded log plus its derived columns; the one object data.py and fit.py share."""
+    df: pd.DataFrame
+    source: str
+    power_threshold_w: float
+    dropped_non_measurement_rows: int = 0
+    low_power_rows: int = 0
+    cache_key: str = ''
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def rpm_rth(self) -> pd.DataFrame:
+        """Rows usable for the R_th(RPM) relationship (finite R_th, positive RPM)."""
+        frame = self.df[[COL_FAN_RPM, COL_RTH]]
+        valid = np.isfinite(frame[COL_RTH].to_numpy()) & (frame[COL_FAN_RPM].to_numpy() > 0)
+        return frame[valid]
+
+    def sorted_fit_arrays(self) -> tuple:
+        """(rpm, rth) numpy arrays of all raw rows sorted by RPM, for scatter plots."""
+        frame = self.rpm_rth()
+        x = frame[COL_FAN_RPM].to_numpy(dtype=float)
+        y = frame[COL_RTH].to_numpy(dtype=float)
+        order = np.argsort(x, kind='stable')
+        return x[order], y[order]
+
+    def segment_summary(self, min_steady_samples=MIN_STEADY_SAMPLES) -> pd.DataFrame:
+        """Per-segment steady-state statistics; see summarize_segments."""
+        return summarize_segments(self.df, min_steady_samples)
+
+    def segment_fit_arrays(self, min_steady_samples=MIN_STEADY_SAMPLES) -> tuple:
+        """(rpm, rth) medians of the usable segments sorted by RPM, ready for curve fitting."""
+        summary = self.segment_summary(min_steady_samples)
+        summary = summary[summary['Usable']]
+        x = summary[COL_FAN_RPM].to_numpy(dtype=float)
+        y = summary[COL_RTH].to_numpy(dtype=float)
+        valid = np.isfinite(x) & np.isfinite(y) & (x > 0)
+        x, y = x[valid], y[valid]
+        order = np.argsort(x, kind='stable')
+        return x[order], y[order]
+
+
+def _read_binary_log(path, start_row=0):
+    from binlog import open_binlog
+    header, records = open_binlog(path)
+    records = records[start_row:]
+    local_tz = datetime.now().astimezone().tzinfo
+    timestamps = pd.to_datetime(records['timestamp_ns'], unit='ns', utc=True)
+    df = pd.DataFrame({
+        COL_TIMESTAMP: timestamps.tz_convert(local_tz).tz_localize(None),
+        COL_ACTUAL_PPT: records['power_w'],
+        COL_CPU_TEMP: records['temp_c'],
+    })
+    if header['has_fan']:
+        df[COL_FAN_RPM] = np.where(records['fan_rpm'] >= 0, records['fan_rpm'], np.nan)
+    df[COL_AMBIENT_TEMP] = records['ambient_c']
+    if header['has_set_ppt']:
+        df[COL_SET_PPT] = records['set_ppt_w']
+    if header['has_mprime_threads']:
+        df[COL_MPRIME_THREADS] = np.where(records['mprime_threads'] >= 0, records['mprime_threads'], np.nan)
+    df[COL_SEGMENT] = records['segment']
+    df[COL_PHASE] = pd.Categorical.from_codes(records['phase'], header['phases'])
+    return df
+
+
+def read_log(path):
+    """Reads a logger CSV or .cpulog into a DataFrame with stripped names and numeric columns."""
+    if path.endswith('.cpulog'):
+        return _read_binary_log(path)
+    return clean_log_frame(pd.read_csv(path))
+
+
+def clean_log_frame(df):
+    """Strips column names and parses the numeric and timestamp columns of raw CSV rows, in place."""
+    df.columns = df.columns.str.strip()
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            # ReadErrRMThm / RMStartFail / N/A markers become NaN.
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if COL_TIMESTAMP in df.columns:
+        df[COL_TIMESTAMP] = pd.to_datetime(df[COL_TIMESTAMP], errors='coerce')
+    return df
+
+
+def add_derived_columns(df, power_threshold_w=1.0):
+    """
+    Adds R_th, delta-T, segment ids and elapsed time to df in place.
+
+    Args:
+        df (pd.DataFrame): Log with the REQUIRED_COLUMNS.
+        power_threshold_w (float): Rows with less package power than this get a
+                                   NaN R_th instead of a meaningless ratio.
+
+    Returns:
+        int: Number of rows below the power threshold.
+    """
+    power = df[COL_ACTUAL_PPT].to_numpy(dtype=float)
+    delta_t = df[COL_CPU_TEMP].to_numpy(dtype=float) - df[COL_AMBIENT_TEMP].to_numpy(dtype=float)
+    low_power = ~(power >= power_threshold_w)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rth = np.where(low_power, np.nan, delta_t / power)
+    df[COL_DELTA_T] = delta_t
+    df[COL_RTH] = rth
+
+    if COL_SEGMENT in df.columns:
+        df[COL_SEGMENT_ID] = df[COL_SEGMENT].to_numpy()
+    else:
+        # Older logs have no Segment column: a new segment starts whenever the test settings change.
+        keys = [c for c in (COL_SET_PPT, COL_MPRIME_THREADS) if c in df.columns]
+        if keys:
+            settings = df[keys].fillna(-1)
+            changed = (settings != settings.shift()).any(axis=1).to_numpy()
+            df[COL_SEGMENT_ID] = np.cumsum(changed) - 1
+        else:
+            df[COL_SEGMENT_ID] = 0
+
+    if COL_TIMESTAMP in df.columns and len(df):
+        df[COL_ELAPSED] = (df[COL_TIMESTAMP] - df[COL_TIMESTAMP].iloc[0]).dt.total_seconds()
+    mark_steady_state(df)
+    return int(low_power.sum())
+
+
+def mark_steady_state(df, window_s=STEADY_WINDOW_S, max_slope_c_per_min=STEADY_MAX_SLOPE_C_PER_MIN,
+                      max_std_c=STEADY_MAX_STD_C):
+    """
+    Adds the trailing temperature slope and the Steady_State flag to df in place.
+
+    The slope is a least-squares fit of CPU_Temp_C against time over the last
+    `window_s` seconds of samples, computed with grouped rolling sums so windows
+    never straddle two segments. Rows before a full window has been seen in their
+    segment are not steady.
+
+    Args:
+        df (pd.DataFrame): Log with CPU_Temp_C and Segment_ID (and ideally Elapsed_S).
+        window_s (float): Trailing window length in seconds.
+        max_slope_c_per_min (float): Largest |dT/dt| still considered settled.
+        max_std_c (float): Largest temperature standard deviation within the window.
+    """
+    if COL_ELAPSED in df.columns:
+        t = df[COL_ELAPSED].to_numpy(dtype=float)
+    else:
+        t = np.arange(len(df), dtype=float)
+    if len(df) < 2:
+        df[COL_TEMP_SLOPE] = np.nan
+        df[COL_STEADY] = False
+        return
+    interval_s = np.nanmedian(np.diff(t))
+    window = max(3, int(round(window_s / interval_s))) if interval_s > 0 else 3
+
+    segments = df[COL_SEGMENT_ID].to_numpy()
+    # Time relative to the segment start keeps the rolling sums well conditioned.
+    segment_start = pd.Series(t).groupby(segments).transform('first').to_numpy()
+    temp = df[COL_CPU_TEMP].to_numpy(dtype=float)
+    t = t - segment_start
+    sums = pd.DataFrame({'t': t, 'y': temp, 'tt': t * t, 'ty': t * temp})
+    rolled = sums.groupby(segments).rolling(window, min_periods=window).sum()
+    rolled = rolled.reset_index(level=0, drop=True).sort_index()
+    n = float(window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ((n * rolled['ty'] - rolled['t'] * rolled['y'])
+                 / (n * rolled['tt'] - rolled['t'] ** 2)).to_numpy()
+    temp_std = pd.Series(temp).groupby(segments).rolling(window, min_periods=window).std()
+    temp_std = temp_std.reset_index(level=0, drop=True).sort_index().to_numpy()
+
+    df[COL_TEMP_SLOPE] = slope
+    df[COL_STEADY] = (np.abs(slope) * 60.0 <= max_slope_c_per_min) & (temp_std <= max_std_c)
+
+
+def summarize_segments(df, min_steady_samples=MIN_STEADY_SAMPLES):
+    """
+    Reduces each segment's steady-state rows to robust summary statistics.
+
+    Args:
+        df (pd.DataFrame): Log with derived columns (see add_derived_columns).
+        min_steady_samples (int): Segments with fewer steady rows are marked unusable.
+
+    Returns:
+        pd.DataFrame: One row per Segment_ID with the segment settings, sample
+                      counts, the usable fraction, medians of power, temperature,
+                      fan RPM, ambient, delta-T and R_th, and the R_th IQR.
+    """
+    settings = [c for c in (COL_SET_PPT, COL_MPRIME_THREADS) if c in df.columns]
+    grouped = df.groupby(COL_SEGMENT_ID, sort=True)
+    summary = grouped[settings].first() if settings else pd.DataFrame(index=grouped.size().index)
+    summary['Samples'] = grouped.size()
+    summary['Steady_Samples'] = grouped[COL_STEADY].sum().astype(int)
+    summary['Usable_Fraction'] = summary['Steady_Samples'] / summary['Samples']
+    if COL_ELAPSED in df.columns:
+        summary['Start_S'] = grouped[COL_ELAPSED].first()
+
+    steady = df[df[COL_STEADY].to_numpy()]
+    stats_columns = [c for c in (COL_ACTUAL_PPT, COL_CPU_TEMP, COL_FAN_RPM, COL_AMBIENT_TEMP, COL_DELTA_T, COL_RTH)
+                     if c in steady.columns]
+    steady_grouped = steady.groupby(COL_SEGMENT_ID)[stats_columns]
+    summary = summary.join(steady_grouped.median())
+    rth = steady.groupby(COL_SEGMENT_ID)[COL_RTH]
+    summary['Rth_IQR'] = rth.quantile(0.75) - rth.quantile(0.25)
+    summary['Usable'] = summary['Steady_Samples'] >= min_steady_samples
+    return summary.reset_index()
+
+
+def load_dataset(path=DEFAULT_LOG_FILE, power_threshold_w=1.0, measurement_only=True, cache=None):
+    """
+    Loads a log once and derives everything the analysis needs.
+
+    Args:
+        path (str): Logger CSV or binary .cpulog file.
+        power_threshold_w (float): See add_derived_columns.
+        measurement_only (bool): Drop warm-up/cool-down/idle rows of sampler.py logs.
+        cache (AnalysisCache): Optional cache; an unchanged log is then loaded from
+                               the pickled dataset instead of being re-parsed.
+
+    Returns:
+        CoolingDataset: The loaded data. Its cache_key identifies the log contents and
+                        parameters, for keying results derived from it ('' without a cache).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Log file '{path}' not found.")
+    key = ''
+    if cache is not None:
+        key = cache.key('dataset', ANALYSIS_VERSION, cache.file_digest(path), power_threshold_w, measurement_only)
+        dataset = cache.get(key)
+        if dataset is not None:
+            dataset.source = path
+            return dataset
+    df = read_log(path)
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError(f"Cannot proceed, missing essential columns in '{path}': {missing}. "
+                       f"Available columns: {df.columns.tolist()}")
+
+    dropped = 0
+    if measurement_only and COL_PHASE in df.columns:
+        keep = (df[COL_PHASE] == 'measure').to_numpy()
+        dropped = int((~keep).sum())
+        df = df[keep].reset_index(drop=True)
+
+    low_power_rows = add_derived_columns(df, power_threshold_w)
+    dataset = CoolingDataset(df=df, source=path, power_threshold_w=power_threshold_w,
+                             dropped_non_measurement_rows=dropped, low_power_rows=low_power_rows,
+                             cache_key=key)
+    if cache is not None:
+        cache.put(key, dataset)
+    return dataset
@@ -0,0 +1,393 @@
+"""
+Block-wise PCM decoding and streaming silence detection for process_audio.py.
+
+StreamingSilenceDetector reproduces pydub.silence.detect_nonsilent(...,
+seek_step=1) exactly: a window of min_silence_len ms starting at every
+millisecond is silent when audioop.rms of its samples is at or below the
+threshold, and overlapping silent windows are merged the same way. Instead of
+slicing an AudioSegment 1 ms at a time, it reduces the samples to one
+sum-of-squares per millisecond and evaluates every window of a block at once
+with NumPy, keeping only the last min_silence_len ms of history. Non-silent
+ranges are emitted as soon as they are known.
+
+PcmStream decodes an audio file in fixed-size blocks (WAV directly, anything
+else through an ffmpeg pipe) with the same sample format pydub would pick, so
+hour-long recordings never have to be held in memory.
+"""
+import subprocess
+import wave
+
+import numpy as np
+from pydub.utils import db_to_float, get_encoder_name, mediainfo_json
+
+DEFAULT_BLOCK_FRAMES = 1 << 18
+
+
+def pcm_to_array(data, sample_width, channels):
+    """Interprets interleaved little-endian PCM bytes as a (frames, channels) integer array."""
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+    elif sample_width == 1:
+        # 8-bit PCM is unsigned; pydub re-centres it on zero (audioop.bias) the same way.
+        samples = np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128
+    else:
+        samples = np.frombuffer(data, dtype={2: '<i2', 4: '<i4'}[sample_width])
+    return samples.reshape(-1, channels)
+
+
+class PcmStream:
+    """
+    Decodes an audio file into blocks of raw PCM frames.
+
+    Attributes frame_rate, channels and sample_width describe the samples; use
+    blocks() to iterate over them (frames_read counts the frames yielded). WAV files are read with the wave module, other
+    formats through ffmpeg, converted to the PCM format pydub's from_file uses.
+    """
+
+    def __init__(self, path, block_frames=DEFAULT_BLOCK_FRAMES):
+        self.path = path
+        self.block_frames = block_frames
+        self.frames_read = 0
+        self._wave = None
+        self._process = None
+        try:
+            self._wave = wave.open(path, 'rb')
+        except (wave.Error, EOFError):
+            self._open_ffmpeg()
+        else:
+            self.frame_rate = self._wave.getframerate()
+            self.channels = self._wave.getnchannels()
+            self.sample_width = self._wave.getsampwidth()
+        self.frame_width = self.channels * self.sample_width
+
+    def _open_ffmpeg(self):
+        info = mediainfo_json(self.path)
+        streams = [s for s in info.get('streams', []) if s.get('codec_type') == 'audio']
+        if not streams:
+            raise ValueError(f"'{self.path}' has no audio stream")
+        stream = streams[0]
+        # Same rule as pydub's from_file: lossy codecs decoded to float are exported as 16-bit.
+        if stream.get('sample_fmt') == 'fltp' and stream.get('codec_name') in ('mp3', 'mp4', 'aac', 'webm', 'ogg'):
+            bits = 16
+        else:
+            bits = int(stream.get('bits_per_sample') or 16)
+        if bits not in (8, 16, 24, 32):
+            bits = 16
+        self.frame_rate = int(stream['sample_rate'])
+        self.channels = int(stream['channels'])
+        self.sample_width = bits // 8
+        raw_format = 'u8' if bits == 8 else f's{bits}le'
+        command = [get_encoder_name(), '-v', 'error', '-i', self.path, '-vn',
+                   '-acodec', 'pcm_u8' if bits == 8 else f'pcm_s{bits}le', '-f', raw_format, '-']
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def blocks(self):
+        """Yields bytes objects of whole frames, block_frames at a time (the last may be shorter)."""
+        if self._wave is not None:
+            while True:
+                data = self._wave.readframes(self.block_frames)
+                if not data:
+                    return
+                self.frames_read += len(data) // self.frame_width
+                yield data
+        block_bytes = self.block_frames * self.frame_width
+        pending = b''
+        while True:
+            data = self._process.stdout.read(block_bytes)
+            if not data:
+                break
+            data = pending + data
+            whole = len(data) - len(data) % self.frame_width
+            pending = data[whole:]
+            if whole:
+                self.frames_read += whole // self.frame_width
+                yield data[:whole]
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode '{self.path}': "
+                               f"{self._process.stderr.read().decode(errors='ignore').strip()}")
+
+    def close(self):
+        if self._wave is not None:
+            self._wave.close()
+            self._wave = None
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process.stderr.close()
+            self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamingSilenceDetector:
+    """
+    Incremental, exact equivalent of pydub's detect_nonsilent(seek_step=1).
+
+    Feed PCM blocks in order with feed(); each call returns the [start_ms, end_ms]
+    non-silent ranges that became final. finish() returns the rest; after it,
+    duration_ms is the length pydub would report for the audio.
+    """
+
+    def __init__(self, frame_rate, channels, sample_width, min_silence_len=1000, silence_thresh=-16):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.min_silence_len = int(min_silence_len)
+        max_possible_amplitude = (2 ** (sample_width * 8)) / 2
+        self.silence_thresh = db_to_float(silence_thresh) * max_possible_amplitude
+        self.duration_ms = None
+        self._frames_per_ms = frame_rate / 1000.0
+        # Squares of 8/16-bit samples sum exactly in int64; wider samples use float64 like audioop does.
+        self._energy_dtype = np.int64 if sample_width <= 2 else np.float64
+        self._frames = 0  # frames fed so far
+        self._next_ms = 0  # first millisecond whose energy is not yet complete
+        self._pending_energy = np.zeros(0, dtype=self._energy_dtype)  # frames from that millisecond on
+        self._history = np.zeros(0, dtype=self._energy_dtype)  # per-ms energy of ms [_next_window, _next_ms)
+        self._next_window = 0  # first window start not yet evaluated
+        self._last_silent = None  # latest silent window start
+        self._nonsilent_start = 0  # end of the last closed silent range
+        self._found_silence = False
+
+    def _frame_at(self, ms):
+        """Frame index of a millisecond position, as AudioSegment slicing computes it."""
+        return (np.asarray(ms, dtype=np.float64) * self._frames_per_ms).astype(np.int64)
+
+    def feed(self, data):
+        """Adds a block of interleaved PCM bytes (whole frames). Returns newly final non-silent ranges."""
+        samples = pcm_to_array(data, self.sample_width, self.channels).astype(self._energy_dtype)
+        energy = (samples * samples).sum(axis=1)
+        self._frames += len(energy)
+        self._pending_energy = np.concatenate([self._pending_energy, energy])
+        return self._advance(self._frames)
+
+    def finish(self):
+        """Flushes the tail of the audio. Returns the remaining non-silent ranges."""
+        if self.duration_ms is not None:
+            return []
+        self.duration_ms = round(1000 * (self._frames / self.frame_rate))
+        # AudioSegment pads a slice running past the last frame with silence (at most a couple of ms).
+        end_frame = int(self._frame_at(self.duration_ms))
+        if end_frame > self._frames:
+            padding = np.zeros(end_frame - self._frames, dtype=self._energy_dtype)
+            self._pending_energy = np.concatenate([self._pending_energy, padding])
+        ranges = self._advance(max(end_frame, self._frames), last_ms=self.duration_ms)
+
+        seg_len = self.duration_ms
+        if not self._found_silence:
+            return ranges + [[0, seg_len]]
+        silence_end = self._last_silent + self.min_silence_len
+        if silence_end != seg_len:
+            ranges.append([silence_end, seg_len])
+        return ranges
+
+    def _advance(self, available_frames, last_ms=None):
+        # 1. Close every millisecond bucket whose frames are all available.
+        start_frame = int(self._frame_at(self._next_ms))
+        last_complete = int((available_frames + 1) / self._frames_per_ms) + 1
+        if last_ms is not None:
+            last_complete = min(last_complete, last_ms)
+        ms = np.arange(self._next_ms, last_complete + 1)
+        bounds = self._frame_at(ms)
+        complete = int(np.searchsorted(bounds, available_frames, side='right')) - 1
+        if complete > 0:
+            offsets = bounds[:complete + 1] - start_frame
+            cumulative = np.concatenate([[0], np.cumsum(self._pending_energy[:offsets[-1]])])
+            ms_energy = cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+            self._pending_energy = self._pending_energy[offsets[-1]:]
+            self._history = np.concatenate([self._history, ms_energy.astype(self._energy_dtype)])
+            self._next_ms += complete
+
+        # 2. Evaluate every window of min_silence_len ms that now lies in complete milliseconds.
+        window = self.min_silence_len
+        count = len(self._history) - window + 1
+        if window <= 0 or count <= 0:
+            return []
+        cumulative = np.concatenate([[0], np.cumsum(self._history)])
+        window_energy = cumulative[window:window + count] - cumulative[:count]
+        starts = np.arange(self._next_window, self._next_window + count)
+        samples = (self._frame_at(starts + window) - self._frame_at(starts)) * self.channels
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # audioop.rms truncates to an integer.
+            rms = np.floor(np.sqrt(window_energy / samples))
+        rms = np.where(samples > 0, rms, 0)
+        silent_starts = starts[rms <= self.silence_thresh]
+        self._history = self._history[count:]
+        self._next_window += count
+        return self._merge(silent_starts)
+
+    def _merge(self, silent_starts):
+        # Same merge rule as pydub's detect_silence: a silent window starts a new silent range only
+        # if it is not adjacent to the previous one and does not overlap its min_silence_len span.
+        # The non-silent range before a silent range is final as soon as that silent range opens.
+        ranges = []
+        if len(silent_starts) == 0:
+            return ranges
+        if not self._found_silence:
+            self._found_silence = True
+            self._open_silence(int(silent_starts[0]), ranges)
+            self._last_silent = int(silent_starts[0])
+            silent_starts = silent_starts[1:]
+            if len(silent_starts) == 0:
+                return ranges
+        previous = np.concatenate([[self._last_silent], silent_starts[:-1]])
+        for b in np.flatnonzero(silent_starts > previous + self.min_silence_len):
+            self._nonsilent_start = int(previous[b]) + self.min_silence_len
+            self._open_silence(int(silent_starts[b]), ranges)
+        self._last_silent = int(silent_starts[-1])
+        return ranges
+
+    def _open_silence(self, start, ranges):
+        if start > self._nonsilent_start:  # pydub drops a leading [0, 0]
+            ranges.append([self._nonsilent_start, start])
+
+
+def detect_nonsilent_stream(source, min_silence_len=1000, silence_thresh=-16, block_frames=DEFAULT_BLOCK_FRAMES):
+    """
+    Streams an audio file through StreamingSilenceDetector.
+
+    Args:
+        source (str or PcmStream): Path of the audio file, or a PcmStream the caller
+                                   opened (and closes) to keep its format and frames_read.
+
+    Yields:
+        list: [start_ms, end_ms] non-silent ranges, in order, as soon as each is final.
+    """
+    if not isinstance(source, PcmStream):
+        with PcmStream(source, block_frames) as stream:
+            yield from detect_nonsilent_stream(stream, min_silence_len, silence_thresh)
+        return
+    detector = StreamingSilenceDetector(source.frame_rate, source.channels, source.sample_width,
+                                        min_silence_len, silence_thresh)
+    for block in source.blocks():
+        yield from detector.feed(block)
+    yield from detector.finish()
+
+
+def ms_to_frame(ms, frame_rate):
+    """Frame index of a millisecond position, as AudioSegment slicing computes it."""
+    return int(ms * (frame_rate / 1000.0))
+
+
+def silence_frames(duration_ms, frame_rate):
+    """Length in frames of AudioSegment.silent(duration_ms, frame_rate)."""
+    return int(frame_rate * (duration_ms / 1000.0))
+
+
+class PcmWriter:
+    """
+    Writes raw PCM frames to an audio file as they are produced.
+
+    WAV is written with the wave module (as pydub's export does); other formats are
+    piped into an ffmpeg encoder, so the output never has to be assembled in memory.
+
+    Frames are written in the input's own sample format, which differs from the old
+    AudioSegment export: 8-bit input stays 8-bit at its own rate (pydub promoted it
+    to 16-bit at 11025 Hz) and 24-bit input stays 24-bit (pydub wrote 32-bit).
+    """
+
+    def __init__(self, path, output_format, frame_rate, channels, sample_width):
+        self.path = path
+        self.frame_width = channels * sample_width
+        self.frames_written = 0
+        # Silence in the file's own encoding: 8-bit PCM is unsigned, so its zero level is 0x80.
+        self._silence_byte = b'\x80' if sample_width == 1 else b'\x00'
+        self._wave = None
+        self._process = None
+        if output_format == 'wav':
+            self._wave = wave.open(path, 'wb')
+            self._wave.setnchannels(channels)
+            self._wave.setsampwidth(sample_width)
+            self._wave.setframerate(frame_rate)
+        else:
+            raw_format = 'u8' if sample_width == 1 else f's{sample_width * 8}le'
+            command = [get_encoder_name(), '-y', '-v', 'error',
+                       '-f', raw_format, '-ar', str(frame_rate), '-ac', str(channels), '-i', 'pipe:0',
+                       '-f', output_format, path]
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, data):
+        """Appends whole frames of PCM bytes."""
+        if self._wave is not None:
+            self._wave.writeframesraw(data)
+        else:
+            self._process.stdin.write(data)
+        self.frames_written += len(data) // self.frame_width
+
+    def write_silence(self, frames, chunk_frames=1 << 16):
+        chunk = self._silence_byte * (self.frame_width * min(frames, chunk_frames))
+        while frames > 0:
+            n = min(frames, chunk_frames)
+            self.write(chunk[:n * self.frame_width])
+            frames -= n
+
+    def close(self):
+        if self._wave is not None:
+            self._wave.close()  # patches the header with the final length
+            self._wave = None
+        if self._process is not None:
+            process, self._process = self._process, None
+            process.stdin.close()
+            error = process.stderr.read().decode(errors='ignore').strip()
+            process.stderr.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to encode '{self.path}': {error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def copy_ranges(stream, writer, ranges_ms, gap_frames=0):
+    """
+    Copies millisecond ranges of a PcmStream to a PcmWriter in one pass, in linear time.
+
+    Each range is sliced the way AudioSegment[start:end] would be, and gap_frames of
+    silence go between consecutive ranges. A range running past the last decoded
+    frame is padded with silence, as AudioSegment slicing does.
+
+    Args:
+        stream (PcmStream): Source, not yet iterated.
+        writer (PcmWriter): Destination.
+        ranges_ms (list): Sorted, non-overlapping [start_ms, end_ms] ranges.
+        gap_frames (int): Silence between ranges, in frames.
+    """
+    frame_width = stream.frame_width
+    spans = [(ms_to_frame(start, stream.frame_rate), ms_to_frame(end, stream.frame_rate)) for start, end in ranges_ms]
+    index = 0
+    cursor = spans[0][0] if spans else 0  # next frame of the current span still to copy
+    position = 0
+    for block in stream.blocks():
+        if index == len(spans):
+            break
+        view = memoryview(block)
+        block_end = position + len(block) // frame_width
+        while index < len(spans) and cursor < block_end:
+            start, end = spans[index]
+            if cursor == start and index > 0:
+                writer.write_silence(gap_frames)
+            stop = min(end, block_end)
+            if stop > cursor:
+                writer.write(view[(cursor - position) * frame_width:(stop - position) * frame_width])
+            cursor = stop
+            if cursor >= end:
+                index += 1
+                if index < len(spans):
+                    cursor = spans[index][0]
+        position = block_end
+    for start, end in spans[index:]:
+        if cursor == start and index > 0:
+            writer.write_silence(gap_frames)
+        writer.write_silence(end - cursor)
+        index += 1
+        if index < len(spans):
+            cursor = spans[index][0]
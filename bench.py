@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the logger and analysis pipeline, run against fakehw.py.
+
+No ryzen_monitor, hwmon fan or mprime is needed: the sampler reads a fake
+`ryzen_monitor --test-export` and fake sysfs tree, and the analysis benchmarks
+use synthetic logs from the same RC thermal model.
+
+    sampler  samples/s, missed ticks, jitter and CPU overhead at several intervals
+    ingest   load_dataset() rows/s for CSV and .cpulog logs of several sizes
+    fit      fit_models() time for sweeps with several numbers of segments
+    audio    process_audio_refined() real-time factor for several recording lengths
+
+Results are written as JSON; with --baseline, each benchmark's score is compared
+to an earlier run and the exit status is 1 if any regressed by more than
+--tolerance. Benchmarks whose dependencies are missing are reported as skipped.
+
+    python3 bench.py --quick -o bench.json
+    python3 bench.py --only ingest,fit --baseline bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FULL_SIZES = {
+    'sampler': [0.1, 0.02, 0.01],  # sampling intervals (s)
+    'ingest': [10_000, 100_000, 1_000_000],  # log rows
+    'fit': [8, 32, 128],  # PPT steps (segments fitted)
+    'audio': [60, 600, 3600],  # recording length (s)
+}
+QUICK_SIZES = {
+    'sampler': [0.1, 0.02],
+    'ingest': [10_000, 100_000],
+    'fit': [8, 32],
+    'audio': [30, 120],
+}
+
+
+def _result(name, size, metrics, score, higher_is_better):
+    return {'name': name, 'size': size, 'metrics': metrics,
+            'score': {'metric': score, 'value': metrics[score], 'higher_is_better': higher_is_better}}
+
+
+def bench_sampler(interval_s, duration_s, workdir):
+    """Runs the real sampler against the fake exporter and sysfs for duration_s seconds."""
+    import fakehw
+    from profiler import summarize
+    from sampler import run_sampler
+    state_dir = os.path.join(workdir, f'fakehw-{interval_s}')
+    fakehw.write_state(state_dir, ppt_w=65.0, loaded=True)
+    sysfs = fakehw.FakeSysfs(os.path.join(state_dir, 'sys'))
+    sysfs.update(40.0, 1000, 0.0, 3600.0)
+    rate = max(10.0, 2.0 / interval_s)
+    read_cmd = (f'{sys.executable} {os.path.join(SCRIPT_DIR, "fakehw.py")} --state_dir {state_dir} '
+                f'--test-export --rate {rate:g}')
+    segments_file = os.path.join(workdir, 'segments.csv')
+    profile_file = os.path.join(workdir, 'profile.jsonl')
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = run_sampler(os.path.join(workdir, 'sampler.csv'), read_cmd, '25.0',
+                              duration_s=duration_s, sampling_interval_s=interval_s,
+                              fan_file=sysfs.fan_file, set_ppt='65', mprime_threads='8',
+                              segments_file=segments_file, binary_log=os.path.join(workdir, 'sampler.cpulog'),
+                              write_header=True, profile_file=profile_file,
+                              sensors='hwmon,cpufreq,rapl', sysfs_root=sysfs.root,
+                              sensors_file=os.path.join(workdir, 'sensors.csv'))
+    with open(segments_file) as f:
+        header, row = f.readline().strip().split(','), f.readline().strip().split(',')
+    segment = dict(zip(header, row))
+    _, stages = summarize(profile_file)
+    metrics = {
+        'samples': summary['samples'],
+        'samples_per_s': summary['samples'] / summary['wall_s'] if summary['wall_s'] else 0.0,
+        'missed_ticks': int(segment['Missed_Ticks']),
+        'jitter_mean_ms': float(segment['Jitter_Mean_ms']),
+        'jitter_std_ms': float(segment['Jitter_Std_ms']),
+        'jitter_max_ms': float(segment['Jitter_Max_ms']),
+        'cpu_pct': summary['overhead_pct'],
+        'sample_cost_us': sum(h.total_ns for h in stages.values()) / max(summary['samples'], 1) / 1000.0,
+    }
+    return _result('sampler', interval_s, metrics, 'sample_cost_us', False)
+
+
+def bench_ingest(rows, workdir):
+    """Times load_dataset() on a synthetic log, as CSV and as binary log."""
+    import fakehw
+    from analysis import load_dataset
+    csv_path = os.path.join(workdir, f'ingest-{rows}.csv')
+    cpulog_path = os.path.join(workdir, f'ingest-{rows}.cpulog')
+    fakehw.generate_log(csv_path, rows, binary_log=cpulog_path)
+    results = []
+    for name, path in (('ingest_csv', csv_path), ('ingest_cpulog', cpulog_path)):
+        start = time.perf_counter()
+        dataset = load_dataset(path, cache=None)
+        elapsed = time.perf_counter() - start
+        metrics = {'seconds': elapsed, 'rows_per_s': rows / elapsed, 'measurement_rows': len(dataset),
+                   'file_mb': os.path.getsize(path) / (1 << 20)}
+        results.append(_result(name, rows, metrics, 'rows_per_s', True))
+    return results
+
+
+def bench_fit(steps, workdir, n_boot=200):
+    """Times fit_models() on the steady-state segment medians of a synthetic sweep."""
+    import numpy as np
+    import fakehw
+    from analysis import load_dataset
+    from fitting import fit_models
+    path = os.path.join(workdir, f'fit-{steps}.csv')
+    ppt_values = [int(v) for v in np.linspace(30, 120, steps)]
+    # 60 s warm-up + 60 s measurement + 30 s cool-down per step at 1 Hz.
+    fakehw.generate_log(path, steps * 150, ppt_values=ppt_values)
+    x, y = load_dataset(path, cache=None).segment_fit_arrays()
+    metrics = {'points': len(x), 'n_boot': n_boot}
+    for workers in (1, None):
+        start = time.perf_counter()
+        best, _ = fit_models(x, y, n_boot=n_boot, workers=workers)
+        metrics['seconds_1_worker' if workers == 1 else 'seconds_all_workers'] = time.perf_counter() - start
+    metrics['best_model'] = best.model_name
+    return _result('fit', steps, metrics, 'seconds_all_workers', False)
+
+
+def _synthetic_speech_wav(path, duration_s, frame_rate=16000, seed=0):
+    """Noise bursts separated by silences of random length, like a recorded session."""
+    import wave
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(frame_rate)
+        written = 0
+        total = int(duration_s * frame_rate)
+        while written < total:
+            burst = int(frame_rate * rng.uniform(0.3, 4.0))
+            gap = int(frame_rate * rng.uniform(0.2, 3.0))
+            block = np.zeros(burst + gap, dtype='<i2')
+            block[:burst] = np.clip(rng.normal(0, 4000, burst), -32768, 32767)
+            block = block[:total - written]
+            w.writeframes(block.tobytes())
+            written += len(block)
+
+
+def bench_audio(duration_s, workdir):
+    """Real-time factor of process_audio_refined on a synthetic WAV recording."""
+    from process_audio import process_audio_refined
+    input_path = os.path.join(workdir, f'audio-{duration_s}.wav')
+    _synthetic_speech_wav(input_path, duration_s)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        durations = process_audio_refined(input_path, os.path.join(workdir, f'audio-{duration_s}-out.wav'))
+    elapsed = time.perf_counter() - start
+    if durations is None:
+        raise RuntimeError("process_audio_refined failed")
+    metrics = {'seconds': elapsed, 'realtime_factor': durations[0] / elapsed, 'output_s': durations[1]}
+    return _result('audio', duration_s, metrics, 'realtime_factor', True)
+
+
+def machine_info():
+    info = {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                        capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def run_benchmarks(only, sizes, sampler_duration_s=5.0):
+    """Runs the selected benchmarks. Returns the report dict."""
+    results = []
+    skipped = {}
+    with tempfile.TemporaryDirectory(prefix='cpu-bench-') as workdir:
+        for bench in only:
+            for size in sizes[bench]:
+                print(f"Running {bench} ({size})...", file=sys.stderr)
+                try:
+                    if bench == 'sampler':
+                        produced = bench_sampler(size, sampler_duration_s, workdir)
+                    elif bench == 'ingest':
+                        produced = bench_ingest(size, workdir)
+                    elif bench == 'fit':
+                        produced = bench_fit(size, workdir)
+                    else:
+                        produced = bench_audio(size, workdir)
+                except ImportError as e:
+                    skipped[bench] = f"missing dependency: {e.name or e}"
+                    print(f"  skipped: {skipped[bench]}", file=sys.stderr)
+                    break
+                results += produced if isinstance(produced, list) else [produced]
+    return {'machine': machine_info(), 'results': results, 'skipped': skipped}
+
+
+def compare(report, baseline, tolerance):
+    """Lists benchmarks whose score is more than `tolerance` (fraction) worse than the baseline's."""
+    previous = {(r['name'], r['size']): r['score'] for r in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['name'], result['size']))
+        if not before or not before['value']:
+            continue
+        ratio = result['score']['value'] / before['value']
+        if result['score']['higher_is_better']:
+            change = ratio - 1.0
+        else:
+            change = 1.0 / ratio - 1.0 if ratio else 0.0
+        result['score']['baseline'] = before['value']
+        result['score']['change'] = change
+        if change < -tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def print_report(report):
+    for result in report['results']:
+        score = result['score']
+        change = f" ({score['change']:+.1%} vs baseline)" if 'change' in score else ''
+        print(f"{result['name']:<14} {str(result['size']):>9}  {score['metric']} = {score['value']:.4g}{change}")
+    for bench, reason in report['skipped'].items():
+        print(f"{bench:<14} {'':>9}  skipped ({reason})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sampler, ingest, fitting and audio processing on synthetic data.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--only", default="sampler,ingest,fit,audio",
+                        help="Comma-separated benchmarks to run.")
+    parser.add_argument("--quick", action="store_true",
+                        help="Smaller sizes, for a fast check.")
+    parser.add_argument("--sampler_duration", type=float, default=5.0,
+                        help="Seconds each sampler benchmark logs for.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--baseline", default=None,
+                        help="Earlier JSON report to compare scores against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative score regression before failing.")
+
+    args = parser.parse_args()
+    only = [name for name in (part.strip() for part in args.only.split(',')) if name]
+    sizes = QUICK_SIZES if args.quick else FULL_SIZES
+    unknown = [name for name in only if name not in sizes]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run_benchmarks(only, sizes, args.sampler_duration)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print_report(report)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}:", file=sys.stderr)
+        for result in regressions:
+            print(f"  {result['name']} ({result['size']}): {result['score']['metric']} "
+                  f"{result['score']['baseline']:.4g} -> {result['score']['value']:.4g}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Fixed-width binary log written by sampler.py next to the CSV.
+
+Layout: a 4096-byte header (magic, then a length-prefixed JSON description)
+followed by packed little-endian records of RECORD_STRUCT. Records can be
+memory-mapped with numpy (see open_binlog) so reloading a multi-day soak test is
+a sequential read instead of a CSV parse, and `export` turns a log back into the
+exact CSV sampler.py writes.
+
+Values are stored as numbers plus the number of decimals they were printed with,
+so the CSV export reproduces the original text (e.g. '15.000'). Read errors are
+NaN plus a status bit; missing fan/thread readings are -1.
+"""
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+MAGIC = b'CPULOG1\n'
+HEADER_SIZE = 4096
+
+# name, struct code, numpy type
+RECORD_FIELDS = [
+    ('timestamp_ns', 'q', '<i8'),
+    ('power_w', 'd', '<f8'),
+    ('temp_c', 'd', '<f8'),
+    ('ambient_c', 'd', '<f8'),
+    ('set_ppt_w', 'd', '<f8'),
+    ('fan_rpm', 'i', '<i4'),
+    ('mprime_threads', 'i', '<i4'),
+    ('segment', 'i', '<i4'),
+    ('phase', 'B', 'u1'),
+    ('status', 'B', 'u1'),
+    ('power_dp', 'B', 'u1'),
+    ('temp_dp', 'B', 'u1'),
+    ('ambient_dp', 'B', 'u1'),
+    ('set_ppt_dp', 'B', 'u1'),
+]
+RECORD_STRUCT = struct.Struct('<' + ''.join(code for _, code, _ in RECORD_FIELDS))
+# The same record split into the timestamp and everything after it (no padding with '<').
+_TIMESTAMP_STRUCT = struct.Struct('<' + RECORD_FIELDS[0][1])
+_BODY_STRUCT = struct.Struct('<' + ''.join(code for _, code, _ in RECORD_FIELDS[1:]))
+
+STATUS_TEMP_READ_ERR = 1
+STATUS_POWER_READ_ERR = 2
+STATUS_RM_START_FAIL = 4
+
+
+def split_decimal(text):
+    """Returns (value, decimals) for a numeric string, or (nan, 0) for N/A and error markers."""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return math.nan, 0
+    _, dot, decimals = text.partition('.')
+    return value, len(decimals) if dot else 0
+
+
+def format_decimal(value, decimals, missing='N/A'):
+    if math.isnan(value):
+        return missing
+    return f'{value:.{decimals}f}'
+
+
+class BinaryLogWriter:
+    """
+    Buffered appender for the binary log.
+
+    Records are packed into an in-memory buffer and written in large sequential
+    chunks; flush() pushes them to the OS and fsyncs at most every
+    fsync_interval_s seconds (0 = on every flush, None = leave it to the OS).
+    """
+
+    def __init__(self, path, csv_header, interval_s, has_fan, has_set_ppt, has_mprime_threads,
+                 buffer_records=4096, fsync_interval_s=10.0):
+        self.path = path
+        self.buffer_records = buffer_records
+        self.fsync_interval_s = fsync_interval_s
+        self.header = {
+            'format': 1,
+            'record_fields': [[name, np_type] for name, _, np_type in RECORD_FIELDS],
+            'record_size': RECORD_STRUCT.size,
+            'csv_header': csv_header,
+            'interval_s': interval_s,
+            'has_fan': has_fan,
+            'has_set_ppt': has_set_ppt,
+            'has_mprime_threads': has_mprime_threads,
+            'phases': [],
+        }
+        self._phase_codes = {}
+        self._last_key = None
+        self._last_body = b''
+        self._buffer = bytearray()
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._write_header()
+        os.lseek(self._fd, HEADER_SIZE, os.SEEK_SET)
+
+    def _write_header(self):
+        payload = json.dumps(self.header).encode()
+        block = MAGIC + struct.pack('<I', len(payload)) + payload
+        if len(block) > HEADER_SIZE:
+            raise ValueError("binary log header does not fit in its reserved block (too many phases?)")
+        os.pwrite(self._fd, block.ljust(HEADER_SIZE, b'\0'), 0)
+
+    def phase_code(self, phase):
+        code = self._phase_codes.get(phase)
+        if code is None:
+            # New phase names are rare (one per segment type), so the header is rewritten in place.
+            code = len(self.header['phases'])
+            self.header['phases'].append(phase)
+            self._phase_codes[phase] = code
+            self._write_header()
+        return code
+
+    def append(self, timestamp_s, power_text, temp_text, fan_text, ambient_text,
+               set_ppt_text, mprime_threads_text, segment, phase):
+        """Appends one sample, given as the same strings that go into the CSV row."""
+        key = (power_text, temp_text, fan_text, ambient_text, set_ppt_text, mprime_threads_text, segment, phase)
+        if key != self._last_key:
+            self._last_body = self._pack_body(power_text, temp_text, fan_text, ambient_text,
+                                              set_ppt_text, mprime_threads_text, segment, phase)
+            self._last_key = key
+        # Sampling faster than the reader updates repeats the same values; only the timestamp is packed again.
+        self._buffer += _TIMESTAMP_STRUCT.pack(int(round(timestamp_s * 1e9)))
+        self._buffer += self._last_body
+        self._pending += 1
+        if self._pending >= self.buffer_records:
+            self.flush()
+
+    def _pack_body(self, power_text, temp_text, fan_text, ambient_text,
+                   set_ppt_text, mprime_threads_text, segment, phase):
+        power, power_dp = split_decimal(power_text)
+        temp, temp_dp = split_decimal(temp_text)
+        if power_text == 'RMStartFail':
+            status = STATUS_RM_START_FAIL
+        else:
+            status = (STATUS_POWER_READ_ERR if math.isnan(power) else 0) | \
+                     (STATUS_TEMP_READ_ERR if math.isnan(temp) else 0)
+        ambient, ambient_dp = split_decimal(ambient_text)
+        set_ppt, set_ppt_dp = split_decimal(set_ppt_text)
+        fan = int(fan_text) if fan_text.isdigit() else -1
+        threads = int(mprime_threads_text) if mprime_threads_text.isdigit() else -1
+        return _BODY_STRUCT.pack(
+            power, temp, ambient, set_ppt,
+            fan, threads, segment, self.phase_code(phase), status,
+            power_dp, temp_dp, ambient_dp, set_ppt_dp)
+
+    def flush(self):
+        if self._buffer:
+            os.write(self._fd, self._buffer)
+            self._buffer.clear()
+            self._pending = 0
+        if self.fsync_interval_s is not None and time.monotonic() - self._last_fsync >= self.fsync_interval_s:
+            os.fsync(self._fd)
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self._fd is None:
+            return
+        self.flush()
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        block = f.read(HEADER_SIZE)
+    if not block.startswith(MAGIC):
+        raise ValueError(f"'{path}' is not a sampler binary log")
+    (length,) = struct.unpack_from('<I', block, len(MAGIC))
+    start = len(MAGIC) + 4
+    return json.loads(block[start:start + length])
+
+
+def record_count(path, header=None):
+    header = header or read_header(path)
+    # A trailing partial record (logger killed mid-write) is ignored.
+    return (os.path.getsize(path) - HEADER_SIZE) // header['record_size']
+
+
+def open_binlog(path):
+    """
+    Memory-maps a binary log.
+
+    Returns:
+        tuple: (header dict, numpy structured memmap with one element per record).
+    """
+    import numpy as np
+    header = read_header(path)
+    dtype = np.dtype([(name, np_type) for name, np_type in header['record_fields']])
+    count = record_count(path, header)
+    if count == 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def iter_records(path, chunk_records=65536):
+    """Yields records as tuples (RECORD_FIELDS order) without needing numpy."""
+    header = read_header(path)
+    size = header['record_size']
+    remaining = record_count(path, header)
+    with open(path, 'rb') as f:
+        f.seek(HEADER_SIZE)
+        while remaining > 0:
+            n = min(remaining, chunk_records)
+            yield from RECORD_STRUCT.iter_unpack(f.read(n * size))
+            remaining -= n
+
+
+def export_csv(path, csv_path):
+    """Writes the binary log back out as the CSV sampler.py would have produced. Returns the row count."""
+    from sampler import TimestampFormatter
+    header = read_header(path)
+    phases = header['phases']
+    format_timestamp = TimestampFormatter()
+    rows = 0
+    with open(csv_path, 'w', buffering=1 << 20) as out:
+        out.write(header['csv_header'] + '\n')
+        for (ts_ns, power, temp, ambient, set_ppt, fan, threads, segment, phase, status,
+             power_dp, temp_dp, ambient_dp, set_ppt_dp) in iter_records(path):
+            if status & STATUS_RM_START_FAIL:
+                power_text = temp_text = 'RMStartFail'
+            else:
+                power_text = format_decimal(power, power_dp, 'ReadErrRMPpt')
+                temp_text = format_decimal(temp, temp_dp, 'ReadErrRMThm')
+            row = f'{format_timestamp(ts_ns / 1e9)},{power_text},{temp_text}'
+            if header['has_fan']:
+                row += f',{fan}' if fan >= 0 else ',N/A'
+            row += f',{format_decimal(ambient, ambient_dp)}'
+            if header['has_set_ppt']:
+                row += f',{format_decimal(set_ppt, set_ppt_dp)}'
+            if header['has_mprime_threads']:
+                row += f',{threads}' if threads >= 0 else ',N/A'
+            out.write(f'{row},{segment},{phases[phase]}\n')
+            rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect or export sampler.py binary logs.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="Print the header and record count.")
+    info_parser.add_argument("log_file", help="Binary log (.cpulog).")
+    export_parser = subparsers.add_parser("export", help="Export to the sampler's CSV format.")
+    export_parser.add_argument("log_file", help="Binary log (.cpulog).")
+    export_parser.add_argument("csv_file", help="CSV file to write.")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "info":
+            header = read_header(args.log_file)
+            print(json.dumps(header, indent=2))
+            print(f"Records: {record_count(args.log_file, header)}")
+        else:
+            rows = export_csv(args.log_file, args.csv_file)
+            print(f"Exported {rows} rows to {args.csv_file}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Content-hashed on-disk cache for the analysis scripts (data.py, fit.py).
+
+Entries are keyed on the SHA-256 of the input log plus the analysis parameters,
+so re-running on an unchanged log reuses the derived dataset, fit results and
+rendered plots instead of recomputing them. The cache is bounded in size and
+evicts least-recently-used entries.
+
+Environment:
+    ANALYSIS_CACHE_DIR     cache directory (default: .analysis_cache)
+    ANALYSIS_CACHE_MAX_MB  size bound in MiB (default: 256)
+    ANALYSIS_CACHE=0       disable caching
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = ".analysis_cache"
+DEFAULT_MAX_MB = 256
+_DIGEST_INDEX = "file_digests.json"
+
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class AnalysisCache:
+    """LRU-evicted cache of pickled objects and files under one directory."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB << 20):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, 'entries'), exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Returns the cache configured by the environment, or None if caching is disabled."""
+        if os.environ.get('ANALYSIS_CACHE', '1') == '0':
+            return None
+        root = os.environ.get('ANALYSIS_CACHE_DIR', DEFAULT_CACHE_DIR)
+        max_mb = float(os.environ.get('ANALYSIS_CACHE_MAX_MB', DEFAULT_MAX_MB))
+        return cls(root, int(max_mb * (1 << 20)))
+
+    def file_digest(self, path):
+        """
+        SHA-256 of a file's contents.
+
+        Digests are remembered per (path, size, mtime) so an unchanged multi-GB
+        log is not re-hashed on every run.
+        """
+        st = os.stat(path)
+        index_path = os.path.join(self.root, _DIGEST_INDEX)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = index.get(os.path.abspath(path))
+        if entry and entry['stamp'] == stamp:
+            return entry['sha256']
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        index[os.path.abspath(path)] = {'stamp': stamp, 'sha256': h.hexdigest()}
+        _atomic_write(index_path, json.dumps(index).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def key(*parts):
+        """Builds a cache key from JSON-serialisable parts (file digests, parameters, versions)."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key, name):
+        return os.path.join(self.root, 'entries', f'{key}-{name}')
+
+    def _hit(self, path):
+        if not os.path.exists(path):
+            return False
+        os.utime(path)  # mark as recently used for eviction
+        return True
+
+    def get(self, key, default=None):
+        path = self._path(key, 'obj.pkl')
+        if not self._hit(path):
+            return default
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return default
+
+    def put(self, key, value):
+        _atomic_write(self._path(key, 'obj.pkl'), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def get_file(self, key, dest_path):
+        """Copies a cached file to dest_path. Returns False on a miss."""
+        path = self._path(key, os.path.basename(dest_path))
+        if not self._hit(path):
+            return False
+        shutil.copyfile(path, dest_path)
+        return True
+
+    def put_file(self, key, src_path):
+        with open(src_path, 'rb') as f:
+            _atomic_write(self._path(key, os.path.basename(src_path)), f.read())
+        self.evict()
+
+    def evict(self):
+        """Deletes least-recently-used entries until the cache fits in max_bytes."""
+        entries_dir = os.path.join(self.root, 'entries')
+        entries = []
+        total = 0
+        for entry in os.scandir(entries_dir):
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
+
+
+def cached_output(cache, key, filename, render):
+    """
+    Produces output file `filename` (a plot or export), reusing a cached copy when possible.
+
+    Args:
+        cache (AnalysisCache): Cache to use, or None to always render.
+        key (str): Key of the data and parameters the output depends on.
+        filename (str): Output file path.
+        render (callable): Writes `filename` from scratch.
+
+    Returns:
+        bool: True if the file came from the cache.
+    """
+    if cache is not None and cache.get_file(key, filename):
+        return True
+    render()
+    if cache is not None:
+        cache.put_file(key, filename)
+    return False
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Closed-loop PPT control for sampler.py.
+
+Instead of stepping through fixed PPT values, the controller adjusts the PPT
+limit from the live temperature readings, either to hold CPU_Temp_C at a
+target or to run as close under a ceiling as the cooler allows (the most
+sustained power within a thermal budget). Control algorithms are registered by
+name in CONTROL_ALGORITHMS:
+
+    pi   PI controller, bumpless from the current PPT, with conditional
+         integration (no wind-up past the PPT limits, or upwards while the load
+         draws less than the limit)
+    mpc  one-pole model-predictive controller: R_th is re-estimated online by
+         recursive least squares with forgetting, and each update picks the PPT
+         that brings the predicted temperature to the set-point after the horizon
+
+In ceiling mode the set-point is the ceiling minus a margin, and a reading over
+the ceiling cuts PPT straight away instead of waiting for the next update.
+Set commands are rate limited (one update per control interval, a command only
+when PPT moves by at least min_step_w, by at most max_slew_w, at most one per
+MIN_COMMAND_GAP_S and never two in flight) and run without blocking the sampling loop. Every update is logged to a
+sidecar CSV next to the samples:
+
+    Timestamp,Segment,Temp_C,Setpoint_C,Error_C,Power_W,PPT_Request_W,Set_PPT_W,Action
+
+Dry run against fakehw.py:
+
+    python3 sampler.py log.csv --ambient_temp 25 --set_ppt N/A --phase control \\
+        --read_cmd "python3 fakehw.py --test-export --time_scale 10" \\
+        --control_target 70 --ppt_set_cmd "python3 fakehw.py --set-ppt=" --control_log log_control.csv
+"""
+import math
+import subprocess
+
+CONTROL_LOG_HEADER = 'Timestamp,Segment,Temp_C,Setpoint_C,Error_C,Power_W,PPT_Request_W,Set_PPT_W,Action'
+# A set command is never issued sooner than this after the previous one, even to cut PPT over the ceiling.
+MIN_COMMAND_GAP_S = 1.0
+# Measured power this far under the PPT limit means the load, not the limit, sets the power.
+LOAD_LIMITED_MARGIN_W = 3.0
+
+
+def _number(text):
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class PIController:
+    """PI law on the temperature error, in W per °C (kp) and W per °C·s (ki)."""
+
+    def __init__(self, kp=2.0, ki=0.05):
+        self.kp = kp
+        self.ki = ki
+        self.integral_w = None
+
+    def reset(self, ppt_w):
+        """Restarts the integrator from `ppt_w` (bumpless after an override)."""
+        self.integral_w = ppt_w
+
+    def update(self, temp_c, setpoint_c, dt_s, power_w, ambient_c, ppt_w, ppt_min_w, ppt_max_w):
+        if self.integral_w is None:
+            self.reset(ppt_w)
+        error = setpoint_c - temp_c
+        proportional = self.kp * error
+        candidate = self.integral_w + self.ki * error * dt_s
+        load_limited = power_w is not None and power_w < ppt_w - LOAD_LIMITED_MARGIN_W
+        if error > 0 and (candidate + proportional > ppt_max_w or load_limited):
+            pass
+        elif error < 0 and candidate + proportional < ppt_min_w:
+            pass
+        else:
+            self.integral_w = candidate
+        self.integral_w = min(ppt_max_w, max(ppt_min_w, self.integral_w))
+        return self.integral_w + proportional
+
+
+class PredictiveController:
+    """
+    One-pole model-predictive law: T = T_amb + x, tau * dx/dt = R * P - x.
+
+    R is tracked online from (rise, power) pairs by scalar recursive least
+    squares with exponential forgetting, starting from r_init_c_per_w; the
+    requested PPT puts the predicted rise at the set-point `horizon_s` ahead.
+    """
+
+    def __init__(self, tau_s=40.0, horizon_s=30.0, r_init_c_per_w=0.5, forgetting=0.98, prior_weight=10.0):
+        self.tau_s = tau_s
+        self.horizon_s = horizon_s
+        self.forgetting = forgetting
+        self.r_c_per_w = r_init_c_per_w
+        self._s_phi_phi = prior_weight
+        self._s_phi_y = prior_weight * r_init_c_per_w
+        self._last_rise = None
+
+    def reset(self, ppt_w):
+        pass
+
+    def update(self, temp_c, setpoint_c, dt_s, power_w, ambient_c, ppt_w, ppt_min_w, ppt_max_w):
+        if ambient_c is None:
+            return ppt_w
+        rise = temp_c - ambient_c
+        power = ppt_w if power_w is None else power_w
+        decay = math.exp(-dt_s / self.tau_s)
+        if self._last_rise is not None:
+            phi = (1.0 - decay) * power
+            y = rise - decay * self._last_rise
+            self._s_phi_phi = self.forgetting * self._s_phi_phi + phi * phi
+            self._s_phi_y = self.forgetting * self._s_phi_y + phi * y
+            if self._s_phi_y > 0:
+                self.r_c_per_w = self._s_phi_y / self._s_phi_phi
+        self._last_rise = rise
+        horizon_decay = math.exp(-self.horizon_s / self.tau_s)
+        return (setpoint_c - ambient_c - rise * horizon_decay) / (self.r_c_per_w * (1.0 - horizon_decay))
+
+
+CONTROL_ALGORITHMS = {
+    'pi': PIController,
+    'mpc': PredictiveController,
+}
+
+
+class PPTController:
+    """
+    Drives the PPT limit from the samples of a running sampler.
+
+    Call update() once per sample; it returns True when a set command has
+    completed and set_ppt_label changed. Commands run in the background (the
+    one-shot `ryzen_monitor --set-ppt=N` style command emu.sh uses) and a
+    failed one leaves the previous PPT in place.
+    """
+
+    def __init__(self, set_command, setpoint_c, mode='target', algorithm='pi',
+                 ppt_min_w=15.0, ppt_max_w=88.0, initial_ppt_w=None, interval_s=5.0,
+                 min_step_w=1.0, max_slew_w=10.0, ceiling_margin_c=2.0, log_file=None,
+                 algorithm_options=None):
+        """
+        Args:
+            set_command (str): Shell command prefix the PPT (W) is appended to (e.g. 'ryzen_monitor --set-ppt=').
+            setpoint_c (float): Target temperature, or the ceiling in 'ceiling' mode.
+            mode (str): 'target' (hold the temperature) or 'ceiling' (stay under it).
+            algorithm (str): Name in CONTROL_ALGORITHMS.
+            ppt_min_w (float): Lowest PPT ever requested.
+            ppt_max_w (float): Highest PPT ever requested.
+            initial_ppt_w (float): PPT set on the first sample; None starts at ppt_min_w.
+            interval_s (float): Time between controller updates.
+            min_step_w (float): Smallest PPT change worth a set command; PPT is requested in whole multiples of it.
+            max_slew_w (float): Largest PPT change per command.
+            ceiling_margin_c (float): How far under the ceiling the set-point sits in 'ceiling' mode.
+            log_file (str): Sidecar CSV receiving one row per update (see CONTROL_LOG_HEADER).
+            algorithm_options (dict): Keyword arguments for the algorithm (e.g. kp, ki or tau_s, horizon_s).
+
+        Raises:
+            ValueError: On an unknown mode or algorithm, or inconsistent limits.
+        """
+        if mode not in ('target', 'ceiling'):
+            raise ValueError(f"mode must be 'target' or 'ceiling', got '{mode}'")
+        if algorithm not in CONTROL_ALGORITHMS:
+            raise ValueError(f"unknown control algorithm '{algorithm}' (known: {', '.join(CONTROL_ALGORITHMS)})")
+        if not 0 < ppt_min_w <= ppt_max_w:
+            raise ValueError(f"PPT limits must satisfy 0 < min <= max, got {ppt_min_w:g}..{ppt_max_w:g} W")
+        self.set_command = set_command
+        self.mode = mode
+        self.ceiling_c = setpoint_c if mode == 'ceiling' else None
+        self.setpoint_c = setpoint_c - ceiling_margin_c if mode == 'ceiling' else setpoint_c
+        self.algorithm = CONTROL_ALGORITHMS[algorithm](**(algorithm_options or {}))
+        self.ppt_min_w = ppt_min_w
+        self.ppt_max_w = ppt_max_w
+        self.interval_s = interval_s
+        self.min_step_w = min_step_w
+        self.max_slew_w = max_slew_w
+        self.applied_w = None
+        self.requested_w = self._quantize(ppt_min_w if initial_ppt_w is None else initial_ppt_w)
+        self.commands = 0
+        self.failures = 0
+        self._process = None
+        self._pending_w = None
+        self._last_update_ts = None
+        self._last_command_ts = None
+        self._out = None
+        if log_file:
+            self._out = open(log_file, 'w', buffering=1 << 16)
+            self._out.write(CONTROL_LOG_HEADER + '\n')
+
+    @property
+    def set_ppt_label(self):
+        """The PPT in force, as logged in Set_PPT_W."""
+        return 'N/A' if self.applied_w is None else f'{self.applied_w:g}'
+
+    def _quantize(self, ppt_w):
+        step = self.min_step_w if self.min_step_w > 0 else 1.0
+        return min(self.ppt_max_w, max(self.ppt_min_w, round(ppt_w / step) * step))
+
+    def _reap(self):
+        """Collects a finished set command. Returns (changed, failed)."""
+        if self._process is None or self._process.poll() is None:
+            return False, False
+        ok = self._process.returncode == 0
+        self._process = None
+        if not ok:
+            self.failures += 1
+            self.requested_w = self.applied_w if self.applied_w is not None else self.requested_w
+            return False, True
+        changed = self._pending_w != self.applied_w
+        self.applied_w = self._pending_w
+        return changed, False
+
+    def _send(self, ppt_w, ts):
+        self._process = subprocess.Popen(f'{self.set_command}{ppt_w:g}', shell=True,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._pending_w = ppt_w
+        self._last_command_ts = ts
+        self.requested_w = ppt_w
+        self.commands += 1
+
+    def update(self, ts, timestamp_text, segment, temp_text, power_text, ambient_text):
+        """
+        Feeds one sample (as logged) to the controller.
+
+        Args:
+            ts (float): Sample time (s); only differences are used.
+            timestamp_text (str): Timestamp as logged, for the control log.
+            segment (int): Segment the sample belongs to.
+            temp_text (str): Controlled temperature; read-error markers hold the PPT.
+            power_text (str): Measured package power.
+            ambient_text (str): Ambient temperature (used by 'mpc').
+
+        Returns:
+            bool: True if a set command completed and the PPT in force changed.
+        """
+        changed, failed = self._reap()
+        temp_c = _number(temp_text)
+        over_ceiling = self.ceiling_c is not None and temp_c is not None and temp_c > self.ceiling_c
+        first = self._last_update_ts is None
+        if failed:
+            self._log(timestamp_text, segment, temp_c, _number(power_text), self.requested_w, 'failed')
+        if not first and ts - self._last_update_ts < self.interval_s and not (
+                over_ceiling and self._process is None and ts - self._last_command_ts >= MIN_COMMAND_GAP_S):
+            return changed
+        dt_s = self.interval_s if first else ts - self._last_update_ts
+        self._last_update_ts = ts
+        power_w = _number(power_text)
+        if first:
+            self.algorithm.reset(self.requested_w)
+            self._send(self.requested_w, ts)
+            self._log(timestamp_text, segment, temp_c, power_w, self.requested_w, 'set')
+            return changed
+        if temp_c is None:
+            self._log(timestamp_text, segment, temp_c, power_w, self.requested_w, 'no_reading')
+            return changed
+        if over_ceiling:
+            request = self._quantize(self.requested_w - self.max_slew_w)
+            action = 'cut'
+        else:
+            raw = self.algorithm.update(temp_c, self.setpoint_c, dt_s, power_w, _number(ambient_text),
+                                        self.requested_w, self.ppt_min_w, self.ppt_max_w)
+            raw = min(self.requested_w + self.max_slew_w, max(self.requested_w - self.max_slew_w, raw))
+            request = self._quantize(raw)
+            action = 'set'
+        if self._process is not None:
+            action = 'busy'
+        elif ts - self._last_command_ts < MIN_COMMAND_GAP_S:
+            action = 'rate_limited'
+        elif request == self.requested_w:
+            action = 'hold'
+        else:
+            self._send(request, ts)
+            if over_ceiling:
+                self.algorithm.reset(request)
+        self._log(timestamp_text, segment, temp_c, power_w, request, action)
+        return changed
+
+    def _log(self, timestamp_text, segment, temp_c, power_w, request_w, action):
+        if self._out is None:
+            return
+        temp = 'N/A' if temp_c is None else f'{temp_c:.2f}'
+        error = 'N/A' if temp_c is None else f'{self.setpoint_c - temp_c:.2f}'
+        power = 'N/A' if power_w is None else f'{power_w:.2f}'
+        self._out.write(f'{timestamp_text},{segment},{temp},{self.setpoint_c:.2f},{error},{power},'
+                        f'{request_w:g},{self.set_ppt_label},{action}\n')
+
+    def flush(self):
+        if self._out is not None:
+            self._out.flush()
+
+    def close(self, timeout_s=5.0):
+        """Waits for a set command still in flight and closes the control log."""
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=timeout_s)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._reap()
+        if self._out is not None and not self._out.closed:
+            self._out.close()
+
+
+def add_controller_args(parser):
+    """Adds the closed-loop control options to an argparse parser (see controller_from_args)."""
+    group = parser.add_argument_group("closed-loop PPT control (see controller.py)")
+    target = group.add_mutually_exclusive_group()
+    target.add_argument("--control_target", type=float, default=None,
+                        help="Hold the controlled temperature (°C) at this value by adjusting PPT.")
+    target.add_argument("--control_ceiling", type=float, default=None,
+                        help="Keep the controlled temperature (°C) under this ceiling at the highest PPT possible.")
+    group.add_argument("--ppt_set_cmd", default=None,
+                       help="Command prefix the PPT (W) is appended to, e.g. 'ryzen_monitor --set-ppt='.")
+    group.add_argument("--control_algorithm", choices=sorted(CONTROL_ALGORITHMS), default="pi",
+                       help="Control law.")
+    group.add_argument("--ppt_min", type=float, default=15.0,
+                       help="Lowest PPT (W) the controller requests.")
+    group.add_argument("--ppt_max", type=float, default=88.0,
+                       help="Highest PPT (W) the controller requests.")
+    group.add_argument("--ppt_initial", type=float, default=None,
+                       help="PPT (W) set when control starts (default: --ppt_min).")
+    group.add_argument("--control_interval", type=float, default=5.0,
+                       help="Seconds between controller updates (and at most one set command each).")
+    group.add_argument("--ppt_step", type=float, default=1.0,
+                       help="PPT resolution (W); smaller changes are not sent.")
+    group.add_argument("--ppt_slew", type=float, default=10.0,
+                       help="Largest PPT change (W) per set command.")
+    group.add_argument("--ceiling_margin", type=float, default=2.0,
+                       help="Set-point distance (°C) below --control_ceiling.")
+    group.add_argument("--pi_gains", default="2.0,0.05",
+                       help="PI gains 'kp,ki' in W/°C and W/(°C·s).")
+    group.add_argument("--mpc_model", default="40,30,0.5",
+                       help="Predictive model 'tau_s,horizon_s,initial_R_C_per_W' (tau from transient.py).")
+    group.add_argument("--control_log", default=None,
+                       help="Sidecar CSV with one row per controller update.")
+
+
+def controller_from_args(args):
+    """
+    Builds a PPTController from add_controller_args() options.
+
+    Returns:
+        PPTController or None: None when neither --control_target nor --control_ceiling is given.
+
+    Raises:
+        ValueError: On missing or malformed options.
+    """
+    if args.control_target is None and args.control_ceiling is None:
+        return None
+    if not args.ppt_set_cmd:
+        raise ValueError("--ppt_set_cmd is required for closed-loop control")
+    if args.control_interval <= 0:
+        raise ValueError("--control_interval must be positive")
+    try:
+        if args.control_algorithm == 'pi':
+            kp, ki = (float(v) for v in args.pi_gains.split(','))
+            options = {'kp': kp, 'ki': ki}
+        else:
+            tau_s, horizon_s, r_init = (float(v) for v in args.mpc_model.split(','))
+            options = {'tau_s': tau_s, 'horizon_s': horizon_s, 'r_init_c_per_w': r_init}
+    except ValueError:
+        raise ValueError(f"malformed gains/model for '{args.control_algorithm}'") from None
+    ceiling = args.control_ceiling is not None
+    return PPTController(args.ppt_set_cmd, args.control_ceiling if ceiling else args.control_target,
+                         mode='ceiling' if ceiling else 'target', algorithm=args.control_algorithm,
+                         ppt_min_w=args.ppt_min, ppt_max_w=args.ppt_max, initial_ppt_w=args.ppt_initial,
+                         interval_s=args.control_interval, min_step_w=args.ppt_step, max_slew_w=args.ppt_slew,
+                         ceiling_margin_c=args.ceiling_margin, log_file=args.control_log,
+                         algorithm_options=options)
@@ -3,215 +3,252 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Load the dataset
-file_path = "cpu_cooling_data_controlled.csv"
-df = pd.read_csv(file_path)
-
-# 1. Clean column names
-df.columns = df.columns.str.strip()
-
-# Identify relevant columns for calculation
-t_case_col = 'CPU_Temp_C'
-t_ambient_col = 'Ambient_Temp_C'
-p_cpu_col = 'CPU_Power_W_Actual'
-fan_rpm_col = 'CPU_Fan_RPM'
+from analysis import (load_dataset, DEFAULT_LOG_FILE, PROCESSED_CSV_FILE, ANALYSIS_VERSION, COL_TIMESTAMP,
+                      COL_ACTUAL_PPT, COL_SET_PPT, COL_CPU_TEMP, COL_FAN_RPM, COL_AMBIENT_TEMP, COL_RTH)
+from cache import AnalysisCache, cached_output
+from plotstore import update_store
+
+# Bump when the plotting code below changes so cached plots are redrawn.
+PLOT_VERSION = 2
+# Upper bounds on what the store-backed plots draw, however long the log is.
+TIMELINE_MAX_BUCKETS = 2000
+HEXBIN_GRIDSIZE = 60
+HISTOGRAM_MAX_BINS = 60
+
+# Load the dataset once; analysis.py strips column names, keeps only measurement-phase rows
+# of sampler.py logs and derives R_th = (T_case - T_ambient) / P_cpu (NaN below 1 W).
+# Re-running on an unchanged log reuses the dataset, export and plots from .analysis_cache/.
+file_path = DEFAULT_LOG_FILE
+cache = AnalysisCache.from_env()
+try:
+    dataset = load_dataset(file_path, power_threshold_w=1.0, cache=cache)
+except FileNotFoundError:
+    print(f"Fatal Error: The specified data file '{file_path}' was not found.")
+    raise
+df = dataset.df
+print(f"Successfully loaded '{file_path}' ({len(df)} measurement rows).")
+if dataset.dropped_non_measurement_rows:
+    print(f"Info: Skipped {dataset.dropped_non_measurement_rows} warm-up/cool-down/idle rows.")
 
+# Check the distribution of CPU Package Power; rows below the threshold get NaN thermal resistance.
+print("\nCPU Package Power (W) description:")
+print(df[COL_ACTUAL_PPT].describe())
+if dataset.low_power_rows:
+    print(f"Info: {dataset.low_power_rows} rows have '{COL_ACTUAL_PPT}' < {dataset.power_threshold_w}W. Rth will be NaN for these.")
 
+print("\nThermal Resistance column description:")
+print(df[COL_RTH].describe())
+print(f"Number of NaNs in Thermal Resistance: {df[COL_RTH].isnull().sum()}")
 
-# 2. Handle potential division by zero or very small power values for P_cpu
-# If CPU Package Power is very low or zero, thermal resistance calculation can be problematic.
-# Let's check the distribution of CPU Package Power.
-print("\nCPU Package Power (W) description:")
-print(df[p_cpu_col].describe())
+# Steady-state detection: how much of each (Set PPT, threads) segment had settled temperatures.
+segment_summary = dataset.segment_summary()
+steady_rows = int(segment_summary['Steady_Samples'].sum())
+print(f"\nSteady-state rows: {steady_rows} of {len(df)} ({steady_rows / max(len(df), 1):.1%}), "
+      f"{int(segment_summary['Usable'].sum())} of {len(segment_summary)} segments usable.")
+print(segment_summary.drop(columns=['Usable']).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
 
-# We should filter out rows where CPU Package Power is <= 0 to avoid division by zero or meaningless results.
-# However, the min value is 65W, so division by zero is not an issue here.
+# For the analysis, we'll use the fan RPM and the thermal resistance.
+df_analysis = dataset.rpm_rth()
 
-# 3. Recalculate Thermal Resistance
-# R_th = (T_case - T_ambient) / P_cpu
-df['Thermal_Resistance_Recalculated'] = (df[t_case_col] - df[t_ambient_col]) / df[p_cpu_col]
+# The overview plots (timeline, Temp vs Power/RPM, distributions) draw from the downsampled store kept next
+# to the log (plotstore.py) instead of every raw row; only rows appended since the last run are folded in.
+store, store_added = update_store(file_path)
+print(f"\nPlot store: {store.rows} rows ({store_added} new since the last update).")
 
-# Compare recalculated with original (if needed, but we will use the recalculated one for consistency)
-print("\nRecalculated Thermal Resistance column description:")
-print(df['Thermal_Resistance_Recalculated'].describe())
-print(f"Number of NaNs in Recalculated Thermal Resistance: {df['Thermal_Resistance_Recalculated'].isnull().sum()}")
 
+def output_key(name):
+    """Cache key of an output file derived from this dataset."""
+    return AnalysisCache.key('data.py', name, PLOT_VERSION, ANALYSIS_VERSION, dataset.cache_key)
 
-# Check if there are any infinite values in the recalculated column due to P_cpu being zero (already checked it's not an issue)
-if np.isinf(df['Thermal_Resistance_Recalculated']).any():
-    print("\nWarning: Infinite values found in recalculated thermal resistance. This might be due to CPU Power being zero.")
-    # df = df[~np.isinf(df['Thermal_Resistance_Recalculated'])] # Optionally remove them
 
-# For the analysis, we'll use the fan RPM and the recalculated thermal resistance.
-# Let's remove rows where recalculated thermal resistance might be NaN (if any inputs were NaN, though not the case here)
-df_analysis = df[[fan_rpm_col, 'Thermal_Resistance_Recalculated']].copy()
-df_analysis.dropna(subset=['Thermal_Resistance_Recalculated'], inplace=True)
+# Analyze the relationship
+def plot_rth_vs_rpm():
+    plt.figure(figsize=(10, 6))
+    sns.scatterplot(data=df_analysis, x=COL_FAN_RPM, y=COL_RTH, alpha=0.6)
+    # Add a trend line (regression line)
+    sns.regplot(data=df_analysis, x=COL_FAN_RPM, y=COL_RTH, scatter=False, color='red')
 
+    plt.title('Thermal Resistance vs. CPU Fan RPM')
+    plt.xlabel('CPU Fan RPM (RPM)')
+    plt.ylabel('Thermal Resistance (°C/W)')
+    plt.grid(True)
+    plt.tight_layout() # Ensure labels are not cut off
+    plt.savefig("thermal_resistance_vs_fan_rpm.png") # Save the plot
+    # plt.show() # Display the plot - not needed if saving
 
-# 4. Analyze the relationship
-plt.figure(figsize=(10, 6))
-sns.scatterplot(data=df_analysis, x=fan_rpm_col, y='Thermal_Resistance_Recalculated', alpha=0.6)
-# Add a trend line (regression line)
-sns.regplot(data=df_analysis, x=fan_rpm_col, y='Thermal_Resistance_Recalculated', scatter=False, color='red')
 
-plt.title('Thermal Resistance vs. CPU Fan RPM')
-plt.xlabel('CPU Fan RPM (RPM)')
-plt.ylabel('Recalculated Thermal Resistance (°C/W)')
-plt.grid(True)
-plt.tight_layout() # Ensure labels are not cut off
-plt.savefig("thermal_resistance_vs_fan_rpm.png") # Save the plot
-# plt.show() # Display the plot - not needed if saving
+cached_output(cache, output_key("thermal_resistance_vs_fan_rpm.png"), "thermal_resistance_vs_fan_rpm.png", plot_rth_vs_rpm)
 
 # Calculate the Pearson correlation coefficient
-correlation = df_analysis[fan_rpm_col].corr(df_analysis['Thermal_Resistance_Recalculated'])
-print(f"\nCorrelation between {fan_rpm_col} and Recalculated Thermal Resistance: {correlation:.4f}")
+correlation = df_analysis[COL_FAN_RPM].corr(df_analysis[COL_RTH])
+print(f"\nCorrelation between {COL_FAN_RPM} and Thermal Resistance: {correlation:.4f}")
 
-# Output the cleaned and processed data with recalculated thermal resistance
-df.to_csv("cpu_cooling_data_processed.csv", index=False)
+# Export the processed data once for the HTML report (index.html); nothing here reads it back.
+cached_output(cache, output_key(PROCESSED_CSV_FILE), PROCESSED_CSV_FILE,
+              lambda: df.to_csv(PROCESSED_CSV_FILE, index=False))
 
 print("\nAnalysis complete. Plot saved as thermal_resistance_vs_fan_rpm.png")
-print("Processed data saved as cpu_cooling_data_processed.csv")
-
-# Define column names that the plotting functions will use.
-# These names should match what's in cpu_cooling_data_processed.csv' after stripping.
-# Based on previous successful processing of the original data, assuming these names:
-COL_ACTUAL_PPT = 'CPU_Power_W_Actual'
-COL_SET_PPT = 'Set_PPT_W'
-COL_CPU_TEMP = 'CPU_Temp_C'
-COL_FAN_RPM = 'CPU_Fan_RPM'
-COL_AMBIENT_TEMP = 'Ambient_Temp_C'
-COL_RTH_CALCULATED = 'Thermal_Resistance_Calculated' # Will be calculated if not present
-
-# Primary data file is now cpu_cooling_data_processed.csv'
-primary_data_file = "cpu_cooling_data_processed.csv"
-
-try:
-    df = pd.read_csv(primary_data_file)
-    print(f"Successfully loaded '{primary_data_file}'.")
-    
-    df.columns = df.columns.str.strip()
-    print(f"Stripped column names: {df.columns.tolist()}")
-
-    # Verify necessary columns exist
-    required_cols_check = [COL_ACTUAL_PPT, COL_SET_PPT, COL_CPU_TEMP, COL_FAN_RPM, COL_AMBIENT_TEMP]
-    missing_cols = [col for col in required_cols_check if col not in df.columns]
-    if missing_cols:
-        print(f"Error: Critical columns {missing_cols} are missing from '{primary_data_file}' after stripping.")
-        print(f"Available columns: {df.columns.tolist()}")
-        # Attempt to map common alternatives if known, otherwise raise error
-        # Example: if 'CPU Temperature (C)' was expected but 'CPU_Temp_C' is present.
-        # For now, strict check.
-        raise KeyError(f"Cannot proceed, missing essential columns in '{primary_data_file}': {missing_cols}")
-
-    # Calculate thermal resistance if not already present
-    if COL_RTH_CALCULATED not in df.columns:
-        print(f"'{COL_RTH_CALCULATED}' not found, calculating it...")
-        power_threshold = 1.0
-        valid_power_mask = df[COL_ACTUAL_PPT] >= power_threshold
-        
-        if (~valid_power_mask).any():
-            print(f"Info: { (~valid_power_mask).sum()} rows have '{COL_ACTUAL_PPT}' < {power_threshold}W. Rth will be NaN for these.")
-
-        df[COL_RTH_CALCULATED] = np.nan # Initialize column
-        df.loc[valid_power_mask, COL_RTH_CALCULATED] = \
-            (df.loc[valid_power_mask, COL_CPU_TEMP] - df.loc[valid_power_mask, COL_AMBIENT_TEMP]) / df.loc[valid_power_mask, COL_ACTUAL_PPT]
-        print(f"Calculated '{COL_RTH_CALCULATED}'. {df[COL_RTH_CALCULATED].isnull().sum()} NaNs in Rth.")
-    else:
-        print(f"'{COL_RTH_CALCULATED}' column already present in the data.")
-        
-    # Save this potentially modified dataframe (with calculated Rth) as the new 'processed' file for subsequent steps.
-    # This ensures that the modeling step can use this version.
-    df.to_csv("cpu_cooling_data_processed.csv", index=False)
-    print("Saved the processed data (from download.csv, with Rth) to 'cpu_cooling_data_processed.csv'")
-
+print(f"Processed data saved as {PROCESSED_CSV_FILE}")
 
-except FileNotFoundError:
-    print(f"Fatal Error: The specified data file '{primary_data_file}' was not found.")
-    print("Please ensure the file is correctly uploaded and named.")
-    raise 
-except Exception as e:
-    print(f"Fatal Error: An error occurred during loading or initial processing of '{primary_data_file}': {e}")
-    raise
+if COL_SET_PPT not in df.columns:
+    raise KeyError(f"Cannot draw the PPT plots, '{COL_SET_PPT}' is missing from '{file_path}' (PPT control was off).")
 
 # --- Plot 1: Actual PPT vs. Set PPT ---
-plt.figure(figsize=(10, 6))
-sns.scatterplot(data=df, x=COL_SET_PPT, y=COL_ACTUAL_PPT, alpha=0.6, hue=COL_FAN_RPM, palette='coolwarm_r', s=50)
-if df[COL_SET_PPT].notna().all() and df[COL_ACTUAL_PPT].notna().all(): # Check for NaNs before min/max
-    max_val = max(df[COL_SET_PPT].max(), df[COL_ACTUAL_PPT].max())
-    min_val = min(df[COL_SET_PPT].min(), df[COL_ACTUAL_PPT].min())
-    if pd.notna(min_val) and pd.notna(max_val): # Ensure min_val and max_val themselves are not NaN
-        plt.plot([min_val, max_val], [min_val, max_val], 'k--', lw=2, label='Ideal (Actual = Set)')
+def plot_actual_vs_set_ppt():
+    plt.figure(figsize=(10, 6))
+    sns.scatterplot(data=df, x=COL_SET_PPT, y=COL_ACTUAL_PPT, alpha=0.6, hue=COL_FAN_RPM, palette='coolwarm_r', s=50)
+    if df[COL_SET_PPT].notna().all() and df[COL_ACTUAL_PPT].notna().all(): # Check for NaNs before min/max
+        max_val = max(df[COL_SET_PPT].max(), df[COL_ACTUAL_PPT].max())
+        min_val = min(df[COL_SET_PPT].min(), df[COL_ACTUAL_PPT].min())
+        if pd.notna(min_val) and pd.notna(max_val): # Ensure min_val and max_val themselves are not NaN
+            plt.plot([min_val, max_val], [min_val, max_val], 'k--', lw=2, label='Ideal (Actual = Set)')
+        else:
+            print("Warning: Could not determine range for identity line in 'Actual PPT vs Set PPT' due to NaN in min/max power values.")
     else:
-        print("Warning: Could not determine range for identity line in 'Actual PPT vs Set PPT' due to NaN in min/max power values.")
+         print("Warning: Skipping identity line in 'Actual PPT vs Set PPT' due to NaN values in power columns.")
+    plt.title('Actual CPU Power vs. Set Power Target (PPT)', fontsize=16)
+    plt.xlabel('Set PPT (W)', fontsize=14)
+    plt.ylabel('Actual CPU Power (W)', fontsize=14)
+    plt.legend(title='CPU Fan RPM')
+    plt.grid(True, linestyle=':', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig("Actual_PPT_vs_Set_PPT.png")
+
+
+if cached_output(cache, output_key("Actual_PPT_vs_Set_PPT.png"), "Actual_PPT_vs_Set_PPT.png", plot_actual_vs_set_ppt):
+    print("Plot 'Actual_PPT_vs_Set_PPT.png' reused from cache.")
 else:
-     print("Warning: Skipping identity line in 'Actual PPT vs Set PPT' due to NaN values in power columns.")
-plt.title('Actual CPU Power vs. Set Power Target (PPT)', fontsize=16)
-plt.xlabel('Set PPT (W)', fontsize=14)
-plt.ylabel('Actual CPU Power (W)', fontsize=14)
-plt.legend(title='CPU Fan RPM')
-plt.grid(True, linestyle=':', alpha=0.7)
-plt.tight_layout()
-plt.savefig("Actual_PPT_vs_Set_PPT.png")
-print("Plot 'Actual_PPT_vs_Set_PPT.png' saved.")
+    print("Plot 'Actual_PPT_vs_Set_PPT.png' saved.")
 
 # --- Plot 2: Temperature vs. Power ---
-plt.figure(figsize=(10, 6))
-scatter = sns.scatterplot(data=df, x=COL_ACTUAL_PPT, y=COL_CPU_TEMP, hue=COL_FAN_RPM, size=COL_AMBIENT_TEMP, palette='viridis', alpha=0.7, sizes=(20, 200))
-plt.title('CPU Temperature vs. Actual CPU Power', fontsize=16)
-plt.xlabel('Actual CPU Power (W)', fontsize=14)
-plt.ylabel('CPU Temperature (°C)', fontsize=14)
-handles, labels = scatter.get_legend_handles_labels()
-plt.legend(title='CPU Fan RPM / Ambient Temp', bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.grid(True, linestyle=':', alpha=0.7)
-plt.tight_layout(rect=[0, 0, 0.85, 1]) 
-plt.savefig("Temp_vs_Power.png")
-print("Plot 'Temp_vs_Power.png' saved.")
+def plot_store_hexbin(name, cmap, colorbar_label):
+    """Hexbin of a plot-store grid, each hexagon coloured by the mean of the grid's third column."""
+    x, y, counts, c_sum, c_count = store.hexbin_cells(name)
+    if not len(x):
+        print(f"Warning: No measurement rows for '{name}'; the plot is empty.")
+        return
+    # C carries the fine-cell indices so every hexagon can pool its cells' sums.
+    hexbin = plt.hexbin(x, y, C=np.arange(len(x)), gridsize=HEXBIN_GRIDSIZE, cmap=cmap,
+                        reduce_C_function=lambda cells: (c_sum[np.asarray(cells, dtype=int)].sum()
+                                                         / max(c_count[np.asarray(cells, dtype=int)].sum(), 1)))
+    plt.colorbar(hexbin, label=colorbar_label)
+    plt.figtext(0.99, 0.01, f"{int(counts.sum())} samples", ha='right', fontsize=9, color='gray')
+
+
+def plot_temp_vs_power():
+    plt.figure(figsize=(10, 6))
+    plot_store_hexbin('Temp_vs_Power', 'viridis', 'Mean CPU Fan RPM')
+    plt.title('CPU Temperature vs. Actual CPU Power', fontsize=16)
+    plt.xlabel('Actual CPU Power (W)', fontsize=14)
+    plt.ylabel('CPU Temperature (°C)', fontsize=14)
+    plt.grid(True, linestyle=':', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig("Temp_vs_Power.png")
+
+
+if cached_output(cache, output_key("Temp_vs_Power.png"), "Temp_vs_Power.png", plot_temp_vs_power):
+    print("Plot 'Temp_vs_Power.png' reused from cache.")
+else:
+    print("Plot 'Temp_vs_Power.png' saved.")
 
 # --- Plot 3: Temperature vs. RPM ---
-plt.figure(figsize=(10, 6))
-scatter_temp_rpm = sns.scatterplot(data=df, x=COL_FAN_RPM, y=COL_CPU_TEMP, hue=COL_ACTUAL_PPT, size=COL_AMBIENT_TEMP, palette='magma', alpha=0.7, sizes=(20,200))
-plt.title('CPU Temperature vs. CPU Fan RPM', fontsize=16)
-plt.xlabel('CPU Fan RPM', fontsize=14)
-plt.ylabel('CPU Temperature (°C)', fontsize=14)
-plt.legend(title='CPU Power (W) / Ambient Temp', bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.grid(True, linestyle=':', alpha=0.7)
-plt.tight_layout(rect=[0, 0, 0.85, 1]) 
-plt.savefig("Temp_vs_RPM.png")
-print("Plot 'Temp_vs_RPM.png' saved.")
+def plot_temp_vs_rpm():
+    plt.figure(figsize=(10, 6))
+    plot_store_hexbin('Temp_vs_RPM', 'magma', 'Mean CPU Power (W)')
+    plt.title('CPU Temperature vs. CPU Fan RPM', fontsize=16)
+    plt.xlabel('CPU Fan RPM', fontsize=14)
+    plt.ylabel('CPU Temperature (°C)', fontsize=14)
+    plt.grid(True, linestyle=':', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig("Temp_vs_RPM.png")
+
+
+if cached_output(cache, output_key("Temp_vs_RPM.png"), "Temp_vs_RPM.png", plot_temp_vs_rpm):
+    print("Plot 'Temp_vs_RPM.png' reused from cache.")
+else:
+    print("Plot 'Temp_vs_RPM.png' saved.")
 
 # --- Plot 4: Distributions of Key Variables ---
-fig, axes = plt.subplots(2, 2, figsize=(14, 10))
-fig.suptitle('Distributions of Key Experimental Variables', fontsize=18, y=1.02)
-
-sns.histplot(df[COL_CPU_TEMP], kde=True, ax=axes[0, 0], color='skyblue')
-axes[0, 0].set_title('CPU Temperature (°C)', fontsize=14)
-axes[0, 0].set_xlabel('')
-axes[0, 0].set_ylabel('Frequency', fontsize=12)
-
-sns.histplot(df[COL_AMBIENT_TEMP], kde=True, ax=axes[0, 1], color='lightgreen')
-axes[0, 1].set_title('Ambient Temperature (°C)', fontsize=14)
-axes[0, 1].set_xlabel('')
-axes[0, 1].set_ylabel('Frequency', fontsize=12)
-
-sns.histplot(df[COL_ACTUAL_PPT], kde=True, ax=axes[1, 0], color='salmon')
-axes[1, 0].set_title('Actual CPU Power (W)', fontsize=14)
-axes[1, 0].set_xlabel('')
-axes[1, 0].set_ylabel('Frequency', fontsize=12)
-
-sns.histplot(df[COL_FAN_RPM], kde=True, ax=axes[1, 1], color='gold')
-axes[1, 1].set_title('CPU Fan RPM', fontsize=14)
-axes[1, 1].set_xlabel('')
-axes[1, 1].set_ylabel('Frequency', fontsize=12)
-
-for ax_row in axes:
-    for ax in ax_row:
+def plot_store_histogram(col, ax, color):
+    """Histogram (with KDE) of a plot-store column, in whole multiples of its fine bin width."""
+    centers, counts, width = store.histogram(col)
+    if not len(centers):
+        return
+    lo, hi = centers.min() - width / 2, centers.max() + width / 2
+    binwidth = width * max(1, int(np.ceil((hi - lo) / width / HISTOGRAM_MAX_BINS)))
+    bins = int(np.ceil((hi - lo) / binwidth - 1e-9))
+    # A weighted KDE sizes its bandwidth for the effective number of bins; rescale it to the number of samples.
+    total = counts.sum()
+    bw_adjust = (total ** 2 / (counts.astype(float) ** 2).sum() / total) ** 0.2
+    sns.histplot(x=centers, weights=counts, binwidth=binwidth, binrange=(lo, lo + bins * binwidth),
+                 kde=len(centers) > 1, kde_kws={'bw_adjust': bw_adjust}, ax=ax, color=color)
+
+
+def plot_distributions():
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    fig.suptitle('Distributions of Key Experimental Variables', fontsize=18, y=1.02)
+
+    plot_store_histogram(COL_CPU_TEMP, axes[0, 0], 'skyblue')
+    axes[0, 0].set_title('CPU Temperature (°C)', fontsize=14)
+    axes[0, 0].set_xlabel('')
+    axes[0, 0].set_ylabel('Frequency', fontsize=12)
+
+    plot_store_histogram(COL_AMBIENT_TEMP, axes[0, 1], 'lightgreen')
+    axes[0, 1].set_title('Ambient Temperature (°C)', fontsize=14)
+    axes[0, 1].set_xlabel('')
+    axes[0, 1].set_ylabel('Frequency', fontsize=12)
+
+    plot_store_histogram(COL_ACTUAL_PPT, axes[1, 0], 'salmon')
+    axes[1, 0].set_title('Actual CPU Power (W)', fontsize=14)
+    axes[1, 0].set_xlabel('')
+    axes[1, 0].set_ylabel('Frequency', fontsize=12)
+
+    plot_store_histogram(COL_FAN_RPM, axes[1, 1], 'gold')
+    axes[1, 1].set_title('CPU Fan RPM', fontsize=14)
+    axes[1, 1].set_xlabel('')
+    axes[1, 1].set_ylabel('Frequency', fontsize=12)
+
+    for ax_row in axes:
+        for ax in ax_row:
+            ax.grid(True, linestyle=':', alpha=0.5)
+            ax.tick_params(axis='x', labelsize=10)
+            ax.tick_params(axis='y', labelsize=10)
+
+    plt.tight_layout(rect=[0, 0, 1, 0.98]) 
+    plt.savefig("Key_Variables_Distribution.png")
+
+
+if cached_output(cache, output_key("Key_Variables_Distribution.png"), "Key_Variables_Distribution.png", plot_distributions):
+    print("Plot 'Key_Variables_Distribution.png' reused from cache.")
+else:
+    print("Plot 'Key_Variables_Distribution.png' saved.")
+
+# --- Plot 5: Timeline of the whole run ---
+def plot_timeline():
+    resolution_s, frame = store.timeline_frame(TIMELINE_MAX_BUCKETS)
+    panels = [(COL_CPU_TEMP, 'CPU Temperature (°C)', 'tab:red'), (COL_ACTUAL_PPT, 'CPU Power (W)', 'tab:orange'),
+              (COL_FAN_RPM, 'CPU Fan RPM', 'tab:blue')]
+    fig, axes = plt.subplots(len(panels), 1, figsize=(14, 10), sharex=True)
+    title = 'Whole Run Timeline' + (f' ({resolution_s} s buckets: mean line, min-max band)' if resolution_s else '')
+    fig.suptitle(title, fontsize=16)
+    for ax, (col, label, color) in zip(axes, panels):
+        if f'{col}_mean' in frame.columns:
+            ax.fill_between(frame[COL_TIMESTAMP], frame[f'{col}_min'], frame[f'{col}_max'], color=color, alpha=0.25, linewidth=0)
+            ax.plot(frame[COL_TIMESTAMP], frame[f'{col}_mean'], color=color, linewidth=1)
+        if col == COL_ACTUAL_PPT and f'{COL_SET_PPT}_mean' in frame.columns:
+            ax.plot(frame[COL_TIMESTAMP], frame[f'{COL_SET_PPT}_mean'], 'k--', linewidth=1, label='Set PPT (W)')
+            ax.legend(loc='upper right')
+        ax.set_ylabel(label, fontsize=12)
         ax.grid(True, linestyle=':', alpha=0.5)
-        ax.tick_params(axis='x', labelsize=10)
-        ax.tick_params(axis='y', labelsize=10)
+    axes[-1].set_xlabel('Time', fontsize=12)
+    plt.tight_layout()
+    plt.savefig("Timeline.png")
 
-plt.tight_layout(rect=[0, 0, 1, 0.98]) 
-plt.savefig("Key_Variables_Distribution.png")
-print("Plot 'Key_Variables_Distribution.png' saved.")
 
-print("\nPython script execution for additional plots using 'download.csv' complete.")
+if cached_output(cache, output_key("Timeline.png"), "Timeline.png", plot_timeline):
+    print("Plot 'Timeline.png' reused from cache.")
+else:
+    print("Plot 'Timeline.png' saved.")
+
+print(f"\nPython script execution for additional plots using '{file_path}' complete.")
 
@@ -9,11 +9,18 @@
 #   2. Runs mprime (Prime95) in the background to generate CPU load.
 # Assumes the ryzen_monitor READ command streams output continuously.
 # Assumes the command for SETTING PPT is a one-shot command.
+# Per-sample reading and CSV writing is done in process by sampler.py (requires python3).
+# Extra channels (hwmon temps/fans, per-core clocks, RAPL power, an ambient probe) are read by sensors.py.
+# Instead of a fixed PPT list, PPT can be adjusted in closed loop to hold a temperature target or stay under
+# a ceiling (controller.py, run inside sampler.py).
+# With LIVE_DASHBOARD_PORT set, livefeed.py serves index.html with a Live tab that streams the log as it is written.
+# For unattended sweeps on several machines or CPU sets, write the answers into a spec file for sweep.py instead.
 
 # --- Configuration & Setup ---
 DEFAULT_SAMPLING_INTERVAL_S=1 
 DEFAULT_OUTPUT_FILE="cpu_cooling_data_controlled.csv"
 DEFAULT_RYZEN_MONITOR_READ_CMD="ryzen_monitor --test-export" 
+# Dry run without the hardware: read "python3 fakehw.py --test-export" and set PPT with "python3 fakehw.py" / "--set-ppt=".
 DEFAULT_PPT_CONTROL_CMD_BASE="ryzen_monitor" 
 DEFAULT_PPT_SET_ARG_FORMAT="--set-ppt=" 
 
@@ -24,9 +31,19 @@ DEFAULT_RYZEN_MONITOR_TARGET_LINE_PATTERN_POWER="cpu_ppt"
 DEFAULT_RYZEN_MONITOR_POWER_FIELD_NAME="cpu_ppt"
 
 # --- Global Variables for Background Processes ---
-RYZEN_MONITOR_READ_PID_GLOBAL=""
-RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL=""
+SAMPLER_PID_GLOBAL=""
+SAMPLER_CONTROL_FILE=""
+SAMPLER_STATUS_FILE=""
+SAMPLER_SEGMENT_LABELS=""
+SEGMENTS_FILE=""
+BINARY_LOG_FILE=""
+SENSORS_FILE=""
+PROFILE_FILE=""
+CONTROL_LOG_FILE=""
 MPRIME_PID_GLOBAL=""
+LIVEFEED_PID_GLOBAL=""
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SAMPLER_SCRIPT="$SCRIPT_DIR/sampler.py"
 
 # --- Helper Functions ---
 find_sensor_file() { # For fan hwmon fallback
@@ -50,55 +67,49 @@ find_sensor_file() { # For fan hwmon fallback
     return 1 
 }
 
-read_ryzen_monitor_metric_from_file() {
-    local temp_file_path="$1"; local target_line_grep_pattern="$2"; local field_name="$3"
-    local package_line="" value="" field_set=""
-    if [ -z "$temp_file_path" ] || [ ! -f "$temp_file_path" ]; then echo "Debug: Temp file '$temp_file_path' not found." >&2; return 1; fi
-    package_line=$(grep "$target_line_grep_pattern" "$temp_file_path" | tail -n 1)
-    if [ -z "$package_line" ]; then echo "Debug: Pattern '$target_line_grep_pattern' not found in '$temp_file_path'." >&2; return 1; fi
-    field_set=$(echo "$package_line" | cut -d ' ' -f2-); value=$(echo "$field_set" | tr ',' '\n' | grep "${field_name}=" | cut -d '=' -f2 | sed 's/i$//')
-    if [ -n "$value" ] && [[ "$value" =~ ^[0-9]+(\.[0-9]+)?$ ]]; then echo "$value"; return 0; else
-        echo "Debug: Failed to extract numeric '$field_name' from line: '$package_line' (value: '$value')" >&2; return 1; fi
+start_sampler_background() {
+    # Runs sampler.py (in-process ryzen_monitor/fan reader) in the background so cleanup_all can stop it.
+    python3 "$SAMPLER_SCRIPT" "$@" &
+    SAMPLER_PID_GLOBAL=$!
 }
 
-start_ryzen_monitor_read_background() {
-    local cmd_to_run="$1"
-    if [ -z "$cmd_to_run" ]; then echo "Error: No ryzen_monitor READ command to start." >&2; return 1; fi
-    stop_ryzen_monitor_read_background 
-    RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL=$(mktemp /tmp/ryzen_monitor_read_output.XXXXXX)
-    echo "Starting ryzen_monitor READ: '$cmd_to_run' > '$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL'" >&2
-    eval "$cmd_to_run" > "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL" 2>/dev/null &
-    RYZEN_MONITOR_READ_PID_GLOBAL=$!
-    sleep 0.5 
-    if ! ps -p "$RYZEN_MONITOR_READ_PID_GLOBAL" > /dev/null; then
-        echo "Error: Failed to start ryzen_monitor READ command: '$cmd_to_run'." >&2
-        RYZEN_MONITOR_READ_PID_GLOBAL=""; rm -f "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL"; RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL=""; return 1
+stop_sampler_background() {
+    if [ -n "$SAMPLER_PID_GLOBAL" ] && ps -p "$SAMPLER_PID_GLOBAL" > /dev/null; then
+        echo "Stopping sampler (PID: $SAMPLER_PID_GLOBAL)..." >&2
+        kill "$SAMPLER_PID_GLOBAL"; wait "$SAMPLER_PID_GLOBAL" 2>/dev/null
     fi
-    echo "ryzen_monitor READ started (PID: $RYZEN_MONITOR_READ_PID_GLOBAL)." >&2
-    return 0
-}
-
-stop_ryzen_monitor_read_background() {
-    if [ -n "$RYZEN_MONITOR_READ_PID_GLOBAL" ] && ps -p "$RYZEN_MONITOR_READ_PID_GLOBAL" > /dev/null; then
-        echo "Stopping background ryzen_monitor READ (PID: $RYZEN_MONITOR_READ_PID_GLOBAL)..." >&2
-        kill "$RYZEN_MONITOR_READ_PID_GLOBAL"; sleep 0.2 
-        if ps -p "$RYZEN_MONITOR_READ_PID_GLOBAL" > /dev/null; then kill -9 "$RYZEN_MONITOR_READ_PID_GLOBAL"; fi
-    fi
-    RYZEN_MONITOR_READ_PID_GLOBAL=""
-    if [ -n "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL" ] && [ -f "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL" ]; then
-        rm -f "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL"
-    fi
-    RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL=""
+    SAMPLER_PID_GLOBAL=""
 }
 
 # --- PPT Control & mprime Variables ---
 CONTROL_PPT="n"; PPT_CONTROL_CMD_BASE=""; PPT_SET_ARG_FORMAT=""; PPT_VALUES_TO_TEST=(); PPT_RESET_VALUE=""
 USE_MPRIME="n"; MPRIME_PATH=""; MPRIME_THREAD_COUNTS_FOR_PPT_TESTS=""; MPRIME_THREAD_COUNTS_ITERATE=() # New for iterating mprime if PPT is off
 WARMUP_DURATION=30; MEASUREMENT_DURATION=120; COOLDOWN_DURATION=60
+# Adaptive mode: warm-up/cool-down end once dT/dt stays under SETTLE_SLOPE_C_PER_MIN for SETTLE_WINDOW_S
+# (judged live by sampler.py); WARMUP_DURATION/COOLDOWN_DURATION become the maximum waits.
+ADAPTIVE_SETTLE="n"; SETTLE_WINDOW_S=30; SETTLE_SLOPE_C_PER_MIN=1.0
+# Extra channels logged to <output>_sensors.csv by sampler.py, as 'source[:interval_s],...' (sources in sensors.py:
+# hwmon, cpufreq, rapl), e.g. SENSOR_CHANNELS="hwmon:1,cpufreq:0.25,rapl". SENSORS_LAYOUT is wide or long.
+# AMBIENT_PROBE_FILE replaces the typed-in ambient temperature with a probe read every sample (scaled by AMBIENT_PROBE_SCALE).
+SENSOR_CHANNELS=${SENSOR_CHANNELS:-}; SENSORS_LAYOUT=${SENSORS_LAYOUT:-wide}
+AMBIENT_PROBE_FILE=${AMBIENT_PROBE_FILE:-}; AMBIENT_PROBE_SCALE=${AMBIENT_PROBE_SCALE:-1}
+# Closed-loop PPT control (asked for when PPT control is on): PPT_CONTROL_MODE is target or ceiling, PPT_CONTROLLER
+# pi or mpc. Set commands are sent at most every PPT_CONTROL_INTERVAL_S, by at most PPT_SLEW_W, within PPT_MIN_W..PPT_MAX_W.
+# PPT_CONTROL_INPUT is CPU_Temp_C or a SENSOR_CHANNELS channel name; CONTROL_DURATION=0 runs until Ctrl+C.
+PPT_CONTROL_MODE=${PPT_CONTROL_MODE:-}; PPT_CONTROL_TEMP_C=${PPT_CONTROL_TEMP_C:-}; PPT_CONTROLLER=${PPT_CONTROLLER:-pi}
+PPT_MIN_W=${PPT_MIN_W:-15}; PPT_MAX_W=${PPT_MAX_W:-88}; PPT_SLEW_W=${PPT_SLEW_W:-10}; PPT_CONTROL_INTERVAL_S=${PPT_CONTROL_INTERVAL_S:-5}
+PPT_CONTROL_INPUT=${PPT_CONTROL_INPUT:-CPU_Temp_C}; CONTROL_DURATION=${CONTROL_DURATION:-0}
+# Live dashboard: http://<host>:LIVE_DASHBOARD_PORT/ (livefeed.py, stdlib only; LIVE_DASHBOARD_HOST=0.0.0.0 for other machines).
+LIVE_DASHBOARD_PORT=${LIVE_DASHBOARD_PORT:-}; LIVE_DASHBOARD_HOST=${LIVE_DASHBOARD_HOST:-127.0.0.1}
 
 cleanup_all() {
     echo -e "\nPerforming cleanup..."
-    stop_ryzen_monitor_read_background 
+    stop_sampler_background
+    if [ -n "$LIVEFEED_PID_GLOBAL" ] && ps -p "$LIVEFEED_PID_GLOBAL" > /dev/null; then kill "$LIVEFEED_PID_GLOBAL"; fi
+    LIVEFEED_PID_GLOBAL=""
+    if [ -n "$PROFILE_FILE" ] && [ -s "$PROFILE_FILE" ]; then python3 "$SCRIPT_DIR/profiler.py" summary "$PROFILE_FILE"; fi
+    if [ -n "$SAMPLER_CONTROL_FILE" ]; then rm -f "$SAMPLER_CONTROL_FILE"; fi
+    if [ -n "$SAMPLER_STATUS_FILE" ]; then rm -f "$SAMPLER_STATUS_FILE"; fi
     if [ -n "$MPRIME_PID_GLOBAL" ] && ps -p "$MPRIME_PID_GLOBAL" > /dev/null; then
         echo "Stopping mprime (PID: $MPRIME_PID_GLOBAL)..."; kill "$MPRIME_PID_GLOBAL"; sleep 1
         if ps -p "$MPRIME_PID_GLOBAL" > /dev/null; then kill -9 "$MPRIME_PID_GLOBAL"; fi
@@ -109,11 +120,17 @@ cleanup_all() {
         echo "Attempting to reset PPT to $PPT_RESET_VALUE W using: $reset_cmd_full"
         eval "$reset_cmd_full"; if [ $? -eq 0 ]; then echo "PPT reset successfully."; else echo "Warning: PPT reset command failed."; fi
     fi
-    echo "Data (if any) saved to $OUTPUT_FILE"; echo "Cleanup complete. Exiting."; exit 0 
+    echo "Data (if any) saved to $OUTPUT_FILE"; if [ -n "$SEGMENTS_FILE" ]; then echo "Segment timing saved to $SEGMENTS_FILE"; fi
+    if [ -n "$BINARY_LOG_FILE" ]; then echo "Binary log saved to $BINARY_LOG_FILE"; fi
+    if [ -n "$SENSORS_FILE" ]; then echo "Extra sensor channels saved to $SENSORS_FILE"; fi
+    if [ -n "$PROFILE_FILE" ]; then echo "Logger self-profile saved to $PROFILE_FILE"; fi
+    if [ -n "$CONTROL_LOG_FILE" ]; then echo "PPT control actions saved to $CONTROL_LOG_FILE"; fi; echo "Cleanup complete. Exiting."; exit 0 
 }
 trap cleanup_all SIGINT SIGTERM
 
 if ! command -v bc &> /dev/null; then echo "Error: 'bc' not installed." >&2; exit 1; fi
+if ! command -v python3 &> /dev/null; then echo "Error: 'python3' not installed (needed for sampler.py)." >&2; exit 1; fi
+if [ ! -f "$SAMPLER_SCRIPT" ]; then echo "Error: sampler not found at '$SAMPLER_SCRIPT'." >&2; exit 1; fi
 if [[ $EUID -ne 0 ]]; then echo "Warning: Root privileges likely required for ryzen_monitor and PPT/mprime control." >&2; fi
 
 # --- Ryzen Monitor READ Command Setup ---
@@ -123,6 +140,13 @@ RYZEN_MONITOR_TEMP_FIELD_NAME_USER=""
 RYZEN_MONITOR_TARGET_LINE_PATTERN_POWER_USER=""
 RYZEN_MONITOR_POWER_FIELD_NAME_USER=""
 
+# Set RYZEN_MONITOR_CAPTURE_FILE to follow a file that an already running ryzen_monitor appends (>>) to instead.
+RYZEN_MONITOR_CAPTURE_FILE=${RYZEN_MONITOR_CAPTURE_FILE:-}
+if [ -n "$RYZEN_MONITOR_CAPTURE_FILE" ]; then
+    if [ ! -f "$RYZEN_MONITOR_CAPTURE_FILE" ]; then echo "Error: Capture file '$RYZEN_MONITOR_CAPTURE_FILE' not found. Exiting." >&2; cleanup_all; fi
+    RYZEN_MONITOR_READ_CMD_USER="(capture file) $RYZEN_MONITOR_CAPTURE_FILE"
+    echo "Following ryzen_monitor capture file: '$RYZEN_MONITOR_CAPTURE_FILE' (truncated as it grows; writer must append)"
+else
 read -r -p "Enter command for READING ryzen_monitor data (e.g., 'ryzen_monitor_ng --test-export'): [$DEFAULT_RYZEN_MONITOR_READ_CMD] " RYZEN_MONITOR_READ_CMD_USER
 RYZEN_MONITOR_READ_CMD_USER=${RYZEN_MONITOR_READ_CMD_USER:-$DEFAULT_RYZEN_MONITOR_READ_CMD}
 if [ -z "$RYZEN_MONITOR_READ_CMD_USER" ]; then echo "Error: Ryzen monitor READ command is required. Exiting." >&2; cleanup_all; fi
@@ -130,6 +154,7 @@ RYZEN_MONITOR_READ_BASE_CMD=$(echo "$RYZEN_MONITOR_READ_CMD_USER" | awk '{print
 if ! command -v "$RYZEN_MONITOR_READ_BASE_CMD" &> /dev/null || [ ! -x "$(command -v "$RYZEN_MONITOR_READ_BASE_CMD")" ]; then
     echo "Error: Ryzen monitor READ command base '$RYZEN_MONITOR_READ_BASE_CMD' not found or not executable. Exiting." >&2; cleanup_all; fi
 echo "Using ryzen_monitor READ command: '$RYZEN_MONITOR_READ_CMD_USER'"
+fi
 
 read -r -p "Enter grep pattern for TEMP line in ryzen_monitor output: [$DEFAULT_RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP] " RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER
 RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER=${RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER:-$DEFAULT_RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP}
@@ -152,6 +177,9 @@ echo -e "\n--- Sensor Configuration Summary ---"
 echo "CPU Temperature: From '$RYZEN_MONITOR_READ_CMD_USER', line matching '$RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER', field '$RYZEN_MONITOR_TEMP_FIELD_NAME_USER'"
 echo "CPU Power: From '$RYZEN_MONITOR_READ_CMD_USER', line matching '$RYZEN_MONITOR_TARGET_LINE_PATTERN_POWER_USER', field '$RYZEN_MONITOR_POWER_FIELD_NAME_USER'"
 if [ -n "$CPU_FAN_RPM_FILE" ] && [ -f "$CPU_FAN_RPM_FILE" ] ; then echo "CPU Fan RPM Path: $CPU_FAN_RPM_FILE"; else echo "CPU Fan RPM: Not found/Not logging"; CPU_FAN_RPM_FILE=""; fi
+if [ -n "$AMBIENT_PROBE_FILE" ] && [ ! -r "$AMBIENT_PROBE_FILE" ]; then echo "Warning: ambient probe '$AMBIENT_PROBE_FILE' not readable; ignoring it." >&2; AMBIENT_PROBE_FILE=""; fi
+if [ -n "$AMBIENT_PROBE_FILE" ]; then echo "Ambient Temperature: probe '$AMBIENT_PROBE_FILE' (x $AMBIENT_PROBE_SCALE)"; fi
+if [ -n "$SENSOR_CHANNELS" ]; then echo "Extra sensor channels: $SENSOR_CHANNELS ($SENSORS_LAYOUT layout)"; fi
 echo "------------------------------------"
 
 # --- User Inputs for PPT Control ---
@@ -165,13 +193,35 @@ if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then
     else
         read -r -p "Enter argument format for SETTING PPT (e.g., --ppt-limit=): [$DEFAULT_PPT_SET_ARG_FORMAT] " PPT_SET_ARG_FORMAT
         PPT_SET_ARG_FORMAT=${PPT_SET_ARG_FORMAT:-$DEFAULT_PPT_SET_ARG_FORMAT}
-        read -r -p "Enter PPT values (in Watts) to test (space separated, e.g., \"35 45 55\"): " PPT_VALUES_STR
-        read -a PPT_VALUES_TO_TEST <<< "$PPT_VALUES_STR"
-        if [ ${#PPT_VALUES_TO_TEST[@]} -eq 0 ]; then echo "No PPT values. Disabling PPT control." >&2; CONTROL_PPT="n"; fi
+        if [ -z "$PPT_CONTROL_MODE" ]; then
+            read -r -p "Sweep fixed PPT values, or adjust PPT in closed loop to hold a temperature target or stay under a ceiling? (sweep/target/ceiling) [sweep]: " PPT_CONTROL_MODE
+        fi
+        if [[ "$PPT_CONTROL_MODE" == "target" || "$PPT_CONTROL_MODE" == "ceiling" ]]; then
+            if [ -z "$PPT_CONTROL_TEMP_C" ]; then read -r -p "Temperature $PPT_CONTROL_MODE (°C) for $PPT_CONTROL_INPUT: " PPT_CONTROL_TEMP_C; fi
+            if ! [[ "$PPT_CONTROL_TEMP_C" =~ ^[0-9]+([.][0-9]+)?$ ]]; then
+                echo "Invalid temperature. Disabling PPT control." >&2; CONTROL_PPT="n"; PPT_CONTROL_MODE=""
+            else
+                read -r -p "Control algorithm (pi/mpc) [$PPT_CONTROLLER]: " P_C; PPT_CONTROLLER=${P_C:-$PPT_CONTROLLER}
+                read -r -p "PPT range (W) the controller may use, 'min max' [$PPT_MIN_W $PPT_MAX_W]: " P_R
+                if [ -n "$P_R" ]; then read -r PPT_MIN_W PPT_MAX_W <<< "$P_R"; fi
+                if ! [[ "$PPT_MIN_W" =~ ^[0-9]+([.][0-9]+)?$ && "$PPT_MAX_W" =~ ^[0-9]+([.][0-9]+)?$ ]] || awk -v lo="$PPT_MIN_W" -v hi="$PPT_MAX_W" 'BEGIN { exit !(lo > hi) }'; then
+                    echo "Invalid PPT range '$PPT_MIN_W $PPT_MAX_W' (need two numbers, min <= max). Disabling PPT control." >&2; CONTROL_PPT="n"; PPT_CONTROL_MODE=""
+                else
+                    read -r -p "Control duration (s, 0 = until Ctrl+C) [$CONTROL_DURATION]: " C_D; CONTROL_DURATION=${C_D:-$CONTROL_DURATION}
+                fi
+            fi
+        else
+            PPT_CONTROL_MODE=""
+            read -r -p "Enter PPT values (in Watts) to test (space separated, e.g., \"35 45 55\"): " PPT_VALUES_STR
+            read -a PPT_VALUES_TO_TEST <<< "$PPT_VALUES_STR"
+            if [ ${#PPT_VALUES_TO_TEST[@]} -eq 0 ]; then echo "No PPT values. Disabling PPT control." >&2; CONTROL_PPT="n"; fi
+        fi
         read -r -p "Enter PPT value to RESET to after tests (e.g., 65 or 0 for auto): " PPT_RESET_VALUE
         if ! [[ "$PPT_RESET_VALUE" =~ ^[0-9]+$ ]]; then echo "Invalid reset PPT. Will not reset."; PPT_RESET_VALUE=""; fi
     fi
 fi
+# A closed-loop mode only applies while PPT control is on (it may come from the environment).
+if [[ ! "$CONTROL_PPT" =~ ^[Yy]$ ]]; then PPT_CONTROL_MODE=""; fi
 
 # --- User Inputs for mprime Stress Testing ---
 if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then # If controlling PPT, mprime is an option to ensure load
@@ -200,66 +250,121 @@ if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]] && [[ ! "$USE_MPRIME" =~ ^[Yy]$ ]]; then
     echo "WARNING: PPT control is enabled, but mprime (or other load generation) is not."
     echo "Ensure you run a CPU stress test MANUALLY in the background for PPT limits to be effective."
 fi
-if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then
+if [[ "$USE_MPRIME" =~ ^[Yy]$ ]] && ! { [[ "$CONTROL_PPT" =~ ^[Yy]$ ]] && [ -n "$PPT_CONTROL_MODE" ]; }; then
     echo "IMPORTANT: Ensure mprime (e.g. prime.txt) is configured for the desired test type (e.g. Small FFTs)."
     read -r -p "Warm-up duration (s) [${WARMUP_DURATION}]: " W_D; WARMUP_DURATION=${W_D:-$WARMUP_DURATION}
     read -r -p "Measurement duration per test (s) [${MEASUREMENT_DURATION}]: " M_D; MEASUREMENT_DURATION=${M_D:-$MEASUREMENT_DURATION}
     read -r -p "Cool-down duration after each test (s) [${COOLDOWN_DURATION}]: " C_D; COOLDOWN_DURATION=${C_D:-$COOLDOWN_DURATION}
+    read -r -p "End warm-up/cool-down early once temperature settles (durations above become maximums)? (y/N): " ADAPTIVE_SETTLE
+    if [[ "$ADAPTIVE_SETTLE" =~ ^[Yy]$ ]]; then
+        read -r -p "Settle window (s) [${SETTLE_WINDOW_S}]: " S_W; SETTLE_WINDOW_S=${S_W:-$SETTLE_WINDOW_S}
+        read -r -p "Settled when |dT/dt| below (°C/min) [${SETTLE_SLOPE_C_PER_MIN}]: " S_S; SETTLE_SLOPE_C_PER_MIN=${S_S:-$SETTLE_SLOPE_C_PER_MIN}
+    fi
 fi
 
 # --- User Inputs for Logging File & Interval ---
 read -r -p "Enter output CSV file name [${DEFAULT_OUTPUT_FILE}]: " OUTPUT_FILE; OUTPUT_FILE=${OUTPUT_FILE:-$DEFAULT_OUTPUT_FILE}
 read -r -p "Enter sampling interval (s) [${DEFAULT_SAMPLING_INTERVAL_S}]: " SAMPLING_INTERVAL_S; SAMPLING_INTERVAL_S=${SAMPLING_INTERVAL_S:-$DEFAULT_SAMPLING_INTERVAL_S}
 if ! [[ "$SAMPLING_INTERVAL_S" =~ ^[0-9]+([.][0-9]+)?$ ]] || (( $(echo "$SAMPLING_INTERVAL_S <= 0" | bc -l) )); then SAMPLING_INTERVAL_S=$DEFAULT_SAMPLING_INTERVAL_S; fi
-AMBIENT_TEMP_C=""; while true; do read -r -p "Ambient temp (°C): " AMBIENT_TEMP_C; if [[ "$AMBIENT_TEMP_C" =~ ^-?[0-9]+([.][0-9]+)?$ ]]; then break; else echo "Invalid."; fi; done
+AMBIENT_TEMP_C=""
+if [ -z "$AMBIENT_PROBE_FILE" ]; then
+    while true; do read -r -p "Ambient temp (°C): " AMBIENT_TEMP_C; if [[ "$AMBIENT_TEMP_C" =~ ^-?[0-9]+([.][0-9]+)?$ ]]; then break; else echo "Invalid."; fi; done
+fi
 
-# --- Initialize Logging File ---
+# --- Initialize Logging File & Start Sampler ---
 if [ -f "$OUTPUT_FILE" ]; then read -r -p "'$OUTPUT_FILE' exists. Overwrite? (y/N): " O; if [[ ! "$O" =~ ^[Yy]$ ]]; then echo "Exiting."; cleanup_all; fi; fi
-HEADER="Timestamp,CPU_Power_W_Actual,CPU_Temp_C"; if [ -n "$CPU_FAN_RPM_FILE" ]; then HEADER+=",CPU_Fan_RPM"; fi
-HEADER+=",Ambient_Temp_C"
-if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then HEADER+=",Set_PPT_W"; fi
-if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then HEADER+=",Mprime_Threads"; fi
-echo "$HEADER" > "$OUTPUT_FILE"
+# One sampler (and one ryzen_monitor reader) runs for the whole orchestration; segments are marked in the
+# Segment/Phase columns by rewriting the control file, so warm-up and cool-down telemetry is logged too.
+SAMPLER_CONTROL_FILE=$(mktemp /tmp/emu_sampler_control.XXXXXX)
+SAMPLER_STATUS_FILE="$SAMPLER_CONTROL_FILE.status" # live settled flag and dT/dt of the current segment
+SEGMENTS_FILE="${OUTPUT_FILE%.csv}_segments.csv" # per-segment duration, settle time, missed ticks and sampling jitter
+BINARY_LOG_FILE="${OUTPUT_FILE%.csv}.cpulog" # fixed-width copy of the log for fast reloads (binlog.py)
+PROFILE_FILE="${OUTPUT_FILE%.csv}_profile.jsonl" # per-segment logger stage latencies, CPU time and RSS (profiler.py)
+SAMPLER_ARGS=("$OUTPUT_FILE" --write_header --read_cmd "$RYZEN_MONITOR_READ_CMD_USER"
+    --interval "$SAMPLING_INTERVAL_S" --phase idle --control_file "$SAMPLER_CONTROL_FILE" --segments_file "$SEGMENTS_FILE"
+    --binary_log "$BINARY_LOG_FILE" --profile_file "$PROFILE_FILE" --status_file "$SAMPLER_STATUS_FILE"
+    --settle_window "$SETTLE_WINDOW_S" --settle_slope "$SETTLE_SLOPE_C_PER_MIN"
+    --temp_pattern "$RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER" --temp_field "$RYZEN_MONITOR_TEMP_FIELD_NAME_USER"
+    --power_pattern "$RYZEN_MONITOR_TARGET_LINE_PATTERN_POWER_USER" --power_field "$RYZEN_MONITOR_POWER_FIELD_NAME_USER")
+if [ -n "$RYZEN_MONITOR_CAPTURE_FILE" ]; then SAMPLER_ARGS+=(--rm_capture_file "$RYZEN_MONITOR_CAPTURE_FILE"); fi
+if [ -n "$CPU_FAN_RPM_FILE" ]; then SAMPLER_ARGS+=(--fan_file "$CPU_FAN_RPM_FILE"); fi
+if [ -n "$AMBIENT_PROBE_FILE" ]; then SAMPLER_ARGS+=(--ambient_file "$AMBIENT_PROBE_FILE" --ambient_scale "$AMBIENT_PROBE_SCALE")
+else SAMPLER_ARGS+=(--ambient_temp "$AMBIENT_TEMP_C"); fi
+if [ -n "$SENSOR_CHANNELS" ] || [ -n "$AMBIENT_PROBE_FILE" ]; then
+    SENSORS_FILE="${OUTPUT_FILE%.csv}_sensors.csv" # per-channel readings at their own rates (sensors.py)
+    SAMPLER_ARGS+=(--sensors_file "$SENSORS_FILE" --sensors_layout "$SENSORS_LAYOUT")
+    if [ -n "$SENSOR_CHANNELS" ]; then SAMPLER_ARGS+=(--sensors "$SENSOR_CHANNELS"); fi
+fi
+if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then SAMPLER_ARGS+=(--set_ppt "N/A"); fi
+if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]] && [ -n "$PPT_CONTROL_MODE" ]; then
+    CONTROL_LOG_FILE="${OUTPUT_FILE%.csv}_control.csv" # one row per controller update: error, requested/applied PPT, action
+    SAMPLER_ARGS+=(--"control_$PPT_CONTROL_MODE" "$PPT_CONTROL_TEMP_C" --control_algorithm "$PPT_CONTROLLER"
+        --ppt_set_cmd "$PPT_CONTROL_CMD_BASE $PPT_SET_ARG_FORMAT" --ppt_min "$PPT_MIN_W" --ppt_max "$PPT_MAX_W"
+        --ppt_slew "$PPT_SLEW_W" --control_interval "$PPT_CONTROL_INTERVAL_S" --control_input "$PPT_CONTROL_INPUT"
+        --control_log "$CONTROL_LOG_FILE")
+fi
+if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then SAMPLER_ARGS+=(--mprime_threads "N/A"); fi
+start_sampler_background "${SAMPLER_ARGS[@]}"
+if [ -n "$LIVE_DASHBOARD_PORT" ]; then
+    python3 "$SCRIPT_DIR/livefeed.py" "$OUTPUT_FILE" --host "$LIVE_DASHBOARD_HOST" --port "$LIVE_DASHBOARD_PORT" &
+    LIVEFEED_PID_GLOBAL=$!
+    echo "Live dashboard: http://$LIVE_DASHBOARD_HOST:$LIVE_DASHBOARD_PORT/"
+fi
+
+# --- Data Logging Functions ---
+set_sampler_segment() { # Starts a new segment in the log: <phase> <set_ppt> <mprime_threads>
+    printf '%s %s %s\n' "$1" "$2" "$3" > "$SAMPLER_CONTROL_FILE"
+    SAMPLER_SEGMENT_LABELS="$1 $2 $3"
+}
+
+wait_for_settle() { # wait_for_settle <max_seconds> <label>: waits for the current segment to settle, at most max_seconds
+    local max_seconds="$1"; local label="$2"
+    if [[ ! "$ADAPTIVE_SETTLE" =~ ^[Yy]$ ]]; then echo "$label for $max_seconds seconds..."; sleep "$max_seconds"; return; fi
+    echo "$label until temperature settles (at most $max_seconds seconds)..."
+    local deadline=$((SECONDS + ${max_seconds%.*}))
+    local phase ppt threads segment settled elapsed slope
+    while (( SECONDS < deadline )); do
+        # Status line: <phase> <set_ppt> <mprime_threads> <segment> <settled> <elapsed_s> <dT/dt>; only trust it once
+        # the sampler has picked up the segment we just announced.
+        if read -r phase ppt threads segment settled elapsed slope < "$SAMPLER_STATUS_FILE" 2>/dev/null && \
+           [ "$phase $ppt $threads" = "$SAMPLER_SEGMENT_LABELS" ] && [ "$settled" = "1" ]; then
+            echo "$label settled after $elapsed seconds (dT/dt $slope °C/min)."; return; fi
+        sleep 1
+    done
+    echo "$label did not settle within $max_seconds seconds; moving on."
+}
 
-# --- Data Logging Function ---
 log_data_segment() { # Renamed from log_data_for_duration for clarity
     local duration_seconds="$1"; local current_set_ppt="$2"; local current_mprime_threads="$3"
-    local start_time_log_func=$SECONDS; local elapsed_time=0; local samples_taken=0
     echo "Logging data for $duration_seconds seconds (Set PPT: $current_set_ppt W, Mprime Threads: $current_mprime_threads)..."
-    
-    local ryzen_monitor_read_active_for_segment=false 
-    if [ -n "$RYZEN_MONITOR_READ_CMD_USER" ]; then 
-        if start_ryzen_monitor_read_background "$RYZEN_MONITOR_READ_CMD_USER"; then
-            ryzen_monitor_read_active_for_segment=true
-        else echo "Critical Error: Failed to start ryzen_monitor READ. CPU Temp/Power will be RMStartFail." >&2; fi
-    else echo "Critical Error: RYZEN_MONITOR_READ_CMD_USER is not set." >&2; fi
-
-    while (( elapsed_time < duration_seconds )); do
-        current_time_for_log=$(date +"%Y-%m-%d %H:%M:%S.%3N"); cpu_temp_c="N/A"; cpu_power_w_actual="N/A" 
-        if $ryzen_monitor_read_active_for_segment; then
-            val_temp=$(read_ryzen_monitor_metric_from_file "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL" "$RYZEN_MONITOR_TARGET_LINE_PATTERN_TEMP_USER" "$RYZEN_MONITOR_TEMP_FIELD_NAME_USER")
-            if [ -n "$val_temp" ]; then cpu_temp_c=$val_temp; else cpu_temp_c="ReadErrRMThm"; fi
-            val_power=$(read_ryzen_monitor_metric_from_file "$RYZEN_MONITOR_READ_OUTPUT_FILE_GLOBAL" "$RYZEN_MONITOR_TARGET_LINE_PATTERN_POWER_USER" "$RYZEN_MONITOR_POWER_FIELD_NAME_USER")
-            if [ -n "$val_power" ]; then cpu_power_w_actual=$val_power; else cpu_power_w_actual="ReadErrRMPpt"; fi
-        else cpu_temp_c="RMStartFail"; cpu_power_w_actual="RMStartFail"; fi
-        
-        fan_rpm_to_log="N/A"; if [ -n "$CPU_FAN_RPM_FILE" ] && [ -f "$CPU_FAN_RPM_FILE" ]; then val=$(cat "$CPU_FAN_RPM_FILE" 2>/dev/null); fan_rpm_to_log=${val:-0}; if ! [[ "$fan_rpm_to_log" =~ ^[0-9]+$ ]]; then fan_rpm_to_log=0; fi; fi
-        
-        LOG_LINE="$current_time_for_log,$cpu_power_w_actual,$cpu_temp_c"; CONSOLE_LINE="Logged: P_act=${cpu_power_w_actual}W, T=${cpu_temp_c}C"
-        if [ -n "$CPU_FAN_RPM_FILE" ]; then LOG_LINE+=",$fan_rpm_to_log"; CONSOLE_LINE+=", F=${fan_rpm_to_log}RPM"; else LOG_LINE+=",N/A"; CONSOLE_LINE+=", F=N/A"; fi
-        LOG_LINE+=",$AMBIENT_TEMP_C"; CONSOLE_LINE+=", Amb=${AMBIENT_TEMP_C}C"
-        if [ "$current_set_ppt" != "N/A" ]; then LOG_LINE+=",$current_set_ppt"; CONSOLE_LINE+=", SetPPT=${current_set_ppt}W"; fi
-        if [ "$current_mprime_threads" != "N/A" ]; then LOG_LINE+=",$current_mprime_threads"; CONSOLE_LINE+=", MprimeThr=$current_mprime_threads"; fi
-        
-        echo "$LOG_LINE" >> "$OUTPUT_FILE"; printf "%s\r" "$CONSOLE_LINE"
-        samples_taken=$((samples_taken + 1)); sleep "$SAMPLING_INTERVAL_S"; elapsed_time=$((SECONDS - start_time_log_func))
-    done
-    echo; echo "Finished logging segment ($samples_taken samples over $elapsed_time seconds)."
-    if $ryzen_monitor_read_active_for_segment; then stop_ryzen_monitor_read_background; fi
+    if [ -z "$SAMPLER_PID_GLOBAL" ] || ! ps -p "$SAMPLER_PID_GLOBAL" > /dev/null; then
+        echo "Critical Error: sampler is not running; nothing is being logged." >&2; cleanup_all; fi
+    set_sampler_segment measure "$current_set_ppt" "$current_mprime_threads"
+    sleep "$duration_seconds"
 }
 
 # --- Main Test Orchestration ---
-if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then # PPT Control is ON
+if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]] && [ -n "$PPT_CONTROL_MODE" ]; then # Closed-loop PPT control (sampler.py sets PPT)
+    echo "Starting closed-loop PPT control: $PPT_CONTROL_MODE $PPT_CONTROL_TEMP_C °C ($PPT_CONTROLLER, $PPT_MIN_W-$PPT_MAX_W W)..."
+    control_mprime_threads_for_log="N/A"
+    if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then
+        control_mprime_threads_for_log="$MPRIME_THREAD_COUNTS_FOR_PPT_TESTS"
+        echo "Starting mprime with $control_mprime_threads_for_log threads..."
+        "$MPRIME_PATH" -m"$control_mprime_threads_for_log" -t > /dev/null 2>&1 & MPRIME_PID_GLOBAL=$!
+        sleep 1
+        if ! ps -p "$MPRIME_PID_GLOBAL" > /dev/null; then echo "Error: Failed to start mprime." >&2; MPRIME_PID_GLOBAL=""; cleanup_all; fi
+    else
+        echo "WARNING: mprime is not running. Ensure a CPU load is running for the PPT limit to matter."
+    fi
+    set_sampler_segment control "auto" "$control_mprime_threads_for_log"
+    if [ "${CONTROL_DURATION%.*}" -gt 0 ] 2>/dev/null; then
+        echo "Controlling for $CONTROL_DURATION seconds..."; sleep "$CONTROL_DURATION"
+    else
+        echo "Controlling until Ctrl+C..."; wait "$SAMPLER_PID_GLOBAL"
+    fi
+    echo -e "\nClosed-loop PPT control complete."
+
+elif [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then # PPT Control is ON
     echo "Starting PPT control test sequence..."
     if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then
         echo "mprime will run with $MPRIME_THREAD_COUNTS_FOR_PPT_TESTS threads during PPT tests."
@@ -274,9 +379,10 @@ if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then # PPT Control is ON
         eval "$SET_CMD_FULL"
         if [ $? -ne 0 ]; then echo "Warning: Command to set PPT to $ppt_val W failed. Skipping." >&2; continue; fi
 
-        current_mprime_threads_for_log="N/A"
+        current_mprime_threads_for_log="N/A"; cooldown_mprime_threads_for_log="N/A"
+        if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then current_mprime_threads_for_log="$MPRIME_THREAD_COUNTS_FOR_PPT_TESTS"; cooldown_mprime_threads_for_log=0; fi
+        set_sampler_segment warmup "$ppt_val" "$current_mprime_threads_for_log"
         if [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then
-            current_mprime_threads_for_log="$MPRIME_THREAD_COUNTS_FOR_PPT_TESTS"
             echo "Starting mprime with $current_mprime_threads_for_log threads..."
             "$MPRIME_PATH" -m"$current_mprime_threads_for_log" -t > /dev/null 2>&1 & MPRIME_PID_GLOBAL=$!
             sleep 1 
@@ -285,16 +391,16 @@ if [[ "$CONTROL_PPT" =~ ^[Yy]$ ]]; then # PPT Control is ON
             echo "mprime started (PID: $MPRIME_PID_GLOBAL)."
         fi
         
-        echo "Warming up for $WARMUP_DURATION seconds..."
-        sleep "$WARMUP_DURATION"
+        wait_for_settle "$WARMUP_DURATION" "Warming up"
         log_data_segment "$MEASUREMENT_DURATION" "$ppt_val" "$current_mprime_threads_for_log" 
         
         if [[ "$USE_MPRIME" =~ ^[Yy]$ ]] && [ -n "$MPRIME_PID_GLOBAL" ]; then
             echo "Stopping mprime (PID: $MPRIME_PID_GLOBAL)..."; kill "$MPRIME_PID_GLOBAL"; wait "$MPRIME_PID_GLOBAL" 2>/dev/null
             MPRIME_PID_GLOBAL=""; echo "mprime stopped."
         fi
+        set_sampler_segment cooldown "$ppt_val" "$cooldown_mprime_threads_for_log"
         if [[ "$ppt_val" != "${PPT_VALUES_TO_TEST[-1]}" ]]; then 
-            echo "Cooling down for $COOLDOWN_DURATION seconds..."; sleep "$COOLDOWN_DURATION"; fi
+            wait_for_settle "$COOLDOWN_DURATION" "Cooling down"; fi
     done
     echo -e "\nAll PPT control tests complete."
 
@@ -302,22 +408,25 @@ elif [[ "$USE_MPRIME" =~ ^[Yy]$ ]]; then # PPT Control is OFF, mprime is ON
     echo "Starting mprime load test sequence (iterating mprime threads)..."
     for threads in "${MPRIME_THREAD_COUNTS_ITERATE[@]}"; do
         echo -e "\n--- Starting mprime test with $threads threads ---"
+        set_sampler_segment warmup "N/A" "$threads"
         "$MPRIME_PATH" -m"$threads" -t > /dev/null 2>&1 & MPRIME_PID_GLOBAL=$!
         sleep 1 
         if ! ps -p "$MPRIME_PID_GLOBAL" > /dev/null; then
             echo "Error: Failed to start mprime with $threads threads. Skipping."; MPRIME_PID_GLOBAL=""; continue; fi
         echo "mprime started (PID: $MPRIME_PID_GLOBAL) for $threads threads."
-        echo "Warming up for $WARMUP_DURATION seconds..."; sleep "$WARMUP_DURATION"
+        wait_for_settle "$WARMUP_DURATION" "Warming up"
         log_data_segment "$MEASUREMENT_DURATION" "N/A" "$threads" 
         echo "Stopping mprime (PID: $MPRIME_PID_GLOBAL)..."; kill "$MPRIME_PID_GLOBAL"; wait "$MPRIME_PID_GLOBAL" 2>/dev/null
         MPRIME_PID_GLOBAL=""; echo "mprime stopped."
+        set_sampler_segment cooldown "N/A" 0
         if [[ "$threads" != "${MPRIME_THREAD_COUNTS_ITERATE[-1]}" ]]; then 
-            echo "Cooling down for $COOLDOWN_DURATION seconds..."; sleep "$COOLDOWN_DURATION"; fi
+            wait_for_settle "$COOLDOWN_DURATION" "Cooling down"; fi
     done
     echo -e "\nAll mprime iteration tests complete."
 else # BOTH PPT Control and mprime are OFF - Continuous Logging
     echo "No PPT control or mprime tests. Starting continuous data logging. Press Ctrl+C to stop."
-    log_data_segment 999999999 "N/A" "N/A" 
+    set_sampler_segment measure "N/A" "N/A"
+    wait "$SAMPLER_PID_GLOBAL"
 fi
 
 cleanup_all 
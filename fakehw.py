@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Synthetic stand-in for the hardware the logger talks to, for benchmarks and dry runs.
+
+The CPU is modelled as a first-order RC thermal system driven by package power:
+
+    tau * dT/dt = T_ambient + R_th(RPM) * P - T,    R_th(RPM) = R_fixed + C / RPM^n
+
+where P is the PPT limit while loaded (idle power otherwise) and the fan follows
+a linear fan curve of T. State lives in a directory shared by every invocation:
+
+    python3 fakehw.py --state_dir /tmp/fakehw --test-export      # like ryzen_monitor --test-export
+    python3 fakehw.py --state_dir /tmp/fakehw --set-ppt=45       # like ryzen_monitor --set-ppt=45
+
+The exporter integrates the model in real time (or `--time_scale` times faster),
+prints `cpu_thm` / `cpu_ppt` export lines and mirrors the state into a fake
+sysfs tree under <state_dir>/sys (k10temp temperature, nct6793 fan2_input,
+per-core cpufreq, a powercap energy counter), so sampler.py and sensors.py run
+against it unchanged (--fan_file, --sysfs_root).
+
+generate_log() writes a whole synthetic sampler.py log (CSV and optionally a
+binary .cpulog) from the same model, for ingest and fitting benchmarks.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+DEFAULT_STATE_DIR = os.environ.get('FAKEHW_DIR', '/tmp/fakehw')
+
+
+class ThermalModel:
+    """First-order RC response of package temperature to package power, with a fan curve."""
+
+    def __init__(self, ambient_c=25.0, tau_s=40.0, r_fixed=0.12, c=40.0, n=0.7, idle_power_w=15.0,
+                 fan_min_rpm=600.0, fan_max_rpm=2000.0, fan_start_c=40.0, fan_slope_rpm_per_c=40.0,
+                 noise_c=0.1, noise_w=0.3, seed=0):
+        self.ambient_c = ambient_c
+        self.tau_s = tau_s
+        self.r_fixed = r_fixed
+        self.c = c
+        self.n = n
+        self.idle_power_w = idle_power_w
+        self.fan_min_rpm = fan_min_rpm
+        self.fan_max_rpm = fan_max_rpm
+        self.fan_start_c = fan_start_c
+        self.fan_slope_rpm_per_c = fan_slope_rpm_per_c
+        self.noise_c = noise_c
+        self.noise_w = noise_w
+        self.random = random.Random(seed)
+        self.temp_c = ambient_c + r_fixed * idle_power_w
+        self.energy_j = 0.0
+
+    def fan_rpm(self, temp_c=None):
+        temp_c = self.temp_c if temp_c is None else temp_c
+        rpm = self.fan_min_rpm + (temp_c - self.fan_start_c) * self.fan_slope_rpm_per_c
+        return min(self.fan_max_rpm, max(self.fan_min_rpm, rpm))
+
+    def rth(self, rpm):
+        return self.r_fixed + self.c / rpm ** self.n
+
+    def step(self, power_w, dt_s):
+        """Advances the model by dt_s seconds at constant power (exact for the frozen R_th)."""
+        target = self.ambient_c + self.rth(self.fan_rpm()) * power_w
+        self.temp_c = target + (self.temp_c - target) * math.exp(-dt_s / self.tau_s)
+        self.energy_j += power_w * dt_s
+
+    def observe(self, power_w):
+        """Noisy (temperature, power, fan RPM) readings of the current state."""
+        return (self.temp_c + self.random.gauss(0.0, self.noise_c),
+                max(0.0, power_w + self.random.gauss(0.0, self.noise_w)),
+                int(round(self.fan_rpm())))
+
+
+class FakeSysfs:
+    """Fake /sys tree with the files sensors.py and the fan detection in emu.sh look for."""
+
+    def __init__(self, root, cores=4):
+        self.root = root
+        self.cores = cores
+        self.hwmon_temp = os.path.join(root, 'class', 'hwmon', 'hwmon0', 'temp1_input')
+        self.fan_file = os.path.join(root, 'class', 'hwmon', 'hwmon1', 'fan2_input')
+        self.energy_file = os.path.join(root, 'class', 'powercap', 'intel-rapl:0', 'energy_uj')
+        self.freq_files = [os.path.join(root, 'devices', 'system', 'cpu', f'cpu{i}', 'cpufreq', 'scaling_cur_freq')
+                           for i in range(cores)]
+        for path in [self.hwmon_temp, self.fan_file, self.energy_file] + self.freq_files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write('class/hwmon/hwmon0/name', 'k10temp')
+        self._write('class/hwmon/hwmon0/temp1_label', 'Tctl')
+        self._write('class/hwmon/hwmon1/name', 'nct6793')
+        self._write('class/powercap/intel-rapl:0/name', 'package-0')
+        self._write('class/powercap/intel-rapl:0/max_energy_range_uj', str(2 ** 32))
+
+    def _write(self, relative_path, text):
+        with open(os.path.join(self.root, relative_path), 'w') as f:
+            f.write(text + '\n')
+
+    def update(self, temp_c, fan_rpm, energy_j, freq_mhz):
+        # Rewritten in place like sysfs attributes: readers pread offset 0 of a kept-open file.
+        for path, text in [(self.hwmon_temp, str(int(temp_c * 1000))), (self.fan_file, str(fan_rpm)),
+                           (self.energy_file, str(int(energy_j * 1e6) % 2 ** 32))] + \
+                          [(path, str(int(freq_mhz * 1000))) for path in self.freq_files]:
+            with open(path, 'r+' if os.path.exists(path) else 'w') as f:
+                f.write(text.ljust(12) + '\n')
+
+
+def _state_path(state_dir):
+    return os.path.join(state_dir, 'state.json')
+
+
+def read_state(state_dir):
+    try:
+        with open(_state_path(state_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'ppt_w': 65.0, 'loaded': True}
+
+
+def write_state(state_dir, **changes):
+    os.makedirs(state_dir, exist_ok=True)
+    state = read_state(state_dir)
+    state.update(changes)
+    tmp_path = _state_path(state_dir) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _state_path(state_dir))
+    return state
+
+
+def run_exporter(state_dir, rate_hz=10.0, time_scale=1.0, duration_s=None, model=None, out=sys.stdout, cores=4):
+    """
+    Streams ryzen_monitor-style export lines while integrating the thermal model.
+
+    Reads the PPT set-point from the shared state (see write_state) on every step.
+    """
+    model = model or ThermalModel()
+    sysfs = FakeSysfs(os.path.join(state_dir, 'sys'), cores)
+    period = 1.0 / rate_hz
+    start = last = time.monotonic()
+    step = 0
+    while duration_s is None or last - start < duration_s:
+        step += 1
+        deadline = start + step * period
+        now = time.monotonic()
+        if now < deadline:
+            time.sleep(deadline - now)
+        now = time.monotonic()
+        state = read_state(state_dir)
+        power = float(state['ppt_w']) if state.get('loaded', True) else model.idle_power_w
+        model.step(power, (now - last) * time_scale)
+        last = now
+        temp, measured_power, rpm = model.observe(power)
+        sysfs.update(temp, rpm, model.energy_j, 3600.0 - 10.0 * max(0.0, temp - 70.0))
+        try:
+            out.write(f'ryzen_monitor cpu_thm={temp:.3f},cpu_ppt={measured_power:.3f},fan_rpm={rpm}i\n')
+            out.flush()
+        except BrokenPipeError:
+            return
+
+
+def generate_log(path, rows, ppt_values=(35, 45, 55, 65, 75, 85, 95, 105), interval_s=1.0, warmup_s=60,
+                 cooldown_s=30, model=None, binary_log=None, start_epoch_s=1.7e9):
+    """
+    Writes a synthetic sampler.py log of `rows` samples sweeping ppt_values.
+
+    Each PPT step is a warm-up, measurement and cool-down segment like emu.sh
+    produces; the measurement length is chosen so the log has `rows` rows.
+
+    Returns:
+        int: Number of rows written.
+    """
+    from sampler import TimestampFormatter, build_header
+    model = model or ThermalModel()
+    steps = len(ppt_values)
+    measure_s = max(interval_s, rows * interval_s / steps - warmup_s - cooldown_s)
+    header = build_header(True, True, True)
+    binlog = None
+    if binary_log:
+        from binlog import BinaryLogWriter
+        binlog = BinaryLogWriter(binary_log, header, interval_s, True, True, True, fsync_interval_s=None)
+    format_timestamp = TimestampFormatter()
+    written = 0
+    segment = 0
+    ambient = f'{model.ambient_c:.1f}'
+    with open(path, 'w', buffering=1 << 20) as out:
+        out.write(header + '\n')
+        t = start_epoch_s
+        for ppt in ppt_values:
+            for phase, length, power, threads in (('warmup', warmup_s, ppt, '8'), ('measure', measure_s, ppt, '8'),
+                                                  ('cooldown', cooldown_s, model.idle_power_w, '0')):
+                for _ in range(int(round(length / interval_s))):
+                    if written >= rows:
+                        break
+                    model.step(power, interval_s)
+                    temp, measured, rpm = model.observe(power)
+                    temp_text, power_text = f'{temp:.3f}', f'{measured:.3f}'
+                    out.write(f'{format_timestamp(t)},{power_text},{temp_text},{rpm},{ambient},{ppt},{threads},'
+                              f'{segment},{phase}\n')
+                    if binlog is not None:
+                        binlog.append(t, power_text, temp_text, str(rpm), ambient, str(ppt), threads, segment, phase)
+                    t += interval_s
+                    written += 1
+                segment += 1
+    if binlog is not None:
+        binlog.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fake ryzen_monitor / sysfs driven by a first-order RC thermal model.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--state_dir", default=DEFAULT_STATE_DIR,
+                        help="Directory holding the shared PPT state and the fake sysfs tree (sys/).")
+    parser.add_argument("--test-export", dest="export", action="store_true",
+                        help="Stream export lines like 'ryzen_monitor --test-export'.")
+    parser.add_argument("--set-ppt", dest="set_ppt", type=float, default=None,
+                        help="Set the PPT limit (W), like 'ryzen_monitor --set-ppt=N'.")
+    parser.add_argument("--load", choices=["on", "off"], default=None,
+                        help="Whether the CPU is loaded (draws the PPT limit) or idles.")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="Export lines per second.")
+    parser.add_argument("--time_scale", type=float, default=1.0,
+                        help="Simulated seconds per real second.")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Seconds to export for. Omit to run until killed.")
+    parser.add_argument("--cores", type=int, default=4,
+                        help="CPUs in the fake cpufreq tree.")
+    parser.add_argument("--generate_log", metavar="CSV", default=None,
+                        help="Write a synthetic sampler.py log instead (see --rows).")
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="Rows of the generated log.")
+
+    args = parser.parse_args()
+    if args.set_ppt is not None or args.load is not None:
+        changes = {}
+        if args.set_ppt is not None:
+            changes['ppt_w'] = args.set_ppt
+        if args.load is not None:
+            changes['loaded'] = args.load == 'on'
+        write_state(args.state_dir, **changes)
+    if args.generate_log:
+        rows = generate_log(args.generate_log, args.rows)
+        print(f"Wrote {rows} rows to {args.generate_log}")
+    elif args.export:
+        try:
+            run_exporter(args.state_dir, args.rate, args.time_scale, args.duration, cores=args.cores)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,140 +1,137 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.optimize import curve_fit
 
-# Load the processed dataset from the previous step
-# This file should contain the correct column names and calculated Thermal Resistance
+from analysis import load_dataset, DEFAULT_LOG_FILE, ANALYSIS_VERSION, COL_FAN_RPM, COL_RTH
+from cache import AnalysisCache, cached_output
+import fitting
+from fitting import MODELS, FitResult, fit_models
+
+# Bump when the model, fitting or plotting code below changes so cached results are recomputed.
+FIT_VERSION = 3
+
+# Load the log through the shared analysis stage; it derives Thermal Resistance itself,
+# so this no longer depends on data.py having written a processed CSV first.
+# An unchanged log reuses the dataset, fit and plots cached in .analysis_cache/.
+cache = AnalysisCache.from_env()
 try:
-    df_processed = pd.read_csv("cpu_cooling_data_processed.csv")
+    dataset = load_dataset(DEFAULT_LOG_FILE, cache=cache)
 except FileNotFoundError:
-    print("Error: 'cpu_cooling_data_processed.csv' not found. Please ensure the previous analysis step was completed successfully.")
-    # As a fallback for demonstration, if the file is missing, I might need to re-run the data processing from the original file.
-    # For now, I will assume the file exists from the previous successful execution.
-    # If running this step independently, the data loading and prep from the previous step would be needed here.
+    print(f"Error: '{DEFAULT_LOG_FILE}' not found. Please ensure the logger output is in the working directory.")
     raise
 
-# Rename columns for clarity if they are the new ones, or define them if they are the old ones.
-# From the previous successful run, the columns are:
-# 'CPU_Fan_RPM' and 'Thermal_Resistance_Calculated'
-# Check if these columns exist
-expected_rpm_col = 'CPU_Fan_RPM'
-expected_rth_col = 'Thermal_Resistance_Calculated' # This was calculated in the previous step.
-
-# Check if the 'Thermal_Resistance_Calculated' column exists from previous step.
-# If not, we might have 'Thermal_Resistance_Recalculated' or need to handle naming.
-# Let's assume the file "cpu_cooling_data_processed.csv" uses 'Thermal_Resistance_Calculated'
-# and 'CPU_Fan_RPM' as these were the final names used in the previous successful Python script.
-
-if expected_rpm_col not in df_processed.columns or expected_rth_col not in df_processed.columns:
-    print(f"Error: Expected columns '{expected_rpm_col}' or '{expected_rth_col}' not found in 'cpu_cooling_data_processed.csv'.")
-    print(f"Available columns: {df_processed.columns.tolist()}")
-    # Attempt to map from common alternatives if previous step used slightly different naming in output CSV
-    # This is a fallback - ideally the column names are consistent.
-    if 'CPU Fan RPM (RPM)' in df_processed.columns and 'Thermal_Resistance_Recalculated' in df_processed.columns:
-        print("Found alternative column names. Using 'CPU Fan RPM (RPM)' and 'Thermal_Resistance_Recalculated'.")
-        df_processed.rename(columns={
-            'CPU Fan RPM (RPM)': expected_rpm_col,
-            'Thermal_Resistance_Recalculated': expected_rth_col
-        }, inplace=True)
-    elif 'CPU_Fan_RPM' in df_processed.columns and 'Thermal_Resistance_Recalculated' in df_processed.columns: # If my 'Calculated' became 'Recalculated'
-        print("Found alternative column names. Using 'CPU_Fan_RPM' and 'Thermal_Resistance_Recalculated'.")
-        df_processed.rename(columns={
-            'Thermal_Resistance_Recalculated': expected_rth_col
-        }, inplace=True)
-    else:
-        raise KeyError("Could not find suitable columns for RPM and Thermal Resistance in the processed data.")
-
-
-# Prepare data for curve fitting
-x_data = df_processed[expected_rpm_col].values
-y_data = df_processed[expected_rth_col].values
-
-# Sort data by RPM for cleaner plotting
-sort_indices = np.argsort(x_data)
-x_data_sorted = x_data[sort_indices]
-y_data_sorted = y_data[sort_indices]
-
-# Define the physics-based model function
-# R_th(RPM) = R_fixed + C / RPM^n
-def thermal_resistance_model(rpm, r_fixed, c, n):
-    return r_fixed + c / (rpm**n)
-
-# Provide initial guesses and bounds for the parameters
-# R_fixed should be positive, C positive, n likely between 0.1 and 1.0 (common physics suggests 0.5-0.8)
-initial_guesses = [min(y_data_sorted)*0.5, # R_fixed: a bit less than min Rth
-                   (max(y_data_sorted) - min(y_data_sorted)) * (x_data_sorted[len(x_data_sorted)//2]**0.5), # C
-                   0.7] # n
-bounds_lower = [0, 0, 0.1]
-bounds_upper = [max(y_data_sorted), np.inf, 1.5] # Upper bound for n, e.g. 1.5
-
-params = None
-pcov = None
-model_fit_successful = False
+expected_rpm_col = COL_FAN_RPM
+expected_rth_col = COL_RTH
+
+# Raw rows are only plotted; the model is fitted on one steady-state median per
+# (Set_PPT_W, Mprime_Threads) segment, so the transient after each PPT change is left out.
+x_raw_sorted, y_raw_sorted = dataset.sorted_fit_arrays()
+segment_summary = dataset.segment_summary()
+steady_rows = int(segment_summary['Steady_Samples'].sum())
+print(f"Steady-state rows: {steady_rows} of {len(dataset)} ({steady_rows / max(len(dataset), 1):.1%}); "
+      f"{int(segment_summary['Usable'].sum())} of {len(segment_summary)} segments usable for fitting.")
+
+# Prepare data for curve fitting, sorted by RPM for cleaner plotting
+x_data_sorted, y_data_sorted = dataset.segment_fit_arrays()
+
+# Candidate models live in fitting.py (R_fixed + C / RPM^n, exponential variants, ...).
+# Each is fitted from several starts, bootstrapped for confidence intervals on its
+# parameters across all cores, and the best one is chosen by the information criterion.
+FIT_MODELS = None # None = every model registered in fitting.MODELS
+FIT_CRITERION = 'aic' # or 'bic'
+FIT_STARTS = 16 # random starts per model, in addition to its data-derived guess
+FIT_BOOTSTRAP_SAMPLES = 1000
+FIT_SEED = 0
+
+# The fitting engine's own source is part of the key, so editing a model in fitting.py refits.
+fit_key = AnalysisCache.key('fit.py', FIT_VERSION, ANALYSIS_VERSION, dataset.cache_key,
+                           cache.file_digest(fitting.__file__) if cache is not None else '',
+                           FIT_MODELS or sorted(MODELS), FIT_CRITERION, FIT_STARTS, FIT_BOOTSTRAP_SAMPLES, FIT_SEED)
+
+
+def run_fits():
+    """Fits the models; a failure is returned (not raised) so it can be cached too."""
+    try:
+        best, results = fit_models(x_data_sorted, y_data_sorted, model_names=FIT_MODELS, criterion=FIT_CRITERION,
+                                   n_starts=FIT_STARTS, n_boot=FIT_BOOTSTRAP_SAMPLES, seed=FIT_SEED)
+        return {'best': best, 'results': results}
+    except RuntimeError as e:
+        return {'error': str(e)}
+    except ValueError as e:
+        return {'error': f"ValueError during curve fitting: {e}"}
+
 
-try:
-    params, pcov = curve_fit(thermal_resistance_model,
-                             x_data_sorted, y_data_sorted,
-                             p0=initial_guesses,
-                             bounds=(bounds_lower, bounds_upper),
-                             maxfev=5000) # Increased max function evaluations
-    r_fixed_fit, c_fit, n_fit = params
-    model_fit_successful = True
-    print("\nFitted Model Parameters:")
-    print(f"  R_fixed = {r_fixed_fit:.4f} °C/W")
-    print(f"  C = {c_fit:.4f}")
-    print(f"  n = {n_fit:.4f}")
-
-    # Calculate y_model using the fitted parameters
-    y_model = thermal_resistance_model(x_data_sorted, r_fixed_fit, c_fit, n_fit)
-
-except RuntimeError:
-    print("\nCould not fit the model. Optimal parameters not found with current settings/initial guesses.")
-    print("This can happen if the data doesn't conform well to the model or if initial guesses/bounds are too far off.")
+fit_result = cache.get(fit_key) if cache is not None else None
+if fit_result is None:
+    fit_result = run_fits()
+    if cache is not None:
+        cache.put(fit_key, fit_result)
+
+best_fit = fit_result.get('best')
+model_fit_successful = best_fit is not None
+
+if model_fit_successful:
+    print(f"\nModel comparison ({FIT_CRITERION.upper()}, lower is better; {len(x_data_sorted)} points):")
+    for name, result in fit_result['results'].items():
+        if isinstance(result, FitResult):
+            print(f"  {name:<22} AIC = {result.aic:9.2f}  BIC = {result.bic:9.2f}  "
+                  f"SSE = {result.sse:.5f}  ({result.starts_converged}/{result.starts} starts converged)")
+        else:
+            print(f"  {name:<22} failed: {result}")
+
+    print(f"\nFitted Model Parameters ({best_fit.model_name}; {best_fit.confidence:.0%} bootstrap CI from "
+          f"{best_fit.bootstrap_converged}/{best_fit.bootstrap_samples} resamples):")
+    for i, (name, value) in enumerate(best_fit.param_dict().items()):
+        ci = "" if best_fit.ci_low is None else f"  [{best_fit.ci_low[i]:.4f}, {best_fit.ci_high[i]:.4f}]"
+        print(f"  {name} = {value:.4f}{' °C/W' if name == 'R_fixed' else ''}{ci}")
+
+    # Calculate y_model using the fitted parameters, on a dense RPM grid for smooth curves
+    x_model = np.linspace(min(x_data_sorted), max(x_data_sorted), 500)
+    y_model = best_fit.predict(x_model)
+
+else:
+    print(f"\nCould not fit any model: {fit_result['error']}")
+    print("This can happen if the data doesn't conform well to the models or if the bounds are too far off.")
     print("Proceeding with visualization of raw data only.")
-except ValueError as e:
-    print(f"\nValueError during curve fitting: {e}")
-    print("This might be due to incompatible bounds or initial guesses. Proceeding with raw data viz.")
 
 
 # Plotting the experimental data and the fitted model
-plt.figure(figsize=(12, 7))
-plt.scatter(x_data_sorted, y_data_sorted, label='Experimental Data', alpha=0.6, s=30, color='skyblue')
+def plot_model_fit():
+    plt.figure(figsize=(12, 7))
+    plt.scatter(x_raw_sorted, y_raw_sorted, label='Experimental Data', alpha=0.3, s=15, color='skyblue')
+    plt.scatter(x_data_sorted, y_data_sorted, label='Steady-State Segment Medians', s=40, color='navy')
+
+    if model_fit_successful:
+        plt.plot(x_model, y_model, color='red', linewidth=2.5, label=f'Fitted Model: {best_fit.label()}')
+
+    plt.title('Thermal Resistance vs. CPU Fan RPM with Fitted Model', fontsize=16)
+    plt.xlabel(f'{expected_rpm_col.replace("_", " ")} (RPM)', fontsize=14)
+    plt.ylabel(f'{expected_rth_col.replace("_", " ")} (°C/W)', fontsize=14) # Used expected_rth_col for consistency
+    plt.legend(fontsize=12)
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig("thermal_resistance_model_fit.png")
+    # plt.show() # Not needed if saving
 
-if model_fit_successful:
-    plt.plot(x_data_sorted, y_model, color='red', linewidth=2.5, label=f'Fitted Model: $R_{{th}} = {r_fixed_fit:.3f} + {c_fit:.0f} / RPM^{{{n_fit:.3f}}}$')
 
-plt.title('Thermal Resistance vs. CPU Fan RPM with Fitted Model', fontsize=16)
-plt.xlabel(f'{expected_rpm_col.replace("_", " ")} (RPM)', fontsize=14)
-plt.ylabel(f'{expected_rth_col.replace("_", " ")} (°C/W)', fontsize=14) # Used expected_rth_col for consistency
-plt.legend(fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.savefig("thermal_resistance_model_fit.png")
-# plt.show() # Not needed if saving
+cached_output(cache, AnalysisCache.key(fit_key, "thermal_resistance_model_fit.png"),
+              "thermal_resistance_model_fit.png", plot_model_fit)
 
 if model_fit_successful:
     # Discussion of the "Sweet Spot"
     # The "sweet spot" is where the rate of change of R_th starts to diminish significantly.
-    # We can look at the derivative of the fitted model: d(R_th)/d(RPM) = -n * C * RPM^(-n-1)
-    # Let's calculate this derivative
-    derivative_r_th = -n_fit * c_fit * (x_data_sorted**(-n_fit - 1))
+    # We can look at the derivative of the fitted model, e.g. d(R_th)/d(RPM) = -n * C * RPM^(-n-1) for the power law.
+    # Let's calculate this derivative numerically, so it works for whichever model was selected
+    derivative_r_th = np.gradient(y_model, x_model)
 
-    plt.figure(figsize=(12, 7))
-    plt.plot(x_data_sorted, derivative_r_th, color='green', linewidth=2, label='$dR_{th}/d(RPM)$')
-    plt.title('Derivative of Thermal Resistance vs. CPU Fan RPM', fontsize=16)
-    plt.xlabel(f'{expected_rpm_col.replace("_", " ")} (RPM)', fontsize=14)
-    plt.ylabel('Rate of Change of $R_{th}$ ($°C \cdot W^{-1} \cdot RPM^{-1}$)', fontsize=14)
-    plt.axhline(0, color='black', linewidth=0.5, linestyle='--') # Reference line
     # Highlight a potential "sweet spot" range - e.g., where the derivative becomes less steep
     # This is somewhat subjective without a clear cost function for RPM (noise, power)
     # For example, find where the derivative is, say, 10% or 20% of its maximum absolute value near low RPMs.
+    potential_sweet_spot_rpm = None
     try:
-        max_abs_derivative_low_rpm = np.abs(derivative_r_th[x_data_sorted < (min(x_data_sorted) + 0.2*(max(x_data_sorted)-min(x_data_sorted)))]).max() # Max derivative in first 20% of RPM range
+        max_abs_derivative_low_rpm = np.abs(derivative_r_th[x_model < (min(x_model) + 0.2*(max(x_model)-min(x_model)))]).max() # Max derivative in first 20% of RPM range
         sweet_spot_threshold_derivative = -0.1 * max_abs_derivative_low_rpm # e.g. 10% of max change
-        potential_sweet_spot_rpm = x_data_sorted[derivative_r_th < sweet_spot_threshold_derivative][-1] # Last RPM before derivative gets too flat
-        plt.axvline(potential_sweet_spot_rpm, color='orange', linestyle='--', label=f'Potential Sweet Spot Zone (RPM > {potential_sweet_spot_rpm:.0f})')
+        potential_sweet_spot_rpm = x_model[derivative_r_th < sweet_spot_threshold_derivative][-1] # Last RPM before derivative gets too flat
         print(f"\nPotential 'sweet spot' discussion:")
         print(f"  The rate of reduction in thermal resistance diminishes as RPM increases.")
         print(f"  A potential sweet spot might be considered around {potential_sweet_spot_rpm:.0f} RPM,")
@@ -146,12 +143,23 @@ if model_fit_successful:
     except Exception as e:
         print(f"\nError during sweet spot analysis: {e}")
 
-
-    plt.legend(fontsize=12)
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    plt.savefig("thermal_resistance_derivative.png")
-    # plt.show()
+    def plot_derivative():
+        plt.figure(figsize=(12, 7))
+        plt.plot(x_model, derivative_r_th, color='green', linewidth=2, label='$dR_{th}/d(RPM)$')
+        plt.title('Derivative of Thermal Resistance vs. CPU Fan RPM', fontsize=16)
+        plt.xlabel(f'{expected_rpm_col.replace("_", " ")} (RPM)', fontsize=14)
+        plt.ylabel('Rate of Change of $R_{th}$ ($°C \cdot W^{-1} \cdot RPM^{-1}$)', fontsize=14)
+        plt.axhline(0, color='black', linewidth=0.5, linestyle='--') # Reference line
+        if potential_sweet_spot_rpm is not None:
+            plt.axvline(potential_sweet_spot_rpm, color='orange', linestyle='--', label=f'Potential Sweet Spot Zone (RPM > {potential_sweet_spot_rpm:.0f})')
+        plt.legend(fontsize=12)
+        plt.grid(True, linestyle='--', alpha=0.7)
+        plt.tight_layout()
+        plt.savefig("thermal_resistance_derivative.png")
+        # plt.show()
+
+    cached_output(cache, AnalysisCache.key(fit_key, "thermal_resistance_derivative.png"),
+                  "thermal_resistance_derivative.png", plot_derivative)
 
 print("\nModel fitting and sweet spot analysis complete.")
 print("Plots saved as 'thermal_resistance_model_fit.png' and 'thermal_resistance_derivative.png'.")
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Fitting engine for the R_th(RPM) cooling models (used by fit.py).
+
+Models are registered by name in MODELS; each knows its parameter names, how
+to guess a starting point and bounds from the data, and how to label itself in
+a plot. For every model the engine
+
+    1. runs a multi-start least-squares fit (the data-derived guess plus random
+       starts inside the bounds) and keeps the lowest residual,
+    2. bootstraps the fit by resampling (rpm, rth) pairs to get percentile
+       confidence intervals for each parameter,
+    3. scores it with AIC/BIC so the best-supported model can be chosen.
+
+Starts and bootstrap replicates are farmed out to a process pool in fixed-size
+chunks, each with its own child of one numpy SeedSequence, so results are
+identical for a given seed no matter how many workers run them.
+"""
+import math
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+BOOTSTRAP_CHUNK = 50
+START_CHUNK = 8
+
+
+def power_law(rpm, r_fixed, c, n):
+    """R_th(RPM) = R_fixed + C / RPM^n"""
+    return r_fixed + c / (rpm**n)
+
+
+def exponential(rpm, r_fixed, a, rpm0):
+    """R_th(RPM) = R_fixed + A * exp(-RPM / RPM0)"""
+    return r_fixed + a * np.exp(-rpm / rpm0)
+
+
+def stretched_exponential(rpm, r_fixed, a, rpm0, beta):
+    """R_th(RPM) = R_fixed + A * exp(-(RPM / RPM0)^beta)"""
+    return r_fixed + a * np.exp(-(rpm / rpm0)**beta)
+
+
+def _power_law_guess(x, y):
+    # R_fixed a bit less than the lowest R_th, C from the spread at the median RPM, n from common physics (0.5-0.8).
+    return [min(y) * 0.5, (max(y) - min(y)) * (x[len(x) // 2]**0.5), 0.7]
+
+
+def _power_law_bounds(x, y):
+    return [0, 0, 0.1], [max(y), np.inf, 1.5]
+
+
+def _exponential_guess(x, y):
+    rpm0 = float(np.median(x))
+    return [min(y) * 0.9, (max(y) - min(y)) * math.exp(min(x) / rpm0), rpm0]
+
+
+def _exponential_bounds(x, y):
+    return [0, 0, 1.0], [max(y), np.inf, 100.0 * max(x)]
+
+
+def _stretched_exponential_guess(x, y):
+    return _exponential_guess(x, y) + [1.0]
+
+
+def _stretched_exponential_bounds(x, y):
+    lower, upper = _exponential_bounds(x, y)
+    return lower + [0.1], upper + [5.0]
+
+
+@dataclass(frozen=True)
+class Model:
+    """A fittable R_th(RPM) model."""
+    name: str
+    func: object
+    param_names: tuple
+    initial_guess: object  # (x, y) -> list of starting values
+    bounds: object  # (x, y) -> (lower list, upper list)
+    label: str  # format string over the parameter names, for plot legends
+
+
+MODELS = {}
+
+
+def register_model(model):
+    """
+    Adds a model to the registry (replacing one with the same name) and returns it.
+
+    Register models at import time of a module, so pool worker processes see them too.
+    """
+    MODELS[model.name] = model
+    return model
+
+
+register_model(Model('power_law', power_law, ('R_fixed', 'C', 'n'), _power_law_guess, _power_law_bounds,
+                     '$R_{{th}} = {R_fixed:.3f} + {C:.0f} / RPM^{{{n:.3f}}}$'))
+register_model(Model('exponential', exponential, ('R_fixed', 'A', 'RPM0'), _exponential_guess, _exponential_bounds,
+                     '$R_{{th}} = {R_fixed:.3f} + {A:.3f} e^{{-RPM/{RPM0:.0f}}}$'))
+register_model(Model('stretched_exponential', stretched_exponential, ('R_fixed', 'A', 'RPM0', 'beta'),
+                     _stretched_exponential_guess, _stretched_exponential_bounds,
+                     '$R_{{th}} = {R_fixed:.3f} + {A:.3f} e^{{-(RPM/{RPM0:.0f})^{{{beta:.2f}}}}}$'))
+
+
+@dataclass
+class FitResult:
+    """Best multi-start fit of one model plus its bootstrap confidence intervals."""
+    model_name: str
+    params: np.ndarray
+    pcov: np.ndarray
+    sse: float
+    n_points: int
+    starts: int
+    starts_converged: int
+    aic: float = math.nan
+    bic: float = math.nan
+    confidence: float = 0.95
+    ci_low: np.ndarray = None
+    ci_high: np.ndarray = None
+    bootstrap_samples: int = 0
+    bootstrap_converged: int = 0
+
+    @property
+    def model(self):
+        return MODELS[self.model_name]
+
+    def param_dict(self):
+        return dict(zip(self.model.param_names, self.params))
+
+    def predict(self, rpm):
+        return self.model.func(rpm, *self.params)
+
+    def label(self):
+        return self.model.label.format(**self.param_dict())
+
+
+def information_criteria(sse, n_points, n_params):
+    """
+    AIC and BIC of a least-squares fit with Gaussian errors.
+
+    Returns:
+        tuple: (aic, bic); both are only meaningful relative to other models on the same data.
+    """
+    if n_points == 0 or sse <= 0:
+        return -math.inf, -math.inf
+    log_likelihood_term = n_points * math.log(sse / n_points)
+    return log_likelihood_term + 2 * n_params, log_likelihood_term + n_params * math.log(n_points)
+
+
+def _fit_once(model, x, y, p0, bounds, maxfev):
+    """One curve_fit. Returns (params, pcov, sse) or None if it failed."""
+    try:
+        params, pcov = curve_fit(model.func, x, y, p0=p0, bounds=bounds, maxfev=maxfev)
+    except (RuntimeError, ValueError):
+        return None
+    residuals = y - model.func(x, *params)
+    sse = float(np.dot(residuals, residuals))
+    if not math.isfinite(sse):
+        return None
+    return params, pcov, sse
+
+
+def _fit_starts(model_name, x, y, starts, bounds, maxfev):
+    """Worker: fits from each start, returns the best (params, pcov, sse) and how many converged."""
+    model = MODELS[model_name]
+    best = None
+    converged = 0
+    for p0 in starts:
+        fit = _fit_once(model, x, y, p0, bounds, maxfev)
+        if fit is None:
+            continue
+        converged += 1
+        if best is None or fit[2] < best[2]:
+            best = fit
+    return best, converged
+
+
+def _bootstrap_chunk(model_name, x, y, p0, bounds, maxfev, seed_sequence, replicates):
+    """Worker: refits `replicates` resamples of (x, y); failed refits are rows of NaN."""
+    model = MODELS[model_name]
+    rng = np.random.default_rng(seed_sequence)
+    out = np.full((replicates, len(p0)), np.nan)
+    for i in range(replicates):
+        idx = rng.integers(0, len(x), len(x))
+        fit = _fit_once(model, x[idx], y[idx], p0, bounds, maxfev)
+        if fit is not None:
+            out[i] = fit[0]
+    return out
+
+
+def _random_starts(rng, guess, lower, upper, count):
+    """
+    Random starting points inside the bounds.
+
+    Uniform within narrow finite bounds, log-uniform within positive bounds spanning
+    more than two decades, and log-uniform over 1e-2..1e2 x the guess where a bound
+    is infinite.
+    """
+    guess = np.clip(np.asarray(guess, dtype=float), lower, upper)
+    starts = np.empty((count, len(guess)))
+    for j, (g, lo, hi) in enumerate(zip(guess, lower, upper)):
+        if lo > 0 and math.isfinite(hi) and hi / lo > 100:
+            starts[:, j] = np.exp(rng.uniform(math.log(lo), math.log(hi), count))
+        elif math.isfinite(lo) and math.isfinite(hi):
+            starts[:, j] = rng.uniform(lo, hi, count)
+        else:
+            scale = abs(g) if g != 0 else 1.0
+            starts[:, j] = np.clip(scale * 10.0**rng.uniform(-2, 2, count), lo, hi)
+    return starts
+
+
+def _bounds(model, x, y):
+    return tuple(np.asarray(b, dtype=float) for b in model.bounds(x, y))
+
+
+def _model_seeds(seed, model_name):
+    """(start, bootstrap) seed sequences; keyed on the model name so other models do not shift them."""
+    return np.random.SeedSequence([seed, zlib.crc32(model_name.encode())]).spawn(2)
+
+
+def _map(executor, fn, arg_lists):
+    if executor is None:
+        return [fn(*args) for args in arg_lists]
+    return list(executor.map(fn, *zip(*arg_lists)))
+
+
+def fit_model(model, x, y, n_starts=16, n_boot=1000, confidence=0.95, seed=0, maxfev=5000, executor=None):
+    """
+    Multi-start fit of one model with bootstrap confidence intervals.
+
+    Args:
+        model (Model or str): Model or registered model name.
+        x (np.ndarray): Fan RPM.
+        y (np.ndarray): Thermal resistance (°C/W).
+        n_starts (int): Random starts in addition to the model's own initial guess.
+        n_boot (int): Bootstrap replicates (0 = no confidence intervals).
+        confidence (float): Confidence level of the percentile intervals.
+        seed (int): Seed for the random starts and resampling.
+        maxfev (int): curve_fit's maximum function evaluations per fit.
+        executor (concurrent.futures.Executor): Pool to run fits in, or None to run in process.
+
+    Returns:
+        FitResult: The best fit.
+
+    Raises:
+        RuntimeError: If no start converged.
+    """
+    model = MODELS[model] if isinstance(model, str) else model
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lower, upper = _bounds(model, x, y)
+    guess = np.clip(np.asarray(model.initial_guess(x, y), dtype=float), lower, upper)
+    start_seed, _ = _model_seeds(seed, model.name)
+    starts = np.vstack([guess, _random_starts(np.random.default_rng(start_seed), guess, lower, upper, n_starts)])
+
+    chunks = [(model.name, x, y, starts[i:i + START_CHUNK], (lower, upper), maxfev)
+              for i in range(0, len(starts), START_CHUNK)]
+    best = None
+    converged = 0
+    for fit, count in _map(executor, _fit_starts, chunks):
+        converged += count
+        if fit is not None and (best is None or fit[2] < best[2]):
+            best = fit
+    if best is None:
+        raise RuntimeError(f"{model.name}: none of the {len(starts)} starts converged")
+    params, pcov, sse = best
+    aic, bic = information_criteria(sse, len(x), len(params))
+    result = FitResult(model.name, params, pcov, sse, len(x), len(starts), converged, aic, bic, confidence)
+    if n_boot > 0:
+        bootstrap_fit(result, x, y, n_boot, confidence, seed, maxfev, executor)
+    return result
+
+
+def bootstrap_fit(result, x, y, n_boot=1000, confidence=0.95, seed=0, maxfev=5000, executor=None):
+    """
+    Adds percentile confidence intervals to a fit by refitting resampled (x, y) pairs.
+
+    Each replicate starts from the fitted parameters. Arguments are as for fit_model;
+    result is updated in place and returned.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lower, upper = _bounds(result.model, x, y)
+    _, boot_seed = _model_seeds(seed, result.model_name)
+    chunk_sizes = [min(BOOTSTRAP_CHUNK, n_boot - i) for i in range(0, n_boot, BOOTSTRAP_CHUNK)]
+    seeds = boot_seed.spawn(len(chunk_sizes))
+    samples = np.vstack(_map(executor, _bootstrap_chunk,
+                             [(result.model_name, x, y, result.params, (lower, upper), maxfev, s, size)
+                              for s, size in zip(seeds, chunk_sizes)]))
+    ok = np.all(np.isfinite(samples), axis=1)
+    result.confidence = confidence
+    result.bootstrap_samples = n_boot
+    result.bootstrap_converged = int(ok.sum())
+    if ok.any():
+        tail = 100.0 * (1.0 - confidence) / 2.0
+        result.ci_low, result.ci_high = np.percentile(samples[ok], [tail, 100.0 - tail], axis=0)
+    return result
+
+
+def fit_models(x, y, model_names=None, criterion='aic', n_starts=16, n_boot=1000, confidence=0.95,
+               seed=0, maxfev=5000, workers=None, bootstrap_all=False):
+    """
+    Fits several registered models and picks the best one by AIC or BIC.
+
+    Only the selected model is bootstrapped unless bootstrap_all is set, since the
+    resampling costs n_boot fits per model.
+
+    Args:
+        x (np.ndarray): Fan RPM.
+        y (np.ndarray): Thermal resistance (°C/W).
+        model_names (list): Registered model names to try; None tries all of them.
+        criterion (str): 'aic' or 'bic'.
+        n_starts, n_boot, confidence, seed, maxfev: See fit_model.
+        workers (int): Worker processes; None uses every core, 1 runs in process.
+        bootstrap_all (bool): Also compute confidence intervals for the models not selected.
+
+    Returns:
+        tuple: (best FitResult, dict of model name -> FitResult or the error message).
+
+    Raises:
+        RuntimeError: If no model could be fitted.
+    """
+    if criterion not in ('aic', 'bic'):
+        raise ValueError(f"criterion must be 'aic' or 'bic', got '{criterion}'")
+    model_names = list(model_names or MODELS)
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    if workers > 1:
+        # Forked workers inherit the registry and do not re-run the calling script (fit.py is a flat script).
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork') if 'fork' in methods else None
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    results = {}
+    try:
+        for name in model_names:
+            try:
+                results[name] = fit_model(name, x, y, n_starts, n_boot if bootstrap_all else 0,
+                                          confidence, seed, maxfev, executor)
+            except RuntimeError as e:
+                results[name] = str(e)
+        fitted = [r for r in results.values() if isinstance(r, FitResult)]
+        if not fitted:
+            raise RuntimeError("no model could be fitted: " + "; ".join(results.values()))
+        best = min(fitted, key=lambda r: getattr(r, criterion))
+        if n_boot > 0 and not bootstrap_all:
+            bootstrap_fit(best, x, y, n_boot, confidence, seed, maxfev, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return best, results
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Live dashboard feed for index.html, fed by the log sampler.py is writing.
+
+The server follows the CSV (only the bytes appended since the last poll are
+read) and serves index.html (plus the two data files its other tabs fetch,
+STATIC_FILES) next to three endpoints; nothing else under the directory is exposed:
+
+    /live/info       file name, row count and columns
+    /live/snapshot   the whole log so far, pre-aggregated (?points=N)
+    /live/events     Server-Sent Events: a `snapshot` event on connect, then a
+                     `samples` event with the new rows of every poll
+
+The history is kept as per-bucket min/max/mean aggregates of each column; the
+bucket width doubles whenever there would be more than max_buckets, so memory
+and snapshot size stay bounded however long the log grows. A snapshot is a
+Largest-Triangle-Three-Buckets (LTTB) line of the bucket means plus a min/max
+band, and a catch-up batch with more than max_batch_points rows is LTTB
+downsampled too, so the page only ever appends a few hundred points per update
+and never parses the raw log.
+
+    python3 livefeed.py cpu_cooling_data_controlled.csv --port 8765
+    # then open http://127.0.0.1:8765/index.html (Live tab)
+
+Only the standard library is used, so it runs on the logging host next to sampler.py.
+"""
+import argparse
+import json
+import math
+import mimetypes
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# The only files served from static_dir: the page and what its other tabs fetch.
+STATIC_FILES = ('index.html', 'cpu_cooling_data_processed.csv', 'exp.md')
+SERIES = ('CPU_Temp_C', 'CPU_Power_W_Actual', 'CPU_Fan_RPM', 'Set_PPT_W', 'Ambient_Temp_C')
+DEFAULT_POINTS = 1500
+MAX_POINTS = 20000
+# Bytes parsed per poll, so a long backlog is loaded in steps that do not hold the lock for long.
+READ_CHUNK_BYTES = 4 << 20
+
+
+def lttb(xs, ys, threshold):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps out of (xs, ys).
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = a + 1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+class BucketHistory:
+    """
+    Min/max/mean of each column per time bucket, at a bucket width that doubles as the log grows.
+
+    Adding a sample is O(1) (amortized: coarsening merges neighbouring buckets
+    pairwise and happens once per doubling of the log's duration).
+    """
+
+    def __init__(self, columns, max_buckets=4096, initial_bucket_s=0.1):
+        self.columns = list(columns)
+        self.max_buckets = max_buckets
+        self.bucket_s = initial_bucket_s
+        self.origin = None
+        self.t_end = None
+        self.keys = []
+        self.stats = [([], [], [], []) for _ in self.columns]  # per column: count, sum, min, max
+
+    def add(self, t, values):
+        if self.origin is None:
+            self.origin = t
+        self.t_end = t
+        key = max(0, int((t - self.origin) // self.bucket_s))
+        if not self.keys or key > self.keys[-1]:
+            self.keys.append(key)
+            for count, total, lo, hi in self.stats:
+                count.append(0)
+                total.append(0.0)
+                lo.append(math.inf)
+                hi.append(-math.inf)
+        for (count, total, lo, hi), value in zip(self.stats, values):
+            if value is None:
+                continue
+            count[-1] += 1
+            total[-1] += value
+            if value < lo[-1]:
+                lo[-1] = value
+            if value > hi[-1]:
+                hi[-1] = value
+        if len(self.keys) > self.max_buckets:
+            self._coarsen()
+
+    def _coarsen(self):
+        self.bucket_s *= 2
+        merged_keys = []
+        merged = [([], [], [], []) for _ in self.columns]
+        for i, key in enumerate(self.keys):
+            new_key = key // 2
+            append = not merged_keys or merged_keys[-1] != new_key
+            if append:
+                merged_keys.append(new_key)
+            for (count, total, lo, hi), (m_count, m_total, m_lo, m_hi) in zip(self.stats, merged):
+                if append:
+                    m_count.append(count[i])
+                    m_total.append(total[i])
+                    m_lo.append(lo[i])
+                    m_hi.append(hi[i])
+                else:
+                    m_count[-1] += count[i]
+                    m_total[-1] += total[i]
+                    m_lo[-1] = min(m_lo[-1], lo[i])
+                    m_hi[-1] = max(m_hi[-1], hi[i])
+        self.keys = merged_keys
+        self.stats = merged
+
+    def snapshot(self, points):
+        """
+        The history as at most `points` points per column.
+
+        Returns:
+            dict: column -> {'t', 'y'} (LTTB line of the bucket means) and
+                  {'band_t', 'min', 'max'} (envelope of groups of buckets).
+        """
+        series = {}
+        for name, (count, total, lo, hi) in zip(self.columns, self.stats):
+            filled = [i for i, c in enumerate(count) if c]
+            if not filled:
+                continue
+            t = [self.origin + (self.keys[i] + 0.5) * self.bucket_s for i in filled]
+            mean = [total[i] / count[i] for i in filled]
+            kept = lttb(t, mean, points)
+            group = max(1, math.ceil(len(filled) / points))
+            band_t, band_min, band_max = [], [], []
+            for start in range(0, len(filled), group):
+                members = filled[start:start + group]
+                band_t.append(t[start])
+                band_min.append(min(lo[i] for i in members))
+                band_max.append(max(hi[i] for i in members))
+            series[name] = {'t': [t[i] for i in kept], 'y': [mean[i] for i in kept],
+                            'band_t': band_t, 'min': band_min, 'max': band_max}
+        return series
+
+
+class _TimestampParser:
+    """
+    Inverse of sampler.TimestampFormatter: 'YYYY-mm-dd HH:MM:SS.mmm' local time to epoch seconds.
+
+    mktime runs once per hour of log; minutes, seconds and milliseconds are added arithmetically.
+    """
+
+    def __init__(self):
+        self._hour_prefix = None
+        self._hour_epoch = 0.0
+
+    def __call__(self, text):
+        hour_prefix = text[:13]
+        if hour_prefix != self._hour_prefix:
+            if len(text) < 19 or text[4] != '-' or text[10] != ' ':
+                raise ValueError(f"unexpected timestamp '{text}'")
+            self._hour_epoch = time.mktime((int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]),
+                                            0, 0, 0, 0, -1))
+            self._hour_prefix = hour_prefix
+        return self._hour_epoch + int(text[14:16]) * 60 + float(text[17:])
+
+
+def _number(text):
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+class _Subscription(queue.Queue):
+    """Event queue of one /live/events client; `dropped` once LiveLog gave up on it."""
+    dropped = False
+
+
+class LiveLog:
+    """
+    Follows a growing sampler.py CSV and fans new rows out to subscribers.
+
+    A truncated or replaced file (a new run with --write_header) starts the
+    history over and sends subscribers a `reset`.
+    """
+
+    def __init__(self, path, max_buckets=4096, max_batch_points=500, poll_s=0.5):
+        self.path = path
+        self.max_buckets = max_buckets
+        self.max_batch_points = max_batch_points
+        self.poll_s = poll_s
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self._stop = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.rows = 0
+        self.header = None
+        self.columns = []
+        self.history = None
+        self._indices = []
+        self._offset = 0
+        self._partial = b''
+        self._inode = None
+        self._parse_timestamp = _TimestampParser()
+
+    def info(self):
+        with self.lock:
+            return {'file': os.path.basename(self.path), 'rows': self.rows, 'columns': self.columns,
+                    'bucket_s': self.history.bucket_s if self.history else None}
+
+    def snapshot(self, points):
+        with self.lock:
+            return self._snapshot_locked(points)
+
+    def _snapshot_locked(self, points):
+        if self.history is None:
+            return {'file': os.path.basename(self.path), 'rows': 0, 't_end': None, 'bucket_s': None, 'series': {}}
+        return {'file': os.path.basename(self.path), 'rows': self.rows, 't_end': self.history.t_end,
+                'bucket_s': self.history.bucket_s, 'series': self.history.snapshot(points)}
+
+    def subscribe(self, points):
+        """Registers a subscriber. Returns (queue, snapshot), consistent with the batches queued after it."""
+        q = _Subscription(maxsize=256)
+        with self.lock:
+            self.subscribers.add(q)
+            return q, self._snapshot_locked(points)
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def _publish(self, event, payload):
+        # Called with the lock held. A subscriber that fell this far behind is dropped and
+        # marked so its handler ends the response; the EventSource then reconnects and
+        # starts from a fresh snapshot.
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait((event, payload))
+            except queue.Full:
+                self.subscribers.discard(q)
+                q.dropped = True
+
+    def _read_new_bytes(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return b''
+        if self._inode is not None and (st.st_ino != self._inode or st.st_size < self._offset):
+            with self.lock:
+                self._reset()
+                self._publish('reset', {})
+        self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return b''
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(min(st.st_size - self._offset, READ_CHUNK_BYTES))
+        self._offset += len(data)
+        return data
+
+    def _start_header(self, line):
+        self.header = line.split(',')
+        self.columns = [name for name in SERIES if name in self.header]
+        self._indices = [self.header.index(name) for name in self.columns]
+        self.history = BucketHistory(self.columns, self.max_buckets)
+
+    def poll(self):
+        """Parses the rows appended since the last poll into the history and one `samples` event."""
+        data = self._read_new_bytes()  # may start the history over, dropping the old partial line
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        if not lines:
+            return 0
+        rows = 0
+        batch_t = []
+        batch_values = []
+        with self.lock:
+            publish = bool(self.subscribers)
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', 'replace').strip()
+                if not line:
+                    continue
+                if self.header is None:
+                    self._start_header(line)
+                    continue
+                fields = line.split(',')
+                if len(fields) != len(self.header):
+                    continue
+                try:
+                    t = self._parse_timestamp(fields[0])
+                except ValueError:
+                    continue
+                values = [_number(fields[i]) for i in self._indices]
+                self.history.add(t, values)
+                rows += 1
+                if publish:
+                    batch_t.append(t)
+                    batch_values.append(values)
+            self.rows += rows
+            if batch_t:
+                self._publish('samples', self._batch(batch_t, batch_values))
+        return rows
+
+    def _batch(self, batch_t, batch_values):
+        series = {}
+        for column_index, name in enumerate(self.columns):
+            t = [ts for ts, values in zip(batch_t, batch_values) if values[column_index] is not None]
+            y = [values[column_index] for values in batch_values if values[column_index] is not None]
+            if not t:
+                continue
+            if len(t) > self.max_batch_points:
+                kept = lttb(t, y, self.max_batch_points)
+                t, y = [t[i] for i in kept], [y[i] for i in kept]
+            series[name] = {'t': t, 'y': y}
+        return {'rows': self.rows, 'series': series}
+
+    def run(self):
+        while not self._stop.is_set():
+            if self.poll() == 0:  # no waiting while there is a backlog
+                self._stop.wait(self.poll_s)
+
+    def stop(self):
+        self._stop.set()
+
+
+def _make_handler(live, static_dir, default_points):
+    class LiveFeedHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _points(self, query):
+            try:
+                return min(MAX_POINTS, max(3, int(query.get('points', [default_points])[0])))
+            except ValueError:
+                return default_points
+
+        def _send_json(self, payload):
+            body = json.dumps(payload, separators=(',', ':')).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_static(self, name, head_only=False):
+            try:
+                with open(os.path.join(static_dir, name), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(body)
+
+        def _static_name(self, path):
+            name = 'index.html' if path == '/' else path.lstrip('/')
+            return name if name in STATIC_FILES else None
+
+        def _send_event(self, event, payload):
+            self.wfile.write(f'event: {event}\ndata: {json.dumps(payload, separators=(",", ":"))}\n\n'.encode())
+            self.wfile.flush()
+
+        def _stream_events(self, points):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            q, snapshot = live.subscribe(points)
+            try:
+                self._send_event('snapshot', snapshot)
+                while True:
+                    try:
+                        event, payload = q.get(timeout=15.0)
+                    except queue.Empty:
+                        event = None
+                    if q.dropped:
+                        return  # batches were lost; closing makes the browser reconnect for a fresh snapshot
+                    if event is None:
+                        self.wfile.write(b': keep-alive\n\n')
+                        self.wfile.flush()
+                        continue
+                    if event == 'reset':
+                        payload = live.snapshot(points)
+                        event = 'snapshot'
+                    self._send_event(event, payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                live.unsubscribe(q)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == '/live/info':
+                self._send_json(live.info())
+            elif url.path == '/live/snapshot':
+                self._send_json(live.snapshot(self._points(query)))
+            elif url.path == '/live/events':
+                self._stream_events(self._points(query))
+            elif self._static_name(url.path):
+                self._send_static(self._static_name(url.path))
+            else:
+                self.send_error(404)
+
+        def do_HEAD(self):
+            name = self._static_name(urlparse(self.path).path)
+            if name:
+                self._send_static(name, head_only=True)
+            else:
+                self.send_error(404)
+
+    return LiveFeedHandler
+
+
+def serve(path, host='127.0.0.1', port=8765, static_dir=SCRIPT_DIR, points=DEFAULT_POINTS,
+          max_buckets=4096, max_batch_points=500, poll_s=0.5):
+    """Follows `path` and serves the dashboard and live endpoints until interrupted."""
+    live = LiveLog(path, max_buckets=max_buckets, max_batch_points=max_batch_points, poll_s=poll_s)
+    # What is already logged is loaded by the follower in chunks while connections are accepted;
+    # a page connecting meanwhile gets the history so far and the rest as catch-up batches.
+    follower = threading.Thread(target=live.run, daemon=True)
+    follower.start()
+    server = ThreadingHTTPServer((host, port), _make_handler(live, static_dir, points))
+    server.daemon_threads = True
+    print(f"Serving the live dashboard at http://{host}:{server.server_address[1]}/index.html")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        live.stop()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve index.html with a live, pre-aggregated feed of a growing sampler.py log.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("log_file", help="CSV log sampler.py is writing (it may not exist yet).")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (0 picks a free one).")
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS,
+                        help="Default points per series in a snapshot.")
+    parser.add_argument("--max_buckets", type=int, default=4096,
+                        help="History buckets kept per series (bucket width doubles beyond this).")
+    parser.add_argument("--max_batch_points", type=int, default=500,
+                        help="Points per series in one pushed batch before it is downsampled.")
+    parser.add_argument("--poll", type=float, default=0.5, help="Seconds between checks for new rows.")
+    parser.add_argument("--static_dir", default=SCRIPT_DIR,
+                        help="Directory index.html and the data files it fetches are served from.")
+
+    args = parser.parse_args()
+    if args.max_buckets < 3 or args.max_batch_points < 3:
+        parser.error("--max_buckets and --max_batch_points must be at least 3")
+    try:
+        serve(args.log_file, args.host, args.port, args.static_dir, args.points,
+              args.max_buckets, args.max_batch_points, args.poll)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Downsampled plotting store kept next to a log, so plots cost the same for a
+ten-minute sweep and a multi-day soak test.
+
+The store (<log>_plotstore.npz) holds:
+
+    timeline  per TIMELINE_RESOLUTIONS_S bucket width, the count, sum, min and max
+              of each TIMELINE_COLUMNS column over all rows (the whole run, warm-up
+              and cool-down included), with buckets aligned to wall-clock multiples
+    hexbin    for each HEXBIN_PLOTS entry, counts of measurement rows on a fixed
+              fine (x, y) grid plus the sum of a third column per cell, which
+              data.py re-bins into matplotlib hexbins coloured by its cell mean
+    hist      fine fixed-width counts of each HIST_COLUMNS column over measurement rows
+
+Every aggregate is mergeable and every grid is anchored at 0, so update() only
+parses the bytes (or .cpulog records) appended since the last update and folds
+them in; a log that was rewritten or truncated is detected by a fingerprint of
+its beginning and rebuilt from scratch.
+
+    python3 plotstore.py update cpu_cooling_data_controlled.csv
+    python3 plotstore.py info cpu_cooling_data_controlled.csv
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analysis import (clean_log_frame, _read_binary_log, COL_TIMESTAMP, COL_ACTUAL_PPT, COL_SET_PPT, COL_CPU_TEMP,
+                      COL_FAN_RPM, COL_AMBIENT_TEMP, COL_PHASE)
+
+# Bump when the layout or binning changes; stores of another version are rebuilt.
+STORE_VERSION = 1
+
+TIMELINE_RESOLUTIONS_S = (10, 60, 600, 3600)
+TIMELINE_COLUMNS = [COL_CPU_TEMP, COL_ACTUAL_PPT, COL_FAN_RPM, COL_AMBIENT_TEMP, COL_SET_PPT]
+# Fine bin widths shared by the hexbin grids and histograms.
+BIN_WIDTHS = {COL_CPU_TEMP: 0.25, COL_ACTUAL_PPT: 0.25, COL_FAN_RPM: 10.0, COL_AMBIENT_TEMP: 0.1}
+# name: (x column, y column, column averaged per cell for the colour)
+HEXBIN_PLOTS = {
+    'Temp_vs_Power': (COL_ACTUAL_PPT, COL_CPU_TEMP, COL_FAN_RPM),
+    'Temp_vs_RPM': (COL_FAN_RPM, COL_CPU_TEMP, COL_ACTUAL_PPT),
+}
+HIST_COLUMNS = [COL_CPU_TEMP, COL_AMBIENT_TEMP, COL_ACTUAL_PPT, COL_FAN_RPM]
+
+_FINGERPRINT_BYTES = 4096
+
+
+def store_path_for(log_path):
+    """Default store location: <log without .csv/.cpulog>_plotstore.npz."""
+    root, ext = os.path.splitext(log_path)
+    return (root if ext in ('.csv', '.cpulog') else log_path) + '_plotstore.npz'
+
+
+def _fingerprint(path, length):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+def _merge(frames, keys, sum_columns, min_columns=(), max_columns=()):
+    """Combines partial aggregates that share key values."""
+    non_empty = [f for f in frames if len(f)]
+    if len(non_empty) <= 1:
+        return non_empty[0] if non_empty else frames[0]
+    combined = pd.concat(non_empty, ignore_index=True)
+    agg = {c: 'sum' for c in sum_columns}
+    agg.update({c: 'min' for c in min_columns})
+    agg.update({c: 'max' for c in max_columns})
+    return combined.groupby(keys, sort=True, as_index=False).agg(agg)
+
+
+class PlotStore:
+    """Mergeable timeline pyramid, hexbin grids and histograms of one log."""
+
+    def __init__(self, meta=None, timeline=None, hexbin=None, hist=None):
+        self.meta = meta or {}
+        self.timeline = timeline or {}  # resolution_s -> DataFrame(bucket, <col>_count/_sum/_min/_max)
+        self.hexbin = hexbin or {}  # name -> DataFrame(ix, iy, count, c_count, c_sum)
+        self.hist = hist or {}  # column -> DataFrame(i, count)
+
+    @property
+    def rows(self):
+        return self.meta.get('rows', 0)
+
+    @property
+    def measurement_rows(self):
+        return self.meta.get('measurement_rows', 0)
+
+    # --- building ---
+
+    def add(self, df):
+        """Folds cleaned log rows (see analysis.clean_log_frame) into the aggregates."""
+        if not len(df):
+            return
+        self.meta['rows'] = self.rows + len(df)
+        if COL_TIMESTAMP in df.columns:
+            self._add_timeline(df)
+        if COL_PHASE in df.columns:
+            df = df[(df[COL_PHASE] == 'measure').to_numpy()]
+        self.meta['measurement_rows'] = self.measurement_rows + len(df)
+        for name, (x_col, y_col, c_col) in HEXBIN_PLOTS.items():
+            if x_col not in df.columns or y_col not in df.columns:
+                continue
+            x = df[x_col].to_numpy(dtype=float)
+            y = df[y_col].to_numpy(dtype=float)
+            c = df[c_col].to_numpy(dtype=float) if c_col in df.columns else np.full(len(df), np.nan)
+            valid = np.isfinite(x) & np.isfinite(y)
+            part = pd.DataFrame({
+                'ix': np.floor(x[valid] / BIN_WIDTHS[x_col]).astype(np.int64),
+                'iy': np.floor(y[valid] / BIN_WIDTHS[y_col]).astype(np.int64),
+                'count': np.ones(int(valid.sum()), dtype=np.int64),
+                'c_count': np.isfinite(c[valid]).astype(np.int64),
+                'c_sum': np.nan_to_num(c[valid]),
+            }).groupby(['ix', 'iy'], sort=True, as_index=False).sum()
+            self.hexbin[name] = _merge([self.hexbin.get(name, part.iloc[:0]), part], ['ix', 'iy'],
+                                       ['count', 'c_count', 'c_sum'])
+        for col in HIST_COLUMNS:
+            if col not in df.columns:
+                continue
+            values = df[col].to_numpy(dtype=float)
+            values = values[np.isfinite(values)]
+            i, counts = np.unique(np.floor(values / BIN_WIDTHS[col]).astype(np.int64), return_counts=True)
+            part = pd.DataFrame({'i': i, 'count': counts.astype(np.int64)})
+            self.hist[col] = _merge([self.hist.get(col, part.iloc[:0]), part], ['i'], ['count'])
+
+    def _add_timeline(self, df):
+        # Naive local timestamps as seconds, so buckets line up with wall-clock minutes and hours.
+        timestamps = df[COL_TIMESTAMP].to_numpy(dtype='datetime64[ns]')
+        valid = ~np.isnat(timestamps)
+        t = timestamps[valid].astype(np.int64) / 1e9
+        columns = [c for c in TIMELINE_COLUMNS if c in df.columns]
+        values = df.loc[valid, columns].astype(float).reset_index(drop=True)
+        sums, mins, maxs = [], [], []
+        for col in columns:
+            sums += [f'{col}_count', f'{col}_sum']
+            mins.append(f'{col}_min')
+            maxs.append(f'{col}_max')
+        for resolution_s in TIMELINE_RESOLUTIONS_S:
+            grouped = values.groupby(np.floor(t / resolution_s).astype(np.int64), sort=True)
+            part = pd.concat([grouped.count().add_suffix('_count'), grouped.sum().add_suffix('_sum'),
+                              grouped.min().add_suffix('_min'), grouped.max().add_suffix('_max')], axis=1)
+            part.index.name = 'bucket'
+            part = part.reset_index()
+            old = self.timeline.get(resolution_s)
+            if old is None or not len(old):
+                self.timeline[resolution_s] = part
+                continue
+            # Appended rows only touch the buckets from their first timestamp on.
+            first = part['bucket'].iloc[0]
+            head = old[old['bucket'].to_numpy() < first]
+            tail = old[old['bucket'].to_numpy() >= first]
+            merged = _merge([tail, part], ['bucket'], sums, mins, maxs)
+            self.timeline[resolution_s] = pd.concat([head, merged], ignore_index=True)
+
+    # --- reading ---
+
+    def timeline_frame(self, max_buckets=2000):
+        """
+        The finest timeline level with at most max_buckets buckets.
+
+        Returns:
+            tuple: (resolution_s, DataFrame with Timestamp (bucket start) and
+                   <col>_mean/_min/_max columns), or (None, empty DataFrame).
+        """
+        if not self.timeline:
+            return None, pd.DataFrame()
+        for resolution_s in sorted(self.timeline):
+            if len(self.timeline[resolution_s]) <= max_buckets:
+                break
+        level = self.timeline[resolution_s]
+        frame = pd.DataFrame({COL_TIMESTAMP: pd.to_datetime(level['bucket'].to_numpy() * resolution_s, unit='s')})
+        for col in TIMELINE_COLUMNS:
+            if f'{col}_count' not in level.columns:
+                continue
+            count = level[f'{col}_count'].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frame[f'{col}_mean'] = np.where(count > 0, level[f'{col}_sum'].to_numpy() / count, np.nan)
+            frame[f'{col}_min'] = level[f'{col}_min'].to_numpy()
+            frame[f'{col}_max'] = level[f'{col}_max'].to_numpy()
+        return resolution_s, frame
+
+    def hexbin_cells(self, name):
+        """
+        Fine grid cells of a HEXBIN_PLOTS entry.
+
+        Returns:
+            tuple: (x centers, y centers, counts, per-cell sum of the colour
+                   column, per-cell count of it) numpy arrays; empty without data.
+        """
+        x_col, y_col, _ = HEXBIN_PLOTS[name]
+        cells = self.hexbin.get(name)
+        if cells is None or not len(cells):
+            return tuple(np.zeros(0) for _ in range(5))
+        return ((cells['ix'].to_numpy() + 0.5) * BIN_WIDTHS[x_col],
+                (cells['iy'].to_numpy() + 0.5) * BIN_WIDTHS[y_col],
+                cells['count'].to_numpy(), cells['c_sum'].to_numpy(), cells['c_count'].to_numpy())
+
+    def histogram(self, col):
+        """(bin centers, counts, bin width) of a HIST_COLUMNS column; empty arrays without data."""
+        bins = self.hist.get(col)
+        if bins is None or not len(bins):
+            return np.zeros(0), np.zeros(0, dtype=np.int64), BIN_WIDTHS[col]
+        return (bins['i'].to_numpy() + 0.5) * BIN_WIDTHS[col], bins['count'].to_numpy(), BIN_WIDTHS[col]
+
+    # --- persistence ---
+
+    def save(self, path):
+        arrays = {'meta': np.frombuffer(json.dumps(self.meta).encode(), dtype=np.uint8)}
+        groups = [(f'timeline/{r}', f) for r, f in self.timeline.items()] + \
+                 [(f'hexbin/{n}', f) for n, f in self.hexbin.items()] + \
+                 [(f'hist/{c}', f) for c, f in self.hist.items()]
+        for group, frame in groups:
+            for col in frame.columns:
+                arrays[f'{group}/{col}'] = frame[col].to_numpy()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            # mkstemp files are 0600; give the store the mode a plainly created file would get.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Reads a saved store. Raises OSError or ValueError if it is missing or unreadable."""
+        with np.load(path, allow_pickle=False) as data:
+            store = cls(json.loads(data['meta'].tobytes().decode()))
+            columns = {}
+            for key in data.files:
+                if key == 'meta':
+                    continue
+                kind, name, col = key.split('/', 2)
+                columns.setdefault((kind, name), {})[col] = data[key]
+        for (kind, name), frame_columns in columns.items():
+            frame = pd.DataFrame(frame_columns)
+            if kind == 'timeline':
+                store.timeline[int(name)] = frame
+            elif kind == 'hexbin':
+                store.hexbin[name] = frame
+            else:
+                store.hist[name] = frame
+        return store
+
+
+def _read_new_csv_rows(log_path, offset, header):
+    """Complete CSV lines after byte `offset`. Returns (DataFrame, new offset)."""
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return pd.DataFrame(), offset
+    df = pd.read_csv(io.BytesIO(data[:end]), names=header, header=None)
+    return clean_log_frame(df), offset + end
+
+
+def update_store(log_path, store_path=None):
+    """
+    Brings the store of a log up to date, parsing only what was appended since the last update.
+
+    Args:
+        log_path (str): Logger CSV or binary .cpulog.
+        store_path (str): Store file; defaults to store_path_for(log_path).
+
+    Returns:
+        tuple: (PlotStore, number of rows added by this update).
+    """
+    if not os.path.exists(log_path):
+        raise FileNotFoundError(f"Log file '{log_path}' not found.")
+    store_path = store_path or store_path_for(log_path)
+    size = os.path.getsize(log_path)
+    try:
+        store = PlotStore.load(store_path)
+    except (OSError, ValueError, KeyError):
+        store = None
+    if store is not None:
+        meta = store.meta
+        fingerprint_len = meta.get('fingerprint_len', 0)
+        if (meta.get('version') != STORE_VERSION or meta.get('source') != os.path.basename(log_path)
+                or size < meta.get('offset', 0) or size < fingerprint_len
+                or _fingerprint(log_path, fingerprint_len) != meta.get('fingerprint')):
+            store = None  # rewritten, truncated or built by an older version
+    if store is None:
+        store = PlotStore({'version': STORE_VERSION, 'source': os.path.basename(log_path), 'offset': 0,
+                           'rows': 0, 'measurement_rows': 0})
+
+    before = store.rows
+    if log_path.endswith('.cpulog'):
+        # Fixed-width records: the offset is a record count.
+        df = _read_binary_log(log_path, start_row=store.meta['offset'])
+        store.add(df)
+        store.meta['offset'] += len(df)
+    else:
+        if 'header' not in store.meta:
+            with open(log_path, 'rb') as f:
+                header_line = f.readline()
+            if not header_line.endswith(b'\n'):
+                return store, 0  # header not completely written yet
+            store.meta['header'] = [name.strip() for name in header_line.decode().strip().split(',')]
+            store.meta['offset'] = len(header_line)
+        df, store.meta['offset'] = _read_new_csv_rows(log_path, store.meta['offset'], store.meta['header'])
+        store.add(df)
+    if store.rows != before or 'fingerprint' not in store.meta:
+        store.meta['fingerprint_len'] = min(size, _FINGERPRINT_BYTES)
+        store.meta['fingerprint'] = _fingerprint(log_path, store.meta['fingerprint_len'])
+        store.save(store_path)
+    return store, store.rows - before
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintain the downsampled plotting store next to a logger CSV or .cpulog.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("update", "Fold rows appended since the last update into the store."),
+                            ("info", "Update the store, then print its levels and grid sizes.")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("log_file", help="Logger CSV or binary .cpulog.")
+        sub.add_argument("--store", default=None, help="Store file (default: <log>_plotstore.npz).")
+
+    args = parser.parse_args()
+    try:
+        store, added = update_store(args.log_file, args.store)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{args.store or store_path_for(args.log_file)}: {store.rows} rows "
+          f"({store.measurement_rows} measurement), {added} added by this update.")
+    if args.command == "info":
+        for resolution_s in sorted(store.timeline):
+            print(f"  timeline {resolution_s:>5} s: {len(store.timeline[resolution_s])} buckets")
+        for name, cells in store.hexbin.items():
+            print(f"  hexbin {name}: {len(cells)} cells")
+        for col, bins in store.hist.items():
+            print(f"  hist {col}: {len(bins)} bins of {BIN_WIDTHS[col]:g}")
+
+
+if __name__ == "__main__":
+    main()
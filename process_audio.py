@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
 import argparse
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from audio_stream import PcmStream, PcmWriter, copy_ranges, detect_nonsilent_stream, silence_frames
+
+
+def _new_file_mode():
+    """Mode a plainly created file gets under the current umask (mkstemp files are 0600)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _replace_output(tmp_path, output_file):
+    """Moves a finished temporary file over output_file with the permissions a new file would have."""
+    os.chmod(tmp_path, _new_file_mode())
+    os.replace(tmp_path, output_file)
+
 
 def process_audio_refined(input_file, output_file,
                           silence_thresh_dbfs=-40,
@@ -17,6 +41,13 @@ def process_audio_refined(input_file, output_file,
        to padding_between_segments_ms.
     3. Optionally adds specified leading/trailing padding to the final output.
 
+    The output is written to a temporary file next to output_file and renamed over
+    it once complete, so output_file may be the input itself (pass 2 still reads it).
+
+    The output keeps the input's sample width and rate (see audio_stream.PcmWriter),
+    and gaps are cut on whole frames, so stitched files can differ from the old
+    AudioSegment-based output by a few frames per gap.
+
     Args:
         input_file (str): Path to the input audio file.
         output_file (str): Path to save the processed audio file.
@@ -27,86 +58,77 @@ def process_audio_refined(input_file, output_file,
                                            speech segments after removing longer silences.
         leading_padding_ms (int): Duration (ms) of silence to add at the beginning.
         trailing_padding_ms (int): Duration (ms) of silence to add at the end.
+
+    Returns:
+        tuple: (original_duration_s, output_duration_s), or None if processing failed.
     """
+    tmp_path = None
     try:
-        print(f"Loading audio file: {input_file}")
-        audio = AudioSegment.from_file(input_file)
-        original_duration_s = len(audio) / 1000.0
-        print(f"Audio loaded. Original duration: {original_duration_s:.2f}s")
-
-        if original_duration_s == 0:
-            print("Input audio is empty. Saving an empty output file.")
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
-            audio.export(output_file, format=output_file.split('.')[-1].lower())
-            return
+        output_format = output_file.split('.')[-1].lower()
+        if output_format == 'm4a':
+            output_format = 'ipod' # pydub uses 'ipod' for m4a
+        # Common formats like webm, mp3, ogg, wav are typically handled by their extension.
 
+        print(f"Scanning audio file: {input_file}")
         print(f"Detecting non-silent parts (silence_thresh={silence_thresh_dbfs}dBFS, "
               f"min_silence_len_for_split={min_silence_duration_to_affect_ms}ms)...")
 
-        nonsilent_ranges = detect_nonsilent(
-            audio_segment=audio,
-            min_silence_len=min_silence_duration_to_affect_ms, # Min duration of silence to cause a split
-            silence_thresh=silence_thresh_dbfs,
-            seek_step=1
-        )
+        # Pass 1: same ranges as pydub's detect_nonsilent(seek_step=1), computed block-wise
+        # while decoding, so the recording is never held in memory (see audio_stream.py).
+        with PcmStream(input_file) as stream:
+            nonsilent_ranges = list(detect_nonsilent_stream(stream, min_silence_duration_to_affect_ms,
+                                                            silence_thresh_dbfs))
+            frame_rate, channels, sample_width = stream.frame_rate, stream.channels, stream.sample_width
+        # Rounded to whole milliseconds like len(AudioSegment).
+        original_duration_s = round(1000 * (stream.frames_read / frame_rate)) / 1000.0
+        print(f"Audio scanned. Original duration: {original_duration_s:.2f}s")
+
+        # Ensure output directory exists
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)), prefix=".tmp-",
+                                        suffix=os.path.splitext(output_file)[1])
+        os.close(fd)
+
+        if original_duration_s == 0:
+            print("Input audio is empty. Saving an empty output file.")
+            PcmWriter(tmp_path, output_format, frame_rate, channels, sample_width).close()
+            _replace_output(tmp_path, output_file)
+            return 0.0, 0.0
 
         if not nonsilent_ranges:
             print("No non-silent parts detected based on current settings. "
                   "The audio might be entirely silent or below the threshold.")
             # Output a silent clip of total desired padding, or original if no padding.
-            final_output = AudioSegment.silent(duration=leading_padding_ms) + \
-                           AudioSegment.silent(duration=trailing_padding_ms)
-            
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
-
-            if len(final_output) == 0: # if no padding requested
-                print("Saving original (silent) audio as no non-silent parts were found and no padding requested.")
-                audio.export(output_file, format=output_file.split('.')[-1].lower())
-            else:
-                print(f"Saving a silent clip with specified padding. Duration: {len(final_output)/1000.0:.2f}s")
-                final_output.export(output_file, format=output_file.split('.')[-1].lower())
-            return
+            with PcmWriter(tmp_path, output_format, frame_rate, channels, sample_width) as writer:
+                if leading_padding_ms + trailing_padding_ms == 0: # if no padding requested
+                    print("Saving original (silent) audio as no non-silent parts were found and no padding requested.")
+                    with PcmStream(input_file) as stream:
+                        for block in stream.blocks():
+                            writer.write(block)
+                else:
+                    writer.write_silence(silence_frames(leading_padding_ms, frame_rate) + silence_frames(trailing_padding_ms, frame_rate))
+                    print(f"Saving a silent clip with specified padding. "
+                          f"Duration: {writer.frames_written / frame_rate:.2f}s")
+            _replace_output(tmp_path, output_file)
+            return original_duration_s, writer.frames_written / frame_rate
 
         print(f"Found {len(nonsilent_ranges)} non-silent segments.")
-
-        # Build the core audio by stitching non-silent parts with desired internal padding
-        core_audio_segments = []
-        # Add first non-silent segment
-        start_idx, end_idx = nonsilent_ranges[0]
-        core_audio_segments.append(audio[start_idx:end_idx])
-
-        # Iterate through the rest of the non-silent segments
-        for i in range(1, len(nonsilent_ranges)):
-            # Add padding silence between segments
-            core_audio_segments.append(AudioSegment.silent(duration=padding_between_segments_ms))
-
-            # Add next non-silent segment
-            start_idx, end_idx = nonsilent_ranges[i]
-            core_audio_segments.append(audio[start_idx:end_idx])
-
-        # Combine core segments
-        processed_core_audio = sum(core_audio_segments, AudioSegment.empty())
-
-        # Add leading and trailing padding
-        final_output = AudioSegment.silent(duration=leading_padding_ms) + \
-                       processed_core_audio + \
-                       AudioSegment.silent(duration=trailing_padding_ms)
-
-        output_duration_s = len(final_output) / 1000.0
         print(f"Exporting processed audio to: {output_file}")
 
-        output_format = output_file.split('.')[-1].lower()
-        if output_format == 'm4a':
-            output_format = 'ipod' # pydub uses 'ipod' for m4a
-        # Common formats like webm, mp3, ogg, wav are typically handled by their extension.
+        # Pass 2: decode again and write the non-silent parts, with the padding generated
+        # in between, straight into the output file / encoder. Every frame is copied once,
+        # so the cost is linear in the output length however many segments there are.
+        with PcmStream(input_file) as stream, \
+                PcmWriter(tmp_path, output_format, frame_rate, channels, sample_width) as writer:
+            writer.write_silence(silence_frames(leading_padding_ms, frame_rate))
+            copy_ranges(stream, writer, nonsilent_ranges, silence_frames(padding_between_segments_ms, frame_rate))
+            writer.write_silence(silence_frames(trailing_padding_ms, frame_rate))
+            output_duration_s = writer.frames_written / frame_rate
+        _replace_output(tmp_path, output_file)
 
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
-        final_output.export(output_file, format=output_format)
         print(f"Processed audio saved. New duration: {output_duration_s:.2f}s "
               f"(Original: {original_duration_s:.2f}s)")
+        return original_duration_s, output_duration_s
 
     except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found.")
@@ -114,17 +136,210 @@ def process_audio_refined(input_file, output_file,
         print(f"An error occurred: {e}")
         print("Please ensure FFmpeg (for WebM, MP3, M4A, OGG etc.) or Libav is "
               "installed and accessible in your system's PATH if working with non-WAV files.")
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Process audio to remove/reduce long silences and add padding.",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
-    parser.add_argument("input_file",
-                        help="Path to the input audio file (e.g., .webm, .mp3, .wav, .m4a, .ogg).")
-    parser.add_argument("output_file",
-                        help="Path to save the processed audio file.")
+BATCH_MANIFEST = ".process_audio_batch.json"
+AUDIO_EXTENSIONS = ('.m4a', '.webm', '.mp3', '.wav', '.ogg', '.flac')
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def collect_batch_inputs(sources):
+    """
+    Expands directories (their audio files, non-recursively) and glob patterns into a sorted file list.
+    """
+    inputs = set()
+    for source in sources:
+        if os.path.isdir(source):
+            for entry in os.scandir(source):
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                    inputs.add(os.path.abspath(entry.path))
+        else:
+            inputs.update(os.path.abspath(path) for path in glob.glob(source) if os.path.isfile(path))
+    return sorted(inputs)
+
+
+def _batch_output_path(input_file, output_dir, output_ext):
+    stem, ext = os.path.splitext(os.path.basename(input_file))
+    return os.path.abspath(os.path.join(output_dir, stem + (output_ext or ext)))
+
+
+def _same_file(input_file, output_file):
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        return True
+    try:
+        return os.path.samefile(input_file, output_file)
+    except OSError:
+        return False
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, BATCH_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(output_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=".tmp-")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    _replace_output(tmp_path, os.path.join(output_dir, BATCH_MANIFEST))
+
+
+def _is_up_to_date(entry, input_file, output_file, params, use_hash):
+    """
+    True if output_file was produced from the current input_file with the same parameters.
+
+    The input is identified by (size, mtime); with use_hash a changed stamp is
+    re-checked against the recorded SHA-256 so a touched but identical file is skipped.
+    """
+    if not entry or entry.get('params') != params or not os.path.exists(output_file):
+        return False
+    st = os.stat(input_file)
+    if entry.get('stamp') == [st.st_size, st.st_mtime_ns]:
+        return True
+    return use_hash and entry.get('sha256') == _file_sha256(input_file)
+
+
+def _process_batch_file(input_file, output_file, params):
+    """
+    Worker: processes one file with its console output captured. Returns a result dict.
+
+    process_audio_refined only renames its temporary file over output_file once
+    processing succeeded, so a failed run never leaves a truncated file.
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        durations = process_audio_refined(input_file, output_file, **params)
+    wall_s = time.perf_counter() - start
+    result = {'input': input_file, 'output': output_file, 'wall_s': wall_s, 'ok': durations is not None}
+    if durations is None:
+        result['error'] = log.getvalue().strip().splitlines()[-2:]
+    else:
+        result['original_s'], result['output_s'] = durations
+    return result
+
+
+def _print_file_report(result):
+    name = os.path.basename(result['input'])
+    if not result['ok']:
+        print(f"  FAILED  {name}: {' '.join(result['error'])}")
+        return
+    speed = result['original_s'] / result['wall_s'] if result['wall_s'] > 0 else float('inf')
+    print(f"  done    {name}: {result['original_s']:.1f}s -> {result['output_s']:.1f}s audio "
+          f"in {result['wall_s']:.2f}s ({speed:.1f}x real time)")
+
+
+def process_audio_batch(sources, output_dir, params, output_ext=None, workers=None, force=False, use_hash=False):
+    """
+    Processes many audio files in parallel with process_audio_refined.
+
+    Outputs already produced from an unchanged input with the same parameters are
+    skipped; what was produced is recorded in a manifest in output_dir. Inputs whose
+    output would be the input itself, or the same file as another input's, are
+    refused (reported as failed) before anything is processed.
+
+    Args:
+        sources (list): Directories and/or glob patterns of input files.
+        output_dir (str): Directory for the outputs, named after their inputs.
+        params (dict): Keyword arguments for process_audio_refined.
+        output_ext (str): Output extension (e.g. '.wav'); None keeps each input's.
+        workers (int): Worker processes; None uses every core, 1 runs in process.
+        force (bool): Reprocess up-to-date outputs too.
+        use_hash (bool): Confirm changed inputs by content hash rather than size/mtime alone.
+
+    Returns:
+        list: Result dicts of the files processed (skipped files excluded).
+    """
+    inputs = collect_batch_inputs(sources)
+    if not inputs:
+        print("No input files found.")
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+
+    by_output = {}
+    for input_file in inputs:
+        by_output.setdefault(_batch_output_path(input_file, output_dir, output_ext), []).append(input_file)
+    jobs = []
+    results = []
+    for output_file, sources_of_output in sorted(by_output.items()):
+        input_file = sources_of_output[0]
+        if len(sources_of_output) > 1:
+            # Same stem, different extensions: one output file and manifest key for several inputs.
+            names = ', '.join(os.path.basename(i) for i in sources_of_output)
+            reason = f"{names} map to the same output {os.path.basename(output_file)}; rename one of them"
+        elif _same_file(input_file, output_file):
+            reason = "output would overwrite the input; choose another --output_dir or --format"
+        else:
+            reason = None
+        if reason is not None:
+            for i in sources_of_output:
+                results.append({'input': i, 'output': output_file, 'wall_s': 0.0, 'ok': False, 'error': [reason]})
+                _print_file_report(results[-1])
+            continue
+        key = os.path.basename(output_file)
+        if not force and _is_up_to_date(manifest.get(key), input_file, output_file, params, use_hash):
+            print(f"  skip    {os.path.basename(input_file)}: up to date")
+            continue
+        jobs.append((input_file, output_file))
+    refused = len(results)
+    skipped = len(inputs) - len(jobs) - refused
+    print(f"{len(inputs)} input files, {skipped} up to date, {refused} refused, {len(jobs)} to process.")
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    start = time.perf_counter()
+    executor = None
+    if workers > 1:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork') if 'fork' in methods else None
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        if executor is None:
+            completed = (_process_batch_file(i, o, params) for i, o in jobs)
+        else:
+            futures = [executor.submit(_process_batch_file, i, o, params) for i, o in jobs]
+            completed = (future.result() for future in futures)
+        for result in completed:
+            _print_file_report(result)
+            results.append(result)
+            if result['ok']:
+                st = os.stat(result['input'])
+                manifest[os.path.basename(result['output'])] = {
+                    'input': result['input'],
+                    'stamp': [st.st_size, st.st_mtime_ns],
+                    'sha256': _file_sha256(result['input']) if use_hash else None,
+                    'params': params,
+                }
+                _save_manifest(output_dir, manifest)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    wall_s = time.perf_counter() - start
+
+    ok = [r for r in results if r['ok']]
+    audio_s = sum(r['original_s'] for r in ok)
+    print(f"Batch finished: {len(ok)} processed, {len(results) - len(ok)} failed, "
+          f"{skipped} skipped, {workers} workers.")
+    if ok and wall_s > 0:
+        print(f"  {audio_s:.1f}s of audio in {wall_s:.2f}s wall time ({audio_s / wall_s:.1f}x real time, "
+              f"{sum(r['wall_s'] for r in ok) / wall_s:.1f}x parallel speed-up)")
+    return results
+
+
+def _add_processing_args(parser):
     parser.add_argument("--silence_thresh", type=int, default=-40,
                         help="Silence threshold in dBFS. Quieter than this is considered silence.")
     parser.add_argument("--min_silence_len", type=int, default=700,
@@ -136,17 +351,64 @@ def main():
     parser.add_argument("--trailing_padding", type=int, default=0,
                         help="Duration (ms) of silence to add at the end of the processed audio.")
 
-    args = parser.parse_args()
 
-    process_audio_refined(
-        args.input_file,
-        args.output_file,
-        silence_thresh_dbfs=args.silence_thresh,
-        min_silence_duration_to_affect_ms=args.min_silence_len,
-        padding_between_segments_ms=args.padding_between,
-        leading_padding_ms=args.leading_padding,
-        trailing_padding_ms=args.trailing_padding
+def _processing_params(args):
+    return {
+        'silence_thresh_dbfs': args.silence_thresh,
+        'min_silence_duration_to_affect_ms': args.min_silence_len,
+        'padding_between_segments_ms': args.padding_between,
+        'leading_padding_ms': args.leading_padding,
+        'trailing_padding_ms': args.trailing_padding,
+    }
+
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="process_audio.py batch",
+        description="Process every audio file in directories / glob patterns in parallel.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("sources", nargs='+',
+                        help="Input directories or glob patterns (quote globs, e.g. 'assets/S*.m4a').")
+    parser.add_argument("-o", "--output_dir", required=True,
+                        help="Directory to save the processed files to.")
+    parser.add_argument("--format", dest="output_ext", default=None,
+                        help="Output extension (e.g. wav); default keeps each input's extension.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Worker processes (default: number of cores).")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess files whose output is already up to date.")
+    parser.add_argument("--hash", dest="use_hash", action="store_true",
+                        help="Compare inputs by content hash, not just size and modification time.")
+    _add_processing_args(parser)
+    args = parser.parse_args(argv)
+
+    output_ext = args.output_ext
+    if output_ext and not output_ext.startswith('.'):
+        output_ext = '.' + output_ext
+    results = process_audio_batch(args.sources, args.output_dir, _processing_params(args), output_ext,
+                                  args.jobs, args.force, args.use_hash)
+    return 1 if any(not r['ok'] for r in results) else 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(
+        description="Process audio to remove/reduce long silences and add padding. "
+                    "Use 'process_audio.py batch --help' to process many files in parallel.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
+    parser.add_argument("input_file",
+                        help="Path to the input audio file (e.g., .webm, .mp3, .wav, .m4a, .ogg).")
+    parser.add_argument("output_file",
+                        help="Path to save the processed audio file.")
+    _add_processing_args(parser)
+
+    args = parser.parse_args()
+
+    process_audio_refined(args.input_file, args.output_file, **_processing_params(args))
 
 if __name__ == "__main__":
     main()
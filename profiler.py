@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Self-profiling of sampler.py's hot path.
+
+Every sample is split into stages (read ryzen_monitor, read fan, read extra
+sensors, format, write, flush) timed with perf_counter_ns, and each stage's
+durations go into a log-linear histogram (4 buckets per power of two, so
+percentiles are within 25%). At the end of every segment one JSON line is
+appended to the profile file with the stage histograms and the logger's own
+CPU time and RSS, plus the CPU time of the ryzen_monitor reader it owns:
+
+    {"segment": 3, "phase": "measure", "wall_s": 120.0, "samples": 120,
+     "cpu_s": 0.41, "cpu_pct": 0.34, "reader_cpu_s": 1.2, "rss_mb": 14.1,
+     "stages": {"read_rm": {"count": 120, "mean_us": 21.4, "p50_us": ..., "hist": {...}}}}
+
+The logger's CPU share (cpu_pct, of one core) is the part of the measured
+package power that the measurement itself causes. `summary` merges the
+segments of a file into one table:
+
+    python3 profiler.py summary cpu_cooling_data_controlled_profile.jsonl
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+STAGES = ('read_rm', 'read_fan', 'read_sensors', 'format', 'write', 'flush')
+SUB_BUCKETS = 4  # per power of two
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = resource.getpagesize()
+
+
+def bucket_index(ns):
+    """Log-linear bucket of a duration: exact below 4 ns, then 4 buckets per power of two."""
+    if ns < SUB_BUCKETS:
+        return max(ns, 0)
+    shift = ns.bit_length() - 3
+    return shift * SUB_BUCKETS + (ns >> shift)
+
+
+def bucket_upper_ns(index):
+    """Exclusive upper bound (ns) of a bucket."""
+    if index < SUB_BUCKETS:
+        return index + 1
+    shift, mantissa = divmod(index, SUB_BUCKETS)
+    return (SUB_BUCKETS + mantissa + 1) << (shift - 1)
+
+
+class LatencyHistogram:
+    """Fixed-size log-linear histogram of durations in ns; adding a value is O(1)."""
+
+    def __init__(self):
+        self.counts = [0] * (64 * SUB_BUCKETS)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.counts[bucket_index(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def percentile_ns(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100)."""
+        if not self.count:
+            return 0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(bucket_upper_ns(i), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_us': round(self.total_ns / self.count / 1000.0, 3) if self.count else 0.0,
+            'p50_us': self.percentile_ns(50) / 1000.0,
+            'p90_us': self.percentile_ns(90) / 1000.0,
+            'p99_us': self.percentile_ns(99) / 1000.0,
+            'max_us': self.max_ns / 1000.0,
+            'total_ms': self.total_ns / 1e6,
+            'hist': {str(i): c for i, c in enumerate(self.counts) if c},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls()
+        for i, c in data.get('hist', {}).items():
+            hist.counts[int(i)] = c
+        hist.count = data['count']
+        hist.total_ns = int(round(data['total_ms'] * 1e6))
+        hist.max_ns = int(round(data['max_us'] * 1000))
+        return hist
+
+
+def process_cpu_s():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def current_rss_mb():
+    """Resident set size of this process; falls back to the peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def group_cpu_s(pgid):
+    """
+    CPU time (user + system) used so far by the live process group `pgid`, or None.
+
+    The reader runs under `sh -c` in its own session, so its pid is the shell's
+    and the real reader is a child in the same group; every member is summed,
+    plus the time of the members already reaped (cutime/cstime).
+    """
+    if pgid is None:
+        return None
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return None
+    total_ticks = 0
+    found = False
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rpartition(')')[2].split()
+            if int(fields[2]) != pgid:
+                continue
+            total_ticks += int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+            found = True
+        except (OSError, ValueError, IndexError):
+            continue  # exited while scanning
+    return total_ticks / _CLOCK_TICKS if found else None
+
+
+class StageProfiler:
+    """
+    Per-segment stage histograms and process usage of the sampler, written as JSON lines.
+
+    Call add() once per sample with the perf_counter_ns marks taken between
+    stages (len(STAGES) + 1 of them) and finish_segment() at each boundary.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reader_pgid = None
+        self._out = open(path, 'w')
+        self._reset()
+
+    def _reset(self):
+        self.stages = {name: LatencyHistogram() for name in STAGES}
+        self.samples = 0
+        self._start_wall = time.monotonic()
+        self._start_cpu = process_cpu_s()
+        self._start_reader_cpu = group_cpu_s(self.reader_pgid)
+
+    def watch_reader(self, pgid):
+        """Also accounts the CPU time of the ryzen_monitor reader's process group `pgid`."""
+        self.reader_pgid = pgid
+        self._start_reader_cpu = group_cpu_s(pgid)
+
+    def add(self, marks):
+        for name, start, end in zip(STAGES, marks, marks[1:]):
+            self.stages[name].add(end - start)
+        self.samples += 1
+
+    def finish_segment(self, segment, phase):
+        wall_s = time.monotonic() - self._start_wall
+        cpu_s = process_cpu_s() - self._start_cpu
+        record = {
+            'segment': segment,
+            'phase': phase,
+            'wall_s': round(wall_s, 3),
+            'samples': self.samples,
+            'cpu_s': round(cpu_s, 4),
+            'cpu_pct': round(100.0 * cpu_s / wall_s, 3) if wall_s > 0 else 0.0,
+            'rss_mb': round(current_rss_mb(), 2),
+        }
+        reader_cpu = group_cpu_s(self.reader_pgid)
+        if reader_cpu is not None and self._start_reader_cpu is not None:
+            record['reader_cpu_s'] = round(reader_cpu - self._start_reader_cpu, 3)
+        record['stages'] = {name: hist.to_dict() for name, hist in self.stages.items() if hist.count}
+        self._out.write(json.dumps(record) + '\n')
+        self._out.flush()
+        self._reset()
+
+    def close(self):
+        if not self._out.closed:
+            self._out.close()
+
+
+def summarize(path):
+    """Merges the segment records of a profile file. Returns (totals dict, merged stage histograms)."""
+    stages = {name: LatencyHistogram() for name in STAGES}
+    totals = {'segments': 0, 'samples': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'reader_cpu_s': 0.0, 'rss_mb': 0.0}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            totals['segments'] += 1
+            for key in ('samples', 'wall_s', 'cpu_s', 'reader_cpu_s'):
+                totals[key] += record.get(key, 0)
+            totals['rss_mb'] = max(totals['rss_mb'], record.get('rss_mb', 0.0))
+            for name, data in record.get('stages', {}).items():
+                if name in stages:
+                    stages[name].merge(LatencyHistogram.from_dict(data))
+    return totals, stages
+
+
+def print_summary(path):
+    totals, stages = summarize(path)
+    wall_s = totals['wall_s']
+    print(f"Logger self-profile ({totals['segments']} segments, {totals['samples']} samples, {wall_s:.1f}s):")
+    print(f"  {'stage':<13}{'count':>9}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'max us':>11}")
+    for name, hist in stages.items():
+        if not hist.count:
+            continue
+        d = hist.to_dict()
+        print(f"  {name:<13}{d['count']:>9}{d['mean_us']:>10.1f}{d['p50_us']:>10.1f}"
+              f"{d['p99_us']:>10.1f}{d['max_us']:>11.1f}")
+    if wall_s > 0:
+        print(f"  logger CPU: {totals['cpu_s']:.3f}s = {100.0 * totals['cpu_s'] / wall_s:.2f}% of one core; "
+              f"ryzen_monitor reader: {totals['reader_cpu_s']:.3f}s = "
+              f"{100.0 * totals['reader_cpu_s'] / wall_s:.2f}%; peak RSS {totals['rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize sampler.py self-profiling files.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="Print merged stage latencies and overhead.")
+    summary_parser.add_argument("profile_file", help="Profile file (.jsonl) written by sampler.py --profile_file.")
+
+    args = parser.parse_args()
+    try:
+        print_summary(args.profile_file)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,975 @@
+#!/usr/bin/env python3
+"""
+In-process sampler for the CPU cooling data logger (emu.sh).
+
+Keeps the ryzen_monitor export stream and the hwmon fan file open for the whole
+segment and parses cpu_thm / cpu_ppt in process, so a sample costs a couple of
+syscalls instead of a dozen forked grep/cut/sed pipelines. Rows are written with
+the CSV columns emu.sh has always produced, plus the segment they belong to:
+
+    Timestamp,CPU_Power_W_Actual,CPU_Temp_C,CPU_Fan_RPM,Ambient_Temp_C,Set_PPT_W,Mprime_Threads,Segment,Phase
+
+Any further channels (all hwmon sensors, per-core clocks, RAPL power, an
+ambient probe; see sensors.py) are sampled in the same loop into a sidecar CSV.
+With a PPT controller (see controller.py) the same loop also adjusts the PPT
+limit in closed loop, and Set_PPT_W follows the PPT in force.
+"""
+import argparse
+import collections
+import os
+import re
+import select
+import signal
+import subprocess
+import sys
+import time
+
+from binlog import BinaryLogWriter
+from controller import add_controller_args, controller_from_args
+from profiler import StageProfiler
+from sensors import DEFAULT_SYSFS_ROOT, Channel, SensorLog, SensorSet, discover_channels, parse_sensor_spec
+
+NUMERIC_VALUE_RE = re.compile(r'^[0-9]+(\.[0-9]+)?$')
+
+
+def parse_export_field(line, field_name):
+    """
+    Extracts one field from a ryzen_monitor --test-export line.
+
+    Mirrors the old shell parser: everything after the first space is a
+    comma-separated list of key=value pairs, and integer values may carry a
+    trailing 'i' (line-protocol style).
+
+    Args:
+        line (str): One line of ryzen_monitor output.
+        field_name (str): Key to extract (e.g. 'cpu_thm').
+
+    Returns:
+        str or None: The numeric value as printed by ryzen_monitor, or None if
+                     the field is missing or not numeric.
+    """
+    _, sep, field_set = line.partition(' ')
+    if not sep:
+        return None
+    prefix = field_name + '='
+    for item in field_set.split(','):
+        if item.startswith(prefix):
+            value = item[len(prefix):].strip()
+            if value.endswith('i'):
+                value = value[:-1]
+            return value if NUMERIC_VALUE_RE.match(value) else None
+    return None
+
+
+class _ExportLineParser:
+    """Keeps the latest value of each requested metric from a stream of export lines."""
+
+    def __init__(self, metrics):
+        """
+        Args:
+            metrics (dict): Metric name -> (line_pattern, field_name), where
+                            line_pattern is a regex selecting the line (as the
+                            old `grep` pattern did).
+        """
+        self.metrics = {name: (re.compile(pattern), field)
+                        for name, (pattern, field) in metrics.items()}
+        self.latest = {}
+        self._partial = b''
+
+    def feed(self, data):
+        """Consumes newly read bytes; an incomplete trailing line is kept for the next call."""
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        pending = dict(self.metrics)
+        for raw_line in reversed(lines):
+            if not pending:
+                break
+            line = raw_line.decode('utf-8', 'replace').rstrip('\r')
+            for name, (pattern, field) in list(pending.items()):
+                if pattern.search(line):
+                    value = parse_export_field(line, field)
+                    if value is not None:
+                        self.latest[name] = value
+                    # As with `grep | tail -n 1`, only the newest matching line counts.
+                    del pending[name]
+
+    def _wait_for_metrics(self, timeout_s):
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            self.poll()
+            if not self.alive or len(self.latest) == len(self.metrics):
+                break
+            time.sleep(0.01)
+
+
+class RyzenMonitorStream(_ExportLineParser):
+    """
+    Owns a long-running `ryzen_monitor --test-export` style process and keeps the
+    latest value of each requested metric in memory.
+
+    The child's stdout is a non-blocking pipe; poll() drains whatever is
+    available and only parses the newest line matching each metric. Sampling is
+    usually faster than the reader prints, so a zero-timeout poll(2) first skips
+    the read when nothing new has arrived.
+    """
+
+    def __init__(self, command, metrics):
+        """
+        Args:
+            command (str): Shell command that streams export lines to stdout.
+            metrics (dict): See _ExportLineParser.
+        """
+        super().__init__(metrics)
+        self.command = command
+        self.process = None
+        self._fd = None
+        self._poller = None
+
+    @property
+    def alive(self):
+        return self._fd is not None
+
+    def start(self, startup_timeout_s=0.5):
+        """Starts the reader and waits (up to startup_timeout_s) for every metric to appear."""
+        self.process = subprocess.Popen(self.command, shell=True,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+        self._fd = self.process.stdout.fileno()
+        os.set_blocking(self._fd, False)
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN)
+        self._wait_for_metrics(startup_timeout_s)
+        return self.alive or bool(self.latest)
+
+    def poll(self):
+        """Reads every byte currently buffered in the pipe and updates `latest`."""
+        if self._fd is None or not self._poller.poll(0):  # EOF still reports POLLHUP
+            return
+        chunks = []
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:  # EOF: the reader exited
+                self._fd = None
+                break
+            chunks.append(data)
+            if len(data) < 65536:  # pipe drained; skip the extra EAGAIN round-trip
+                break
+        if chunks:
+            self.feed(b''.join(chunks))
+
+    def read(self, name):
+        """Returns the latest value for a metric, or None if none has been seen (or the reader died)."""
+        if self._fd is None:
+            return None
+        return self.latest.get(name)
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+                self.process.wait(timeout=0.2)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+            except ProcessLookupError:
+                pass
+        self.process.stdout.close()
+        self.process = None
+        self._fd = None
+
+
+class CaptureFileTail(_ExportLineParser):
+    """
+    Follows a capture file that some other process appends ryzen_monitor output to
+    (e.g. `sudo ryzen_monitor --test-export >> /tmp/rm.log`).
+
+    Only bytes past the last read offset are read, so a poll costs the same no
+    matter how long the capture has been running. Once the file grows past
+    max_bytes it is truncated back to zero; that is only safe if the writer opened
+    it in append mode (`>>`), otherwise it keeps writing at its old offset, and a
+    line written between the last read and the truncation is dropped (the next
+    one refreshes the value).
+    A truncation or rotation done by someone else is detected and followed.
+    """
+
+    def __init__(self, path, metrics, max_bytes=1 << 20):
+        """
+        Args:
+            path (str): Capture file to follow.
+            metrics (dict): See _ExportLineParser.
+            max_bytes (int): Size after which the capture is truncated; 0 disables truncation.
+        """
+        super().__init__(metrics)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._fd = None
+        self._inode = None
+        self._offset = 0
+
+    @property
+    def alive(self):
+        return self._fd is not None
+
+    def _open(self, from_end):
+        self._fd = os.open(self.path, os.O_RDONLY)
+        st = os.fstat(self._fd)
+        self._inode = st.st_ino
+        # Start close to the end: the newest lines are all that matter.
+        self._offset = max(0, st.st_size - 65536) if from_end else 0
+        self._partial = b''
+
+    def start(self, startup_timeout_s=0.5):
+        """Opens the capture file and waits (up to startup_timeout_s) for every metric to appear."""
+        try:
+            self._open(from_end=True)
+        except OSError:
+            return False
+        self._wait_for_metrics(startup_timeout_s)
+        return True
+
+    def poll(self):
+        """Reads the bytes appended since the last poll and updates `latest`."""
+        if self._fd is None:
+            return
+        try:
+            path_inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            path_inode = None
+        if path_inode is not None and path_inode != self._inode:
+            # Rotated: finish whatever is left in the old file, then switch over.
+            self._read_new_bytes()
+            os.close(self._fd)
+            self._open(from_end=False)
+        self._read_new_bytes()
+        if self.max_bytes and self._offset >= self.max_bytes and not self._partial:
+            os.truncate(self.path, 0)
+            self._offset = 0
+
+    def _read_new_bytes(self):
+        size = os.fstat(self._fd).st_size
+        if size < self._offset:  # truncated by someone else
+            self._offset = 0
+            self._partial = b''
+        if size == self._offset:
+            return
+        data = os.pread(self._fd, size - self._offset, self._offset)
+        self._offset += len(data)
+        self.feed(data)
+
+    def read(self, name):
+        """Returns the latest value seen for a metric, or None."""
+        return self.latest.get(name) if self._fd is not None else None
+
+    def stop(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class FanReader:
+    """Keeps a hwmon `fan*_input` file open and re-reads it with a single pread per sample."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self.error = None
+        try:
+            self._fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            # Keep the column and log 0 like the shell logger does when `cat` fails.
+            self.error = e
+
+    def read(self):
+        if self._fd is None:
+            return '0'
+        try:
+            value = os.pread(self._fd, 32, 0).strip()
+        except OSError:
+            return '0'
+        # Same rules as the shell logger: empty or non-integer readings become 0.
+        return value.decode() if value.isdigit() else '0'
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def build_header(has_fan, has_set_ppt, has_mprime_threads):
+    header = ['Timestamp', 'CPU_Power_W_Actual', 'CPU_Temp_C']
+    if has_fan:
+        header.append('CPU_Fan_RPM')
+    header.append('Ambient_Temp_C')
+    if has_set_ppt:
+        header.append('Set_PPT_W')
+    if has_mprime_threads:
+        header.append('Mprime_Threads')
+    header += ['Segment', 'Phase']
+    return ','.join(header)
+
+
+SEGMENTS_HEADER = ('Segment,Phase,Set_PPT_W,Mprime_Threads,Start,Duration_S,Samples,'
+                   'Missed_Ticks,Jitter_Mean_ms,Jitter_Std_ms,Jitter_Max_ms,Settle_S')
+
+
+class SegmentControl:
+    """
+    Labels of the segment currently being logged (phase, PPT set-point, mprime threads).
+
+    emu.sh keeps one sampler running for the whole orchestration and announces
+    segment boundaries by rewriting a one-line control file:
+
+        <phase> <set_ppt> <mprime_threads>
+
+    Checking for a change costs a single stat() per sample.
+    """
+
+    def __init__(self, path, phase, set_ppt, mprime_threads):
+        self.path = path
+        self.phase = phase
+        self.set_ppt = set_ppt
+        self.mprime_threads = mprime_threads
+        self.segment_id = 0
+        self._signature = None
+
+    def check(self):
+        """Re-reads the control file if it changed. Returns True when a new segment starts."""
+        if not self.path:
+            return False
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if signature == self._signature or st.st_size == 0:
+            return False
+        with open(self.path) as f:
+            fields = f.read().split()
+        if len(fields) != 3:  # caught emu.sh mid-write; look again next tick
+            return False
+        self._signature = signature
+        if fields == [self.phase, self.set_ppt, self.mprime_threads]:
+            return False
+        self.phase, self.set_ppt, self.mprime_threads = fields
+        self.segment_id += 1
+        return True
+
+
+class ConvergenceTracker:
+    """
+    Trailing least-squares dT/dt of the current segment, for adaptive warm-up/cool-down.
+
+    Keeps running sums over the readings of the last `window_s` seconds so each
+    sample costs O(1). A segment has settled once a full window has a slope below
+    `max_slope_c_per_min`; the first time that happens is latched in settle_s.
+    """
+
+    def __init__(self, window_s=30.0, max_slope_c_per_min=1.0):
+        self.window_s = window_s
+        self.max_slope_c_per_min = max_slope_c_per_min
+        self.reset(0.0)
+
+    def reset(self, start_ts):
+        self.start_ts = start_ts
+        self.settle_s = None
+        self.slope_c_per_min = None
+        self._points = collections.deque()
+        self._sum_t = self._sum_y = self._sum_tt = self._sum_ty = 0.0
+
+    def add(self, ts, temp_text):
+        """Adds one temperature reading (as logged); read-error markers are skipped."""
+        try:
+            y = float(temp_text)
+        except ValueError:
+            return
+        t = ts - self.start_ts
+        self._points.append((t, y))
+        self._sum_t += t
+        self._sum_y += y
+        self._sum_tt += t * t
+        self._sum_ty += t * y
+        while t - self._points[0][0] > self.window_s:
+            old_t, old_y = self._points.popleft()
+            self._sum_t -= old_t
+            self._sum_y -= old_y
+            self._sum_tt -= old_t * old_t
+            self._sum_ty -= old_t * old_y
+        n = len(self._points)
+        denominator = n * self._sum_tt - self._sum_t * self._sum_t
+        if n < 3 or denominator <= 0:
+            return
+        self.slope_c_per_min = 60.0 * (n * self._sum_ty - self._sum_t * self._sum_y) / denominator
+        # The window counts as full once it spans window_s, allowing for the last sample gap.
+        full = t - self._points[0][0] >= self.window_s - (t - self._points[-2][0])
+        if self.settle_s is None and full and abs(self.slope_c_per_min) <= self.max_slope_c_per_min:
+            self.settle_s = t
+
+
+class StatusFile:
+    """
+    One-line live status for emu.sh, replaced atomically:
+
+        <phase> <set_ppt> <mprime_threads> <segment> <settled 0|1> <elapsed_s> <dT/dt C/min>
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + '.tmp'
+
+    def write(self, control, tracker, elapsed_s):
+        slope = 'nan' if tracker.slope_c_per_min is None else f'{tracker.slope_c_per_min:.3f}'
+        with open(self._tmp_path, 'w') as f:
+            f.write(f'{control.phase} {control.set_ppt} {control.mprime_threads} {control.segment_id} '
+                    f'{0 if tracker.settle_s is None else 1} {elapsed_s:.1f} {slope}\n')
+        os.replace(self._tmp_path, self.path)
+
+
+class TimestampFormatter:
+    """Formats epoch seconds like `date +"%Y-%m-%d %H:%M:%S.%3N"`, re-running strftime only once per second."""
+
+    _MILLIS = [f'.{ms:03d}' for ms in range(1000)]
+
+    def __init__(self):
+        self._second = None
+        self._prefix = ''
+
+    def __call__(self, epoch_s):
+        second, ms = divmod(int(round(epoch_s * 1000)), 1000)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        return self._prefix + self._MILLIS[ms]
+
+
+class TickScheduler:
+    """
+    Deadline-based sampling clock.
+
+    Tick k is due at start + k * interval on time.monotonic(), so the time spent
+    sampling does not stretch the period. A tick that is more than a whole
+    interval late is skipped and counted as missed rather than bunching samples
+    together. The timestamp handed out for tick k is start_wall + k * interval,
+    which gives the log an exactly uniform time base; how late each sample was
+    actually taken is kept as jitter statistics per segment.
+    """
+
+    def __init__(self, interval_s):
+        self.interval_s = interval_s
+        self.start_mono = time.monotonic()
+        self.start_wall = time.time()
+        self.tick = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._count = 0
+        self._missed = 0
+        self._lateness_sum = 0.0
+        self._lateness_sq_sum = 0.0
+        self._lateness_max = 0.0
+
+    def elapsed(self):
+        return time.monotonic() - self.start_mono
+
+    def timestamp(self, tick):
+        return self.start_wall + tick * self.interval_s
+
+    def wait(self):
+        """Sleeps until the next tick is due and returns its (exact) wall-clock timestamp."""
+        deadline = self.start_mono + self.tick * self.interval_s
+        now = time.monotonic()
+        if now < deadline:
+            time.sleep(deadline - now)
+            now = time.monotonic()
+        lateness = now - deadline
+        if lateness >= self.interval_s:
+            skipped = int(lateness // self.interval_s)
+            self.tick += skipped
+            self._missed += skipped
+            lateness -= skipped * self.interval_s
+        self._count += 1
+        self._lateness_sum += lateness
+        self._lateness_sq_sum += lateness * lateness
+        if lateness > self._lateness_max:
+            self._lateness_max = lateness
+        ts = self.timestamp(self.tick)
+        self.tick += 1
+        return ts
+
+    def stats(self):
+        """Returns missed ticks and jitter (lateness of each sample, in ms) since the last reset_stats()."""
+        n = self._count
+        mean = self._lateness_sum / n if n else 0.0
+        var = max(0.0, self._lateness_sq_sum / n - mean * mean) if n else 0.0
+        return {
+            'missed_ticks': self._missed,
+            'jitter_mean_ms': 1000.0 * mean,
+            'jitter_std_ms': 1000.0 * var ** 0.5,
+            'jitter_max_ms': 1000.0 * self._lateness_max,
+        }
+
+
+class _StopRequested(Exception):
+    pass
+
+
+def _raise_stop(signum, frame):
+    raise _StopRequested()
+
+
+def run_sampler(output_file, read_cmd, ambient_temp_c,
+                duration_s=None,
+                sampling_interval_s=1.0,
+                fan_file=None,
+                set_ppt=None,
+                mprime_threads=None,
+                phase='measure',
+                control_file=None,
+                temp_line_pattern='cpu_thm', temp_field='cpu_thm',
+                power_line_pattern='cpu_ppt', power_field='cpu_ppt',
+                capture_file=None,
+                capture_max_bytes=1 << 20,
+                startup_timeout_s=5.0,
+                segments_file=None,
+                binary_log=None,
+                write_header=False,
+                flush_interval_s=1.0,
+                fsync_interval_s=10.0,
+                console_interval_s=1.0,
+                status_file=None,
+                settle_window_s=30.0,
+                settle_slope_c_per_min=1.0,
+                sensors=None,
+                sensors_file=None,
+                sensors_layout='wide',
+                sysfs_root=DEFAULT_SYSFS_ROOT,
+                ambient_file=None,
+                ambient_scale=1.0,
+                profile_file=None,
+                controller=None,
+                control_input='CPU_Temp_C'):
+    """
+    Samples CPU power, temperature and fan RPM into a CSV file.
+
+    The ryzen_monitor reader is started once and kept for the whole run; segment
+    boundaries (warm-up, measurement, cool-down of each PPT step) are recorded
+    in the Segment and Phase columns instead of restarting the reader.
+
+    Args:
+        output_file (str): CSV file to append rows to.
+        read_cmd (str): Command streaming ryzen_monitor export lines.
+        ambient_temp_c (str): Ambient temperature logged with every row (the fallback
+                              value if ambient_file is given).
+        duration_s (float): How long to log; None logs until SIGTERM/SIGINT.
+        sampling_interval_s (float): Time between samples (10-100 Hz is fine).
+        fan_file (str): hwmon fan*_input file, or None to omit the fan column.
+        set_ppt (str): Initial PPT set-point; None omits the Set_PPT_W column.
+        mprime_threads (str): Initial mprime thread count; None omits the column.
+        phase (str): Initial phase label.
+        control_file (str): Segment control file written by emu.sh (see SegmentControl).
+        temp_line_pattern (str): Regex selecting the temperature line.
+        temp_field (str): Field holding the temperature on that line.
+        power_line_pattern (str): Regex selecting the power line.
+        power_field (str): Field holding the package power on that line.
+        capture_file (str): Follow this capture file instead of running read_cmd.
+        capture_max_bytes (int): Truncate the capture file once it exceeds this size.
+        startup_timeout_s (float): How long to wait for the first temperature and
+                                   power readings before logging starts.
+        segments_file (str): Sidecar CSV receiving one row per finished segment
+                             (duration, samples, missed ticks, jitter).
+        binary_log (str): Also write every sample to this fixed-width binary log (see binlog.py).
+        write_header (bool): Truncate the file and write the CSV header first.
+        flush_interval_s (float): How often buffered rows are flushed to disk.
+        fsync_interval_s (float): Minimum time between fsyncs of the logs
+                                  (0 = on every flush, None = never).
+        console_interval_s (float): How often the status line is refreshed.
+        status_file (str): Live status file for emu.sh's adaptive warm-up/cool-down
+                           (see StatusFile), rewritten every console_interval_s and
+                           whenever the segment changes or settles.
+        settle_window_s (float): Window of the dT/dt test (see ConvergenceTracker).
+        settle_slope_c_per_min (float): |dT/dt| below which a segment has settled.
+        sensors (str): Extra channels to log to sensors_file, as 'source[:interval_s],...'
+                       (see sensors.py, e.g. 'hwmon,cpufreq:0.25,rapl').
+        sensors_file (str): Sidecar CSV for the extra channels (and the ambient probe).
+        sensors_layout (str): 'wide' (a column per channel) or 'long' (a row per reading).
+        sysfs_root (str): sysfs tree the extra channels are discovered under.
+        ambient_file (str): File holding the ambient temperature (e.g. a probe's hwmon
+                            temp*_input); read on every sample into Ambient_Temp_C.
+        ambient_scale (float): Factor from the file's value to °C (0.001 for millidegrees).
+        profile_file (str): Write per-segment stage latency histograms and the
+                            logger's CPU time and RSS here (see profiler.py).
+        controller (controller.PPTController): Adjusts the PPT limit from every sample;
+                                               Set_PPT_W then logs the PPT in force.
+        control_input (str): Temperature the controller acts on: 'CPU_Temp_C' or the
+                             name of a sensors channel (e.g. 'k10temp_Tctl_C').
+
+    Returns:
+        dict: Summary with the number of samples and segments, wall time and CPU time used.
+    """
+    previous_sigterm = signal.signal(signal.SIGTERM, _raise_stop)
+    if ambient_temp_c is None:
+        ambient_temp_c = 'N/A'
+    metrics = {
+        'temp': (temp_line_pattern, temp_field),
+        'power': (power_line_pattern, power_field),
+    }
+    if capture_file:
+        stream = CaptureFileTail(capture_file, metrics, max_bytes=capture_max_bytes)
+    else:
+        stream = RyzenMonitorStream(read_cmd, metrics)
+    fan = None
+    has_set_ppt = set_ppt is not None or controller is not None
+    has_mprime_threads = mprime_threads is not None
+    control = SegmentControl(control_file, phase,
+                             set_ppt if has_set_ppt else 'N/A',
+                             mprime_threads if has_mprime_threads else 'N/A')
+    format_timestamp = TimestampFormatter()
+    samples_taken = 0
+    start_cpu = time.process_time()
+    scheduler = None
+    segments_out = None
+    binlog = None
+    tracker = ConvergenceTracker(settle_window_s, settle_slope_c_per_min)
+    status = StatusFile(status_file) if status_file else None
+    sensor_set = None
+    sensor_log = None
+    ambient = None
+    profiler = StageProfiler(profile_file) if profile_file else None
+    clock = time.perf_counter_ns
+
+    def segment_labels():
+        # Columns after the ambient reading only change at segment boundaries.
+        row_tail = ''
+        console_tail = ''
+        if has_set_ppt:
+            row_tail += f',{control.set_ppt}'
+            console_tail += f', SetPPT={control.set_ppt}W'
+        if has_mprime_threads:
+            row_tail += f',{control.mprime_threads}'
+            console_tail += f', MprimeThr={control.mprime_threads}'
+        row_tail += f',{control.segment_id},{control.phase}\n'
+        console_tail += f', Seg={control.segment_id}/{control.phase}'
+        labels = (control.segment_id, control.phase, control.set_ppt, control.mprime_threads)
+        return row_tail, console_tail, labels
+
+    def finish_segment(end_ts=None):
+        stats = scheduler.stats()
+        if end_ts is None:
+            end_ts = scheduler.timestamp(scheduler.tick)
+        duration = end_ts - segment_start_ts
+        segment_id, segment_phase = segment_info[0], segment_info[1]
+        settle = '' if tracker.settle_s is None else f'{tracker.settle_s:.1f}'
+        print(f"\nFinished segment {segment_id} ({segment_phase}): {segment_samples} samples over "
+              f"{duration:.1f} seconds; missed ticks: {stats['missed_ticks']}, jitter mean/std/max: "
+              f"{stats['jitter_mean_ms']:.2f}/{stats['jitter_std_ms']:.2f}/{stats['jitter_max_ms']:.2f} ms"
+              f"{f'; settled after {settle} seconds' if settle else ''}.")
+        if segments_out is not None:
+            segments_out.write(','.join(str(v) for v in segment_info) +
+                               f',{format_timestamp(segment_start_ts)},{duration:.3f},{segment_samples},'
+                               f"{stats['missed_ticks']},{stats['jitter_mean_ms']:.3f},"
+                               f"{stats['jitter_std_ms']:.3f},{stats['jitter_max_ms']:.3f},{settle}\n")
+            segments_out.flush()
+        if profiler is not None:
+            profiler.finish_segment(segment_id, segment_phase)
+        scheduler.reset_stats()
+
+    try:
+        if fan_file:
+            fan = FanReader(fan_file)
+            if fan.error is not None:
+                print(f"Error: Cannot open fan file '{fan_file}' ({fan.error.strerror}). "
+                      "CPU_Fan_RPM will be 0.", file=sys.stderr)
+        channels = discover_channels(sensors, sysfs_root) if sensors else []
+        if ambient_file:
+            ambient = Channel('Ambient_Temp_C', ambient_file, ambient_scale, 1)
+            channels.insert(0, ambient)
+        if channels:
+            sensor_set = SensorSet(channels)
+            print(f"Sampling {len(channels)} sensor channels"
+                  f"{f' into {sensors_file} ({sensors_layout})' if sensors_file else ''}.")
+            if sensors_file:
+                sensor_log = SensorLog(sensors_file, sensor_set, sensors_layout)
+        if controller is not None and control_input != 'CPU_Temp_C' and \
+                (sensor_set is None or control_input not in sensor_set.latest):
+            raise ValueError(f"control input '{control_input}' is neither CPU_Temp_C nor a sensor channel")
+        control.check()
+        stream_ok = stream.start(startup_timeout_s=startup_timeout_s)
+        reader_process = getattr(stream, 'process', None)  # None when following a capture file
+        if profiler is not None and reader_process is not None:
+            # start_new_session: the shell's pid is the group id shared with the real reader.
+            profiler.watch_reader(reader_process.pid)
+        if not stream_ok:
+            print(f"Critical Error: Failed to start ryzen_monitor READ: '{capture_file or read_cmd}'. "
+                  "CPU Temp/Power will be RMStartFail.", file=sys.stderr)
+
+        if segments_file:
+            segments_out = open(segments_file, 'w')
+            segments_out.write(SEGMENTS_HEADER + '\n')
+        csv_header = build_header(fan is not None, has_set_ppt, has_mprime_threads)
+        if binary_log:
+            binlog = BinaryLogWriter(binary_log, csv_header, sampling_interval_s, fan is not None,
+                                     has_set_ppt, has_mprime_threads, fsync_interval_s=fsync_interval_s)
+        with open(output_file, 'w' if write_header else 'a', buffering=1 << 16) as out:
+            if write_header:
+                out.write(csv_header + '\n')
+            row_tail, console_tail, segment_info = segment_labels()
+            segment_samples = 0
+            scheduler = TickScheduler(sampling_interval_s)
+            segment_start_ts = scheduler.start_wall
+            tracker.reset(segment_start_ts)
+            if status is not None:
+                status.write(control, tracker, 0.0)
+            last_flush = last_console = last_fsync = scheduler.start_mono
+            rows = []  # CSV rows since the last flush, handed to the file in one write
+            try:
+                while duration_s is None or scheduler.elapsed() < duration_s:
+                    sample_ts = scheduler.wait()
+                    if control.check():
+                        finish_segment(sample_ts)
+                        if controller is not None:  # the controller, not the control file, owns Set_PPT_W
+                            control.set_ppt = controller.set_ppt_label
+                        row_tail, console_tail, segment_info = segment_labels()
+                        segment_samples = 0
+                        segment_start_ts = sample_ts
+                        tracker.reset(sample_ts)
+                        if status is not None:
+                            status.write(control, tracker, 0.0)
+                    # Stage boundaries for the self-profile (see profiler.STAGES); ~50 ns per mark.
+                    mark_rm = clock()
+                    stream.poll()
+                    if stream_ok:
+                        cpu_temp_c = stream.read('temp') or 'ReadErrRMThm'
+                        cpu_power_w = stream.read('power') or 'ReadErrRMPpt'
+                    else:
+                        cpu_temp_c = cpu_power_w = 'RMStartFail'
+                    mark_fan = clock()
+                    fan_rpm = fan.read() if fan is not None else 'N/A'
+                    mark_sensors = clock()
+                    if sensor_set is not None:
+                        readings = sensor_set.sample()
+                        if ambient is not None and sensor_set.latest[ambient.name] != 'N/A':
+                            ambient_temp_c = sensor_set.latest[ambient.name]
+
+                    mark_format = clock()
+                    timestamp_text = format_timestamp(sample_ts)
+                    if fan is not None:
+                        row = f'{timestamp_text},{cpu_power_w},{cpu_temp_c},{fan_rpm},{ambient_temp_c}{row_tail}'
+                    else:
+                        row = f'{timestamp_text},{cpu_power_w},{cpu_temp_c},{ambient_temp_c}{row_tail}'
+                    mark_write = clock()
+                    rows.append(row)
+                    if binlog is not None:
+                        binlog.append(sample_ts, cpu_power_w, cpu_temp_c, fan_rpm, ambient_temp_c,
+                                      control.set_ppt, control.mprime_threads, control.segment_id, control.phase)
+                    if sensor_log is not None:
+                        sensor_log.write(timestamp_text, control.segment_id, readings)
+                    mark_flush = clock()
+                    samples_taken += 1
+                    segment_samples += 1
+                    settled = tracker.settle_s is not None
+                    tracker.add(sample_ts, cpu_temp_c)
+                    if status is not None and tracker.settle_s is not None and not settled:
+                        status.write(control, tracker, sample_ts - segment_start_ts)
+                    if controller is not None:
+                        control_temp = cpu_temp_c if control_input == 'CPU_Temp_C' else sensor_set.latest[control_input]
+                        if controller.update(sample_ts, timestamp_text, control.segment_id, control_temp,
+                                             cpu_power_w, ambient_temp_c):
+                            # Takes effect from the next row; the segment keeps the labels it started with.
+                            control.set_ppt = controller.set_ppt_label
+                            row_tail, console_tail, _ = segment_labels()
+
+                    now = time.monotonic()
+                    if now - last_flush >= flush_interval_s:
+                        out.write(''.join(rows))
+                        rows.clear()
+                        out.flush()
+                        if binlog is not None:
+                            binlog.flush()
+                        if sensor_log is not None:
+                            sensor_log.flush()
+                        if controller is not None:
+                            controller.flush()
+                        if fsync_interval_s is not None and now - last_fsync >= fsync_interval_s:
+                            os.fsync(out.fileno())
+                            last_fsync = now
+                        last_flush = now
+                    if profiler is not None:
+                        profiler.add((mark_rm, mark_fan, mark_sensors, mark_format, mark_write, mark_flush, clock()))
+                    if now - last_console >= console_interval_s:
+                        if status is not None:
+                            status.write(control, tracker, sample_ts - segment_start_ts)
+                        print(f'Logged: P_act={cpu_power_w}W, T={cpu_temp_c}C, F={fan_rpm}RPM, '
+                              f'Amb={ambient_temp_c}C{console_tail}',
+                              end='\r', flush=True)
+                        last_console = now
+                finish_segment()
+            finally:
+                out.write(''.join(rows))
+    except (_StopRequested, KeyboardInterrupt):
+        if samples_taken:
+            finish_segment()
+    finally:
+        stream.stop()
+        if fan is not None:
+            fan.close()
+        if segments_out is not None:
+            segments_out.close()
+        if binlog is not None:
+            binlog.close()
+        if sensor_log is not None:
+            sensor_log.close()
+        if sensor_set is not None:
+            sensor_set.close()
+        if profiler is not None:
+            profiler.close()
+        if controller is not None:
+            controller.close()
+        signal.signal(signal.SIGTERM, previous_sigterm)
+
+    wall_s = scheduler.elapsed() if scheduler is not None else 0.0
+    cpu_s = time.process_time() - start_cpu
+    return {
+        'samples': samples_taken,
+        'segments': control.segment_id + 1,
+        'wall_s': wall_s,
+        'cpu_s': cpu_s,
+        'overhead_pct': 100.0 * cpu_s / wall_s if wall_s > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sample ryzen_monitor power/temperature and hwmon fan RPM into a CSV log.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("output_file",
+                        help="CSV file to append samples to.")
+    parser.add_argument("--read_cmd", default="ryzen_monitor --test-export",
+                        help="Command that streams ryzen_monitor export lines.")
+    parser.add_argument("--ambient_temp", default=None,
+                        help="Ambient temperature (°C) logged with every row (fallback for --ambient_file).")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Seconds to log for. Omit to log until interrupted.")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Sampling interval in seconds. The sampler's own CPU use stays under 0.5%% of a core "
+                             "down to 0.05 s (20 Hz); at 0.01 s (100 Hz) it is about 2%%, most of it waking up for "
+                             "each tick.")
+    parser.add_argument("--fan_file", default=None,
+                        help="hwmon fan*_input file. Omit to leave out the CPU_Fan_RPM column.")
+    parser.add_argument("--set_ppt", default=None,
+                        help="PPT set-point (W) to log in Set_PPT_W ('N/A' just adds the column for --control_file).")
+    parser.add_argument("--mprime_threads", default=None,
+                        help="mprime thread count to log in Mprime_Threads ('N/A' just adds the column).")
+    parser.add_argument("--phase", default="measure",
+                        help="Phase label for the first segment.")
+    parser.add_argument("--control_file", default=None,
+                        help="File holding '<phase> <set_ppt> <mprime_threads>'; rewriting it starts a new segment.")
+    parser.add_argument("--startup_timeout", type=float, default=5.0,
+                        help="Seconds to wait for the first ryzen_monitor readings before logging starts.")
+    parser.add_argument("--temp_pattern", default="cpu_thm",
+                        help="Pattern selecting the temperature line.")
+    parser.add_argument("--temp_field", default="cpu_thm",
+                        help="Temperature field name on that line.")
+    parser.add_argument("--power_pattern", default="cpu_ppt",
+                        help="Pattern selecting the power line.")
+    parser.add_argument("--power_field", default="cpu_ppt",
+                        help="Power field name on that line.")
+    parser.add_argument("--rm_capture_file", default=None,
+                        help="Follow a file that ryzen_monitor output is appended to (>>) instead of running --read_cmd.")
+    parser.add_argument("--capture_max_bytes", type=int, default=1 << 20,
+                        help="Truncate the capture file once it grows past this many bytes (0 = never).")
+    parser.add_argument("--segments_file", default=None,
+                        help="Sidecar CSV with one row of timing/jitter statistics per segment.")
+    parser.add_argument("--binary_log", default=None,
+                        help="Also write samples to this fixed-width binary log (see binlog.py).")
+    parser.add_argument("--write_header", action="store_true",
+                        help="Truncate the output file and write the CSV header first.")
+    parser.add_argument("--flush_interval", type=float, default=1.0,
+                        help="Seconds between flushes of buffered rows.")
+    parser.add_argument("--fsync_interval", type=float, default=10.0,
+                        help="Minimum seconds between fsyncs of the logs (0 = every flush, negative = never).")
+    parser.add_argument("--status_file", default=None,
+                        help="Live status file (segment, settled flag, dT/dt) for adaptive warm-up/cool-down.")
+    parser.add_argument("--settle_window", type=float, default=30.0,
+                        help="Seconds of readings the dT/dt settle test looks at.")
+    parser.add_argument("--settle_slope", type=float, default=1.0,
+                        help="|dT/dt| (°C/min) below which a segment counts as settled.")
+    parser.add_argument("--sensors", default=None,
+                        help="Extra channels as 'source[:interval_s],...' (sources: hwmon, cpufreq, rapl; see sensors.py).")
+    parser.add_argument("--sensors_file", default=None,
+                        help="Sidecar CSV receiving the --sensors channels and the ambient probe.")
+    parser.add_argument("--sensors_layout", choices=["wide", "long"], default="wide",
+                        help="One column per channel (wide) or one Timestamp,Segment,Channel,Value row per reading (long).")
+    parser.add_argument("--sysfs_root", default=DEFAULT_SYSFS_ROOT,
+                        help="sysfs tree to discover --sensors channels under.")
+    parser.add_argument("--ambient_file", default=None,
+                        help="File holding the ambient temperature (e.g. a probe's hwmon temp*_input), read every sample.")
+    parser.add_argument("--ambient_scale", type=float, default=1.0,
+                        help="Factor from the --ambient_file value to °C (0.001 for hwmon millidegrees).")
+    parser.add_argument("--profile_file", default=None,
+                        help="Write per-segment stage latencies and logger CPU/RSS as JSON lines (see profiler.py).")
+    parser.add_argument("--control_input", default="CPU_Temp_C",
+                        help="Temperature the PPT controller acts on: CPU_Temp_C or a --sensors channel name.")
+    add_controller_args(parser)
+
+    args = parser.parse_args()
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.ambient_temp is None and args.ambient_file is None:
+        parser.error("one of --ambient_temp or --ambient_file is required")
+    try:
+        if args.sensors:
+            parse_sensor_spec(args.sensors)
+        controller = controller_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if controller is not None and args.control_input != 'CPU_Temp_C' and not args.sensors:
+        parser.error("--control_input other than CPU_Temp_C needs the channel in --sensors")
+
+    summary = run_sampler(
+        args.output_file,
+        args.read_cmd,
+        args.ambient_temp,
+        duration_s=args.duration,
+        sampling_interval_s=args.interval,
+        fan_file=args.fan_file,
+        set_ppt=args.set_ppt,
+        mprime_threads=args.mprime_threads,
+        phase=args.phase,
+        control_file=args.control_file,
+        temp_line_pattern=args.temp_pattern,
+        temp_field=args.temp_field,
+        power_line_pattern=args.power_pattern,
+        power_field=args.power_field,
+        capture_file=args.rm_capture_file,
+        capture_max_bytes=args.capture_max_bytes,
+        startup_timeout_s=args.startup_timeout,
+        segments_file=args.segments_file,
+        binary_log=args.binary_log,
+        write_header=args.write_header,
+        flush_interval_s=args.flush_interval,
+        fsync_interval_s=args.fsync_interval if args.fsync_interval >= 0 else None,
+        status_file=args.status_file,
+        settle_window_s=args.settle_window,
+        settle_slope_c_per_min=args.settle_slope,
+        sensors=args.sensors,
+        sensors_file=args.sensors_file,
+        sensors_layout=args.sensors_layout,
+        sysfs_root=args.sysfs_root,
+        ambient_file=args.ambient_file,
+        ambient_scale=args.ambient_scale,
+        profile_file=args.profile_file,
+        controller=controller,
+        control_input=args.control_input
+    )
+    print(f"Sampler stopped ({summary['samples']} samples in {summary['segments']} segments "
+          f"over {summary['wall_s']:.1f} seconds). Sampler self-overhead: {summary['cpu_s']:.3f}s CPU = {summary['overhead_pct']:.2f}% of one core.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Multi-channel sensor acquisition for sampler.py.
+
+Sensor sources are registered by name in SENSOR_SOURCES; each discovers its
+channels under a sysfs root:
+
+    hwmon    every hwmon temp*_input (°C) and fan*_input (RPM)
+    cpufreq  per-core current frequency (MHz) from cpufreq/scaling_cur_freq
+    rapl     package/core power (W) from powercap energy_uj counters
+
+Every channel keeps its file open for the whole run and is re-read with one
+pread, so a sample of dozens of channels costs dozens of syscalls and no
+process spawns. Channels can have their own sampling interval; SensorSet only
+reads the ones that are due. SensorLog writes the readings to a sidecar CSV,
+either wide (one column per channel, latest value held) or long
+(Timestamp,Segment,Channel,Value, one row per reading).
+
+    python3 sensors.py list --sensors hwmon,cpufreq,rapl
+"""
+import argparse
+import glob
+import math
+import os
+import re
+import sys
+import time
+
+DEFAULT_SYSFS_ROOT = '/sys'
+MISSING = 'N/A'
+
+
+def _channel_name(*parts):
+    return re.sub(r'[^0-9A-Za-z_.+-]+', '_', '_'.join(p for p in parts if p)).strip('_')
+
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+class Channel:
+    """
+    One numeric sysfs-style file, kept open and re-read with a single pread.
+
+    The raw integer is multiplied by `scale` and formatted with `decimals`
+    decimals; unreadable or non-numeric readings become N/A.
+    """
+
+    def __init__(self, name, path, scale=1.0, decimals=0, interval_s=None):
+        """
+        Args:
+            name (str): Column name.
+            path (str): File holding one number.
+            scale (float): Factor to the logged unit (e.g. 0.001 for millidegrees).
+            decimals (int): Decimals to log.
+            interval_s (float): Sampling interval; None reads it on every sample.
+        """
+        self.name = name
+        self.path = path
+        self.scale = scale
+        self.decimals = decimals
+        self.interval_s = interval_s
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read_raw(self):
+        try:
+            return float(os.pread(self._fd, 64, 0).strip())
+        except (OSError, ValueError):
+            return None
+
+    def read(self, now):
+        """Returns the current value as logged text. `now` is time.monotonic()."""
+        raw = self.read_raw()
+        if raw is None:
+            return MISSING
+        return f'{raw * self.scale:.{self.decimals}f}'
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class EnergyCounterChannel(Channel):
+    """
+    Average power between two reads of a cumulative microjoule counter (powercap energy_uj).
+
+    The counter wraps at max_energy_range_uj; a single wrap between reads is
+    accounted for. The first read only primes the counter and returns N/A.
+    """
+
+    def __init__(self, name, path, max_range_uj=None, decimals=2, interval_s=None):
+        super().__init__(name, path, 1e-6, decimals, interval_s)
+        self.max_range_uj = max_range_uj
+        self._last = None
+
+    def read(self, now):
+        raw = self.read_raw()
+        if raw is None:
+            self._last = None
+            return MISSING
+        last, self._last = self._last, (now, raw)
+        if last is None or now <= last[0]:
+            return MISSING
+        delta = raw - last[1]
+        if delta < 0:
+            if not self.max_range_uj:
+                return MISSING
+            delta += self.max_range_uj
+        return f'{delta * self.scale / (now - last[0]):.{self.decimals}f}'
+
+
+def _open_channels(candidates):
+    """Builds channels from (constructor, args, kwargs), skipping files that cannot be opened (e.g. root-only)."""
+    channels = []
+    for make, args, kwargs in candidates:
+        try:
+            channels.append(make(*args, **kwargs))
+        except OSError:
+            pass
+    return channels
+
+
+def _numeric_suffix(path):
+    digits = re.findall(r'\d+', os.path.basename(path))
+    return int(digits[-1]) if digits else -1
+
+
+def discover_hwmon(sysfs_root=DEFAULT_SYSFS_ROOT, interval_s=None):
+    """Every hwmon temperature (°C, from millidegrees) and fan (RPM) input."""
+    candidates = []
+    hwmon_dirs = os.path.join(sysfs_root, 'class', 'hwmon', 'hwmon*')
+    for device in sorted(glob.glob(hwmon_dirs), key=_numeric_suffix):
+        device_name = _read_text(os.path.join(device, 'name')) or os.path.basename(device)
+        for kind, unit, scale, decimals in (('temp', 'C', 0.001, 1), ('fan', 'RPM', 1.0, 0)):
+            for input_file in sorted(glob.glob(os.path.join(device, f'{kind}*_input')), key=_numeric_suffix):
+                label = _read_text(input_file[:-len('_input')] + '_label') or os.path.basename(input_file)[:-len('_input')]
+                name = _channel_name(device_name, label, unit)
+                candidates.append((Channel, (name, input_file, scale, decimals, interval_s), {}))
+    return _open_channels(candidates)
+
+
+def discover_cpufreq(sysfs_root=DEFAULT_SYSFS_ROOT, interval_s=None):
+    """Current frequency (MHz, from kHz) of every CPU with a cpufreq policy."""
+    pattern = os.path.join(sysfs_root, 'devices', 'system', 'cpu', 'cpu[0-9]*', 'cpufreq', 'scaling_cur_freq')
+    candidates = []
+    for freq_file in sorted(glob.glob(pattern), key=lambda p: _numeric_suffix(os.path.dirname(os.path.dirname(p)))):
+        cpu = os.path.basename(os.path.dirname(os.path.dirname(freq_file)))
+        candidates.append((Channel, (_channel_name(cpu, 'MHz'), freq_file, 0.001, 0, interval_s), {}))
+    return _open_channels(candidates)
+
+
+def discover_rapl(sysfs_root=DEFAULT_SYSFS_ROOT, interval_s=None):
+    """Power (W) of every powercap RAPL zone and sub-zone (package, core, ...)."""
+    candidates = []
+    zones = glob.glob(os.path.join(sysfs_root, 'class', 'powercap', '*rapl*:*'))
+    for zone in sorted(zones):
+        energy_file = os.path.join(zone, 'energy_uj')
+        if not os.path.exists(energy_file):
+            continue
+        zone_name = _read_text(os.path.join(zone, 'name')) or os.path.basename(zone)
+        max_range = _read_text(os.path.join(zone, 'max_energy_range_uj'))
+        name = _channel_name('rapl', os.path.basename(zone).split(':', 1)[-1].replace(':', '.'), zone_name, 'W')
+        candidates.append((EnergyCounterChannel, (name, energy_file),
+                           {'max_range_uj': float(max_range) if max_range.isdigit() else None,
+                            'interval_s': interval_s}))
+    return _open_channels(candidates)
+
+
+SENSOR_SOURCES = {}
+
+
+def register_source(name, discover):
+    """
+    Adds a sensor source to the registry (replacing one with the same name).
+
+    Args:
+        name (str): Name used in --sensors specs.
+        discover (callable): (sysfs_root, interval_s) -> list of Channel.
+    """
+    SENSOR_SOURCES[name] = discover
+    return discover
+
+
+register_source('hwmon', discover_hwmon)
+register_source('cpufreq', discover_cpufreq)
+register_source('rapl', discover_rapl)
+
+
+def parse_sensor_spec(spec):
+    """
+    Parses 'source[:interval_s],...' (e.g. 'hwmon:1,cpufreq:0.25,rapl').
+
+    Returns:
+        list: (source name, interval_s or None) pairs.
+
+    Raises:
+        ValueError: On an unknown source or a bad interval.
+    """
+    sources = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, interval = item.partition(':')
+        if name not in SENSOR_SOURCES:
+            raise ValueError(f"unknown sensor source '{name}' (known: {', '.join(SENSOR_SOURCES)})")
+        interval_s = float(interval) if interval else None
+        if interval_s is not None and interval_s <= 0:
+            raise ValueError(f"sensor interval must be positive, got '{interval}'")
+        sources.append((name, interval_s))
+    return sources
+
+
+def discover_channels(spec, sysfs_root=DEFAULT_SYSFS_ROOT):
+    """Opens the channels of every source in a sensor spec (see parse_sensor_spec)."""
+    channels = []
+    for name, interval_s in parse_sensor_spec(spec):
+        channels += SENSOR_SOURCES[name](sysfs_root, interval_s)
+    return channels
+
+
+class SensorSet:
+    """
+    Channels sampled together, each on its own drift-free schedule.
+
+    A channel with interval_s is read on the first sample at or after each of its
+    deadlines (start + k * interval_s); one without is read on every sample.
+    """
+
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.latest = {channel.name: MISSING for channel in self.channels}
+        self._next_due = [None] * len(self.channels)
+
+    @property
+    def names(self):
+        return [channel.name for channel in self.channels]
+
+    def sample(self, now=None):
+        """Reads the channels that are due. Returns a list of (name, value) readings taken."""
+        if now is None:
+            now = time.monotonic()
+        readings = []
+        for i, channel in enumerate(self.channels):
+            due = self._next_due[i]
+            if due is not None and now < due:
+                continue
+            value = channel.read(now)
+            self.latest[channel.name] = value
+            readings.append((channel.name, value))
+            if channel.interval_s is not None:
+                if due is None:
+                    due = now
+                # Skip deadlines that already passed instead of catching up with a burst.
+                self._next_due[i] = due + channel.interval_s * (math.floor((now - due) / channel.interval_s) + 1)
+        return readings
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+
+class SensorLog:
+    """
+    Sidecar CSV of SensorSet readings.
+
+    wide: Timestamp,Segment,<one column per channel>, a row whenever any channel
+          was read, holding the latest value of the others.
+    long: Timestamp,Segment,Channel,Value, a row per reading.
+    """
+
+    def __init__(self, path, sensor_set, layout='wide'):
+        if layout not in ('wide', 'long'):
+            raise ValueError(f"layout must be 'wide' or 'long', got '{layout}'")
+        self.sensor_set = sensor_set
+        self.layout = layout
+        self._out = open(path, 'w', buffering=1 << 16)
+        if layout == 'wide':
+            self._out.write(','.join(['Timestamp', 'Segment'] + sensor_set.names) + '\n')
+        else:
+            self._out.write('Timestamp,Segment,Channel,Value\n')
+
+    def write(self, timestamp_text, segment, readings):
+        if not readings:
+            return
+        if self.layout == 'wide':
+            latest = self.sensor_set.latest
+            self._out.write(f'{timestamp_text},{segment},' + ','.join(latest[name] for name in self.sensor_set.names) + '\n')
+        else:
+            prefix = f'{timestamp_text},{segment},'
+            self._out.write(''.join(f'{prefix}{name},{value}\n' for name, value in readings))
+
+    def flush(self):
+        self._out.flush()
+
+    def fileno(self):
+        return self._out.fileno()
+
+    def close(self):
+        if not self._out.closed:
+            self._out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List or read the sensor channels sampler.py can log.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("command", choices=["list", "read"],
+                        help="'list' prints the discovered channels, 'read' samples them once.")
+    parser.add_argument("--sensors", default=",".join(SENSOR_SOURCES),
+                        help="Sources as 'source[:interval_s],...'.")
+    parser.add_argument("--sysfs_root", default=DEFAULT_SYSFS_ROOT,
+                        help="Root of the sysfs tree to discover channels under.")
+
+    args = parser.parse_args()
+    try:
+        channels = discover_channels(args.sensors, args.sysfs_root)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.command == "read":
+            for channel in channels:
+                channel.read(time.monotonic())  # energy counters need two reads
+            time.sleep(0.2)
+        for channel in channels:
+            if args.command == "read":
+                print(f"{channel.name:40s} {channel.read(time.monotonic())}")
+            else:
+                interval = 'every sample' if channel.interval_s is None else f'every {channel.interval_s:g}s'
+                print(f"{channel.name:40s} {channel.path}  ({interval})")
+        print(f"{len(channels)} channels.")
+    finally:
+        for channel in channels:
+            channel.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Non-interactive sweeps on several machines or CPU sets at once, merged into one dataset.
+
+emu.sh asks for its settings one prompt at a time and logs one machine. sweep.py
+takes the same settings from a JSON spec and runs them on every target in it:
+
+    {
+      "name": "coolers",
+      "defaults": {"ppt_w": [35, 55, 75], "threads": [8], "warmup_s": 60, "measure_s": 120, "cooldown_s": 60,
+                   "read_cmd": "ryzen_monitor --test-export", "ppt_set_cmd": "ryzen_monitor --set-ppt=",
+                   "ppt_reset_w": 65, "load_cmd": "/opt/mprime/mprime -m{threads} -t", "sensors": "hwmon,rapl"},
+      "targets": [
+        {"name": "rig-a", "host": "root@rig-a", "workdir": "/opt/cpuStressEmu", "config": {"cooler": "NH-D15"}},
+        {"name": "rig-b", "host": "root@rig-b", "workdir": "/opt/cpuStressEmu", "config": {"cooler": "AIO-240"}},
+        {"name": "ccd1", "cpuset": "8-15", "ppt_w": [], "config": {"cooler": "stock"}}
+      ]
+    }
+
+    python3 sweep.py run spec.json --results_dir results/
+    python3 sweep.py summary results/
+
+Each target runs the `agent` command, i.e. emu.sh's sweep loop (set PPT, start
+the load, warm-up/measure/cool-down segments through sampler.py's control file),
+over ssh on its host, or as a local subprocess when it has no "host". A "cpuset"
+runs the target's sampler and load under `cpuset_cmd` (taskset by default, or
+e.g. "systemd-run --scope -p AllowedCPUs={cpus}" for a cgroup). Targets that share
+a host and CPU set, or a host and both sweep PPT (the limit is package-wide), run
+one after another; all others run in parallel.
+
+merge_results() then writes <results_dir>/fleet.csv (every log row tagged with
+Run_ID, Target, Host and Config) and fleet_index.csv (one row per run with its
+config tags, status and row count); load_fleet() and summarize_fleet() derive
+the analysis columns per run so the whole fleet is compared in one pass.
+"""
+import argparse
+import json
+import os
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLER_SCRIPT = os.path.join(SCRIPT_DIR, 'sampler.py')
+
+# Every setting a spec's "defaults" or a target may give, with its default.
+SPEC_DEFAULTS = {
+    'ppt_w': [],  # PPT set-points to sweep; empty sweeps thread counts only
+    'threads': [],  # load thread counts; empty runs without a load command
+    'warmup_s': 30.0,
+    'measure_s': 120.0,
+    'cooldown_s': 60.0,
+    'interval_s': 1.0,
+    'adaptive_settle': False,  # end warm-up/cool-down once sampler.py reports the temperature settled
+    'settle_window_s': 30.0,
+    'settle_slope_c_per_min': 1.0,
+    'read_cmd': 'ryzen_monitor --test-export',
+    'ppt_set_cmd': '',  # PPT value is appended, like emu.sh's "<base> <arg format><value>"
+    'ppt_reset_w': None,
+    'load_cmd': '',  # {threads} is replaced by the thread count
+    'ambient_c': 25.0,
+    'ambient_file': None,
+    'fan_file': None,
+    'sensors': None,
+    'sysfs_root': None,
+    'sampler_args': [],  # extra sampler.py arguments
+    'host': None,
+    'transport': None,  # 'ssh' with a host, 'local' without
+    'workdir': '.',  # checkout of this repository on the host
+    'remote_results_dir': 'sweep_results',
+    'python': 'python3',
+    'ssh_cmd': 'ssh -o BatchMode=yes',
+    'copy_cmd': 'scp -q',
+    'cpuset': None,
+    'cpuset_cmd': 'taskset -c {cpus}',
+    'config': {},
+}
+FLEET_FILE = 'fleet.csv'
+FLEET_INDEX_FILE = 'fleet_index.csv'
+FLEET_SUMMARY_FILE = 'fleet_summary.csv'
+TAG_COLUMNS = ['Run_ID', 'Target', 'Host', 'Config']
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def resolve_targets(spec):
+    """
+    Expands a sweep spec into one plan per target (defaults merged, values checked).
+
+    Args:
+        spec (dict): Parsed spec with "targets" and optionally "name" and "defaults".
+
+    Returns:
+        list: Plan dicts with every SPEC_DEFAULTS key plus name and run_id.
+
+    Raises:
+        ValueError: If the spec is malformed.
+    """
+    sweep_name = str(spec.get('name', 'sweep'))
+    defaults = spec.get('defaults', {})
+    targets = spec.get('targets')
+    if not isinstance(targets, list) or not targets:
+        raise ValueError("spec needs a non-empty 'targets' list")
+    unknown = set(spec) - {'name', 'defaults', 'targets'}
+    if unknown:
+        raise ValueError(f"unknown spec keys: {', '.join(sorted(unknown))}")
+    plans = []
+    for index, target in enumerate(targets):
+        name = str(target.get('name', f'target{index}'))
+        unknown = (set(defaults) | set(target)) - set(SPEC_DEFAULTS) - {'name'}
+        if unknown:
+            raise ValueError(f"target '{name}': unknown settings: {', '.join(sorted(unknown))}")
+        plan = {key: json.loads(json.dumps(value)) for key, value in SPEC_DEFAULTS.items()}
+        plan.update(defaults)
+        plan.update(target)
+        plan['name'] = name
+        plan['run_id'] = f'{sweep_name}-{name}'
+        if not _NAME_RE.match(plan['run_id']):
+            raise ValueError(f"target '{name}': name and sweep name may only use letters, digits, '_', '.' and '-'")
+        try:
+            plan['ppt_w'] = [float(v) for v in plan['ppt_w']]
+            plan['threads'] = [int(v) for v in plan['threads']]
+            for key in ('warmup_s', 'measure_s', 'cooldown_s', 'interval_s', 'ambient_c'):
+                plan[key] = float(plan[key])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"target '{name}': {e}") from None
+        if plan['ppt_w'] and not plan['ppt_set_cmd']:
+            raise ValueError(f"target '{name}': 'ppt_w' needs a 'ppt_set_cmd'")
+        if plan['threads'] and not plan['load_cmd']:
+            raise ValueError(f"target '{name}': 'threads' needs a 'load_cmd'")
+        if plan['interval_s'] <= 0:
+            raise ValueError(f"target '{name}': 'interval_s' must be positive")
+        if not isinstance(plan['config'], dict):
+            raise ValueError(f"target '{name}': 'config' must be an object of tags")
+        plan['transport'] = plan['transport'] or ('ssh' if plan['host'] else 'local')
+        if plan['transport'] not in TRANSPORTS:
+            raise ValueError(f"target '{name}': transport must be one of {', '.join(TRANSPORTS)}")
+        if plan['transport'] == 'ssh' and not plan['host']:
+            raise ValueError(f"target '{name}': the ssh transport needs a 'host'")
+        plans.append(plan)
+    run_ids = [plan['run_id'] for plan in plans]
+    duplicates = sorted({run_id for run_id in run_ids if run_ids.count(run_id) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate target names: {', '.join(duplicates)}")
+    return plans
+
+
+def config_label(config):
+    """Compact 'key=value,...' label of a target's config tags."""
+    return ','.join(f'{key}={config[key]}' for key in sorted(config))
+
+
+# --- agent: one target's sweep, run on the target machine ---
+
+def _cpuset_prefix(plan):
+    if not plan['cpuset']:
+        return []
+    return shlex.split(plan['cpuset_cmd'].format(cpus=plan['cpuset']))
+
+
+def _sampler_command(plan, base):
+    args = [*_cpuset_prefix(plan), sys.executable, SAMPLER_SCRIPT, base + '.csv', '--write_header',
+            '--read_cmd', plan['read_cmd'], '--interval', f"{plan['interval_s']:g}", '--phase', 'idle',
+            '--control_file', base + '.control', '--status_file', base + '.status',
+            '--segments_file', base + '_segments.csv',
+            '--settle_window', f"{plan['settle_window_s']:g}", '--settle_slope', f"{plan['settle_slope_c_per_min']:g}"]
+    if plan['ambient_file']:
+        args += ['--ambient_file', plan['ambient_file']]
+    else:
+        args += ['--ambient_temp', f"{plan['ambient_c']:g}"]
+    if plan['fan_file']:
+        args += ['--fan_file', plan['fan_file']]
+    if plan['sensors']:
+        args += ['--sensors', plan['sensors'], '--sensors_file', base + '_sensors.csv']
+    if plan['sysfs_root']:
+        args += ['--sysfs_root', plan['sysfs_root']]
+    if plan['ppt_w']:
+        args += ['--set_ppt', 'N/A']
+    if plan['threads']:
+        args += ['--mprime_threads', 'N/A']
+    return args + [str(arg) for arg in plan['sampler_args']]
+
+
+class _Agent:
+    """Runs one plan's warm-up/measure/cool-down steps around a background sampler.py."""
+
+    def __init__(self, plan, output_dir, log):
+        self.plan = plan
+        self.base = os.path.join(output_dir, plan['run_id'])
+        self.log = log
+        self.sampler = None
+        self.load = None
+        self.labels = None
+
+    def set_segment(self, phase, set_ppt, threads):
+        # Replaced atomically; sampler.py notices the new inode on its next tick.
+        tmp_path = self.base + '.control.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(f'{phase} {set_ppt} {threads}\n')
+        os.replace(tmp_path, self.base + '.control')
+        self.labels = [phase, set_ppt, threads]
+
+    def check_sampler(self):
+        if self.sampler.poll() is not None:
+            raise RuntimeError(f"sampler.py exited with status {self.sampler.returncode}; nothing is being logged")
+
+    def wait(self, seconds, label):
+        """Waits `seconds`, or until the segment settles in adaptive mode, checking the sampler every second."""
+        adaptive = self.plan['adaptive_settle'] and label != 'Measuring'
+        self.log(f"{label} {'until temperature settles (at most ' if adaptive else 'for '}{seconds:g} s"
+                 f"{')' if adaptive else ''}...")
+        deadline = time.monotonic() + seconds
+        while True:
+            self.check_sampler()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if adaptive:
+                try:
+                    with open(self.base + '.status') as f:
+                        fields = f.read().split()
+                except OSError:
+                    fields = []
+                if len(fields) >= 6 and fields[:3] == self.labels and fields[4] == '1':
+                    self.log(f"{label} settled after {fields[5]} s.")
+                    return
+            time.sleep(min(1.0, remaining))
+
+    def set_ppt(self, ppt_w):
+        command = f"{self.plan['ppt_set_cmd']}{ppt_w:g}"
+        self.log(f"Setting PPT: {command}")
+        return subprocess.run(command, shell=True, stdout=subprocess.DEVNULL).returncode == 0
+
+    def start_load(self, threads):
+        command = [*_cpuset_prefix(self.plan), *shlex.split(self.plan['load_cmd'].format(threads=threads))]
+        self.load = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(1)
+        if self.load.poll() is not None:
+            self.load = None
+            return False
+        return True
+
+    def stop_load(self):
+        if self.load is not None:
+            self.load.terminate()
+            try:
+                self.load.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.load.kill()
+                self.load.wait()
+            self.load = None
+
+    def run(self):
+        plan = self.plan
+        steps = [(ppt, threads) for threads in (plan['threads'] or [None]) for ppt in (plan['ppt_w'] or [None])]
+        # The per-second status lines go to <run_id>_sampler.log rather than into every target's runner output.
+        with open(self.base + '_sampler.log', 'w') as console:
+            self.sampler = subprocess.Popen(_sampler_command(plan, self.base), stdout=console)
+        try:
+            for number, (ppt, threads) in enumerate(steps, 1):
+                ppt_label = 'N/A' if ppt is None else f'{ppt:g}'
+                threads_label = 'N/A' if threads is None else str(threads)
+                settings = ([f'PPT {ppt_label} W'] if ppt is not None else []) + \
+                           ([f'{threads} threads'] if threads is not None else [])
+                self.log(f"Step {number}/{len(steps)}: {', '.join(settings) or 'no load or PPT changes'}")
+                if ppt is not None and not self.set_ppt(ppt):
+                    self.log(f"Warning: setting PPT to {ppt_label} W failed; skipping this step.")
+                    continue
+                self.set_segment('warmup', ppt_label, threads_label)
+                if threads is not None and not self.start_load(threads):
+                    self.log(f"Warning: the load command failed to start with {threads} threads; skipping this step.")
+                    continue
+                self.wait(plan['warmup_s'], 'Warming up')
+                self.set_segment('measure', ppt_label, threads_label)
+                self.wait(plan['measure_s'], 'Measuring')
+                self.stop_load()
+                self.set_segment('cooldown', ppt_label, 'N/A' if threads is None else '0')
+                if number < len(steps):
+                    self.wait(plan['cooldown_s'], 'Cooling down')
+        finally:
+            self.stop_load()
+            if self.sampler.poll() is None:
+                self.sampler.terminate()
+                self.sampler.wait()
+            if plan['ppt_set_cmd'] and plan['ppt_reset_w'] is not None:
+                if not self.set_ppt(float(plan['ppt_reset_w'])):
+                    self.log("Warning: PPT reset command failed.")
+            for suffix in ('.control', '.status'):
+                if os.path.exists(self.base + suffix):
+                    os.unlink(self.base + suffix)
+
+
+def run_agent(plan, output_dir, log=print):
+    """
+    Runs one target's sweep on this machine and writes <run_id>.json next to its logs.
+
+    Returns:
+        dict: The run manifest (plan, host name, start/end times, status, error).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {'run_id': plan['run_id'], 'target': plan['name'], 'host': socket.gethostname(),
+                'config': plan['config'], 'plan': plan, 'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'status': 'ok', 'error': None}
+    try:
+        _Agent(plan, output_dir, log).run()
+    except (OSError, RuntimeError) as e:
+        manifest['status'], manifest['error'] = 'failed', str(e)
+        log(f"Error: {e}")
+    except (KeyboardInterrupt, SystemExit):
+        manifest['status'], manifest['error'] = 'failed', 'interrupted'
+        raise
+    finally:
+        manifest['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        with open(os.path.join(output_dir, plan['run_id'] + '.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# --- runner: starts the agents and collects their files ---
+
+class LocalTransport:
+    """Runs the agent as a subprocess of this runner; the results are written in place."""
+
+    def __init__(self, plan, results_dir):
+        self.plan = plan
+        self.results_dir = results_dir
+
+    def agent_command(self):
+        return [sys.executable, os.path.join(SCRIPT_DIR, 'sweep.py'), 'agent', '--output_dir', self.results_dir, '-']
+
+    def fetch(self):
+        return True
+
+
+class SSHTransport(LocalTransport):
+    """Runs the agent in the host's checkout over ssh and copies its files back with copy_cmd."""
+
+    def remote_dir(self):
+        return os.path.join(self.plan['workdir'], self.plan['remote_results_dir'])
+
+    def agent_command(self):
+        plan = self.plan
+        remote = (f"cd {shlex.quote(plan['workdir'])} && {plan['python']} sweep.py agent "
+                  f"--output_dir {shlex.quote(plan['remote_results_dir'])} -")
+        return [*shlex.split(plan['ssh_cmd']), plan['host'], remote]
+
+    def fetch(self):
+        source = f"{self.plan['host']}:{shlex.quote(self.remote_dir())}/{self.plan['run_id']}*"
+        return subprocess.run([*shlex.split(self.plan['copy_cmd']), source, self.results_dir]).returncode == 0
+
+
+TRANSPORTS = {
+    'local': LocalTransport,
+    'ssh': SSHTransport,
+}
+
+
+def _run_target(plan, results_dir, print_lock):
+    def log(message):
+        with print_lock:
+            print(f"[{plan['name']}] {message}", flush=True)
+
+    transport = TRANSPORTS[plan['transport']](plan, results_dir)
+    log(f"Starting ({plan['transport']}{', ' + plan['host'] if plan['host'] else ''}"
+        f"{', CPUs ' + plan['cpuset'] if plan['cpuset'] else ''})")
+    process = subprocess.Popen(transport.agent_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    process.stdin.write(json.dumps(plan))
+    process.stdin.close()
+    for line in process.stdout:
+        log(line.rstrip())
+    returncode = process.wait()
+    fetched = transport.fetch()
+    manifest_path = os.path.join(results_dir, plan['run_id'] + '.json')
+    if not os.path.exists(manifest_path):
+        # The agent never got as far as writing its manifest (no checkout, ssh failure, ...).
+        manifest = {'run_id': plan['run_id'], 'target': plan['name'], 'host': plan['host'] or socket.gethostname(),
+                    'config': plan['config'], 'plan': plan, 'status': 'failed',
+                    'error': f"agent exited with status {returncode}" + ('' if fetched else '; fetching results failed')}
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    log(f"Finished: {manifest['status']}" + (f" ({manifest['error']})" if manifest.get('error') else ''))
+    return manifest
+
+
+def _run_slots(plans):
+    """
+    Groups plans that must not overlap; each group runs in plan order.
+
+    Plans conflict when they share a host and either a CPU set or PPT set-points:
+    the PPT limit is package-wide, so two targets sweeping it on one machine would
+    overwrite each other's limit and mislabel Set_PPT_W.
+    """
+    slots = []
+    for plan in plans:
+        keys = {('cpuset', plan['host'], plan['cpuset'])}
+        if plan['ppt_w']:
+            keys.add(('ppt', plan['host']))
+        merged = [slot for slot in slots if slot['keys'] & keys]
+        slot = {'keys': keys, 'plans': []}
+        for other in merged:
+            slot['keys'] |= other['keys']
+            slot['plans'] += other['plans']
+            slots.remove(other)
+        slot['plans'].append(plan)
+        slots.append(slot)
+    order = {plan['run_id']: index for index, plan in enumerate(plans)}
+    return [sorted(slot['plans'], key=lambda plan: order[plan['run_id']]) for slot in slots]
+
+
+def run_sweep(plans, results_dir, max_parallel=None):
+    """
+    Runs every plan, in parallel except within the groups _run_slots() forms.
+
+    Returns:
+        list: The run manifests, in plan order.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    slots = _run_slots(plans)
+    print_lock = threading.Lock()
+    manifests = {}
+
+    def run_slot(slot_plans):
+        for plan in slot_plans:
+            manifests[plan['run_id']] = _run_target(plan, results_dir, print_lock)
+
+    with ThreadPoolExecutor(max_workers=max_parallel or len(slots)) as pool:
+        for future in [pool.submit(run_slot, slot_plans) for slot_plans in slots]:
+            future.result()
+    return [manifests[plan['run_id']] for plan in plans]
+
+
+# --- merging and fleet-wide analysis ---
+
+def _manifests(results_dir):
+    manifests = []
+    for name in sorted(os.listdir(results_dir)):
+        if name.endswith('.json'):
+            with open(os.path.join(results_dir, name)) as f:
+                manifest = json.load(f)
+            if 'run_id' in manifest and 'plan' in manifest:
+                manifests.append(manifest)
+    return manifests
+
+
+def merge_results(results_dir):
+    """
+    Combines every run's log into fleet.csv and writes fleet_index.csv.
+
+    Log text is copied as written (no re-formatting); runs whose logs lack a
+    column get empty fields in it.
+
+    Returns:
+        pd.DataFrame: The index, one row per run.
+    """
+    import pandas as pd
+    index_rows = []
+    logs = []
+    columns = []
+    for manifest in _manifests(results_dir):
+        log_path = os.path.join(results_dir, manifest['run_id'] + '.csv')
+        row = {'Run_ID': manifest['run_id'], 'Target': manifest['target'], 'Host': manifest['host'],
+               'Config': config_label(manifest['config']), 'Status': manifest['status'],
+               'Error': manifest.get('error') or '', 'Started': manifest.get('started', ''),
+               'Finished': manifest.get('finished', ''), 'Rows': 0, 'Log': os.path.basename(log_path)}
+        row.update({f'Config_{key}': value for key, value in manifest['config'].items()})
+        index_rows.append(row)
+        if os.path.exists(log_path) and os.path.getsize(log_path):
+            with open(log_path) as f:
+                header = [name.strip() for name in f.readline().strip().split(',')]
+            columns += [name for name in header if name not in columns]
+            logs.append((row, log_path))
+    fleet_path = os.path.join(results_dir, FLEET_FILE)
+    tmp_path = fleet_path + '.tmp'
+    with open(tmp_path, 'w', newline='') as out:
+        out.write(','.join(TAG_COLUMNS + columns) + '\n')
+        for row, log_path in logs:
+            for chunk in pd.read_csv(log_path, dtype=str, keep_default_na=False, chunksize=1 << 18):
+                chunk.columns = chunk.columns.str.strip()
+                chunk = chunk.reindex(columns=columns, fill_value='')
+                for position, tag in enumerate(TAG_COLUMNS):
+                    chunk.insert(position, tag, row[tag])
+                chunk.to_csv(out, header=False, index=False)
+                row['Rows'] += len(chunk)
+    os.replace(tmp_path, fleet_path)
+    index = pd.DataFrame(index_rows)
+    index.to_csv(os.path.join(results_dir, FLEET_INDEX_FILE), index=False)
+    return index
+
+
+def load_fleet(results_dir, power_threshold_w=1.0, measurement_only=True):
+    """
+    Loads fleet.csv with the analysis columns derived per run (see analysis.add_derived_columns).
+
+    Segment_ID stays per run, so group by (Run_ID, Segment_ID) across the fleet.
+
+    Returns:
+        pd.DataFrame: All runs' rows, tagged with Run_ID, Target, Host and Config.
+    """
+    import pandas as pd
+    from analysis import clean_log_frame, add_derived_columns, COL_PHASE
+    df = clean_log_frame(pd.read_csv(os.path.join(results_dir, FLEET_FILE), dtype={tag: str for tag in TAG_COLUMNS}))
+    df[TAG_COLUMNS] = df[TAG_COLUMNS].fillna('')
+    if measurement_only and COL_PHASE in df.columns:
+        df = df[(df[COL_PHASE] == 'measure').to_numpy()]
+    runs = []
+    for _, run in df.groupby('Run_ID', sort=False):
+        run = run.reset_index(drop=True)
+        add_derived_columns(run, power_threshold_w)
+        runs.append(run)
+    return pd.concat(runs, ignore_index=True) if runs else df.iloc[:0]
+
+
+def summarize_fleet(fleet_df):
+    """Per-run, per-segment steady-state statistics (analysis.summarize_segments) for the whole fleet."""
+    import pandas as pd
+    from analysis import summarize_segments
+    summaries = []
+    for (run_id, target, host, config), run in fleet_df.groupby(TAG_COLUMNS, sort=False):
+        summary = summarize_segments(run)
+        for position, (tag, value) in enumerate(zip(TAG_COLUMNS, (run_id, target, host, config))):
+            summary.insert(position, tag, value)
+        summaries.append(summary)
+    return pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame(columns=TAG_COLUMNS)
+
+
+def _install_exit_on_hangup():
+    # ssh closing or the runner terminating us must still stop the load and reset PPT (the finally blocks).
+    for signum in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, lambda received, _frame: sys.exit(128 + received))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run sweeps from a spec file on several hosts or CPU sets and merge the results.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run every target of a spec, then merge the results.")
+    run_parser.add_argument("spec", help="Sweep spec (.json).")
+    run_parser.add_argument("--results_dir", default="sweep_results", help="Where runs and the merged dataset go.")
+    run_parser.add_argument("--parallel", type=int, default=None,
+                            help="Most targets running at once (default: every group that may overlap).")
+    run_parser.add_argument("--dry_run", action="store_true", help="Print each target's commands and exit.")
+    run_parser.add_argument("--no_merge", action="store_true", help="Skip merging into fleet.csv.")
+    agent_parser = subparsers.add_parser("agent", help="Run one resolved target plan on this machine.")
+    agent_parser.add_argument("plan", help="Plan (.json) as produced by 'run', or '-' for stdin.")
+    agent_parser.add_argument("--output_dir", default="sweep_results", help="Where the logs and manifest go.")
+    merge_parser = subparsers.add_parser("merge", help="Merge the runs in a results directory into fleet.csv.")
+    merge_parser.add_argument("results_dir")
+    summary_parser = subparsers.add_parser("summary", help="Write and print per-run segment statistics.")
+    summary_parser.add_argument("results_dir")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "run":
+            with open(args.spec) as f:
+                plans = resolve_targets(json.load(f))
+            if args.dry_run:
+                for plan in plans:
+                    transport = TRANSPORTS[plan['transport']](plan, args.results_dir)
+                    print(f"[{plan['name']}] agent: {shlex.join(transport.agent_command())}")
+                    print(f"[{plan['name']}] sampler: {shlex.join(_sampler_command(plan, plan['run_id']))}")
+                return
+            manifests = run_sweep(plans, args.results_dir, args.parallel)
+            if not args.no_merge:
+                index = merge_results(args.results_dir)
+                print(f"Merged {int(index['Rows'].sum())} rows from {len(index)} runs into "
+                      f"{os.path.join(args.results_dir, FLEET_FILE)}")
+            failed = [m['run_id'] for m in manifests if m['status'] != 'ok']
+            if failed:
+                print(f"Failed runs: {', '.join(failed)}", file=sys.stderr)
+                sys.exit(1)
+        elif args.command == "agent":
+            _install_exit_on_hangup()
+            if args.plan == '-':
+                plan = json.load(sys.stdin)
+            else:
+                with open(args.plan) as f:
+                    plan = json.load(f)
+            manifest = run_agent(plan, args.output_dir, log=lambda message: print(message, flush=True))
+            sys.exit(0 if manifest['status'] == 'ok' else 1)
+        elif args.command == "merge":
+            index = merge_results(args.results_dir)
+            print(index[['Run_ID', 'Host', 'Config', 'Status', 'Rows']].to_string(index=False))
+        else:
+            summary = summarize_fleet(load_fleet(args.results_dir))
+            summary.to_csv(os.path.join(args.results_dir, FLEET_SUMMARY_FILE), index=False)
+            print(summary.drop(columns=['Usable']).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+End-to-end check of `sweep.py run` against fakehw.py.
+
+One target runs locally, the other through ssh/copy stand-ins that run the
+"remote" command on this machine, so both transports, the merge and the
+fleet files are exercised without hardware or a second host.
+"""
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import sweep  # noqa: E402
+
+FAKE_SSH = '#!/bin/sh\n# ssh stand-in: ignore the host, run the remote command here\nshift; exec sh -c "$1"\n'
+FAKE_COPY = '#!/bin/sh\n# scp stand-in for "host:path dest"\neval "cp $(echo "$1" | cut -d: -f2-) \\"$2\\""\n'
+
+
+def _script(path, body):
+    with open(path, 'w') as f:
+        f.write(body)
+    os.chmod(path, 0o755)
+    return path
+
+
+class SweepRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.results_dir = os.path.join(self.tmp, 'results')
+        self.ssh = _script(os.path.join(self.tmp, 'fakessh'), FAKE_SSH)
+        self.copy = _script(os.path.join(self.tmp, 'fakecp'), FAKE_COPY)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _fakehw(self, target, args):
+        state_dir = os.path.join(self.tmp, 'hw-' + target)
+        return f"{shlex.quote(sys.executable)} {shlex.quote(os.path.join(REPO_DIR, 'fakehw.py'))} " \
+               f"--state_dir {shlex.quote(state_dir)} {args}"
+
+    def _target(self, name, **settings):
+        target = {'name': name, 'config': {'cooler': name},
+                  'read_cmd': self._fakehw(name, '--test-export --time_scale 20'),
+                  'ppt_set_cmd': self._fakehw(name, '--set-ppt=')}
+        target.update(settings)
+        return target
+
+    def test_run_merges_local_and_ssh_targets(self):
+        spec = {
+            'name': 'ci',
+            'defaults': {'ppt_w': [40, 80], 'warmup_s': 0.5, 'measure_s': 1.0, 'cooldown_s': 0.5,
+                         'interval_s': 0.2, 'python': sys.executable},
+            'targets': [
+                self._target('local'),
+                self._target('remote', host='rig-b', workdir=REPO_DIR,
+                             remote_results_dir=os.path.join(self.tmp, 'remote'),
+                             ssh_cmd=self.ssh, copy_cmd=self.copy),
+            ],
+        }
+        spec_path = os.path.join(self.tmp, 'spec.json')
+        with open(spec_path, 'w') as f:
+            json.dump(spec, f)
+
+        run = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'sweep.py'), 'run', spec_path,
+                              '--results_dir', self.results_dir],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=120)
+        self.assertEqual(run.returncode, 0, run.stdout)
+
+        index = pd.read_csv(os.path.join(self.results_dir, sweep.FLEET_INDEX_FILE))
+        self.assertEqual(sorted(index['Run_ID']), ['ci-local', 'ci-remote'])
+        self.assertTrue((index['Status'] == 'ok').all(), index.to_string())
+        # The ssh target wrote on the "remote" side and its files were copied back.
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'remote', 'ci-remote.json')))
+
+        fleet = pd.read_csv(os.path.join(self.results_dir, sweep.FLEET_FILE))
+        self.assertTrue(set(sweep.TAG_COLUMNS) <= set(fleet.columns))
+        rows = fleet.groupby('Run_ID').size()
+        for _, run_row in index.iterrows():
+            self.assertGreater(run_row['Rows'], 0)
+            self.assertEqual(rows[run_row['Run_ID']], run_row['Rows'])
+        for run_id, group in fleet.groupby('Run_ID'):
+            measured = group[group['Phase'] == 'measure']
+            self.assertEqual(sorted(measured['Set_PPT_W'].unique()), [40.0, 80.0], run_id)
+
+    def test_ppt_targets_on_one_host_share_a_slot(self):
+        plans = sweep.resolve_targets({'targets': [
+            self._target('a', cpuset='0-3', ppt_w=[40]),
+            self._target('b', cpuset='4-7', ppt_w=[40]),
+            self._target('c', cpuset='8-11'),
+            self._target('d', host='rig-b', ppt_w=[40]),
+        ]})
+        slots = [[plan['name'] for plan in slot] for slot in sweep._run_slots(plans)]
+        self.assertEqual(sorted(slots), [['a', 'b'], ['c'], ['d']])
+
+
+if __name__ == '__main__':
+    unittest.main()
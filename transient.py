@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Transient thermal model identification from the logger's time series.
+
+fit.py only uses the steady state of each segment. Here the whole warm-up /
+measurement / cool-down curves are used to identify a thermal RC network
+
+    1 pole:  T = T_amb + x,            tau  * dx/dt = R * P - x
+    2 poles: T = T_amb + x1 + x2,      tau_i * dx_i/dt = R_i * P - x_i
+
+in which every R and tau depends on fan RPM. Each segment gets an ARX
+least-squares fit of the sampled system (one shared solve for all segments,
+from per-segment normal equations accumulated in one vectorized pass), which is
+converted back to R and tau. Power laws of the segments' median RPM, weighted
+by how large a transient each segment holds, give a starting point only: the
+one-step fits are biased by sensor noise and by the fan speeding up along a
+warm-up curve. The laws are then refined by an output-error fit that simulates
+the whole log from the logged power and fan speed and minimises the simulated
+vs. logged temperature error. The fan itself is fitted as a linear curve of
+temperature, so the model can simulate the temperature for any PPT schedule:
+
+    python3 transient.py --poles 2 --schedule 0:15,60:95,660:15 --duration 1200 -o predicted.csv
+
+The simulation is an exact discretisation per step (a couple of microseconds
+per step), so hours of a sweep are predicted in milliseconds. The log itself is
+simulated as a linear recurrence solved block-wise with cumulative products, so
+the output-error fit stays vectorized on long logs.
+"""
+import argparse
+import math
+import sys
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from analysis import (load_dataset, DEFAULT_LOG_FILE, COL_ACTUAL_PPT, COL_AMBIENT_TEMP, COL_CPU_TEMP,
+                      COL_ELAPSED, COL_FAN_RPM, COL_SEGMENT_ID)
+
+# Segments whose temperature moves less than this carry no information about tau.
+MIN_TEMP_RANGE_C = 2.0
+MIN_SEGMENT_STEPS = 10
+# Samples averaged at each end of a segment to measure its transient without the sensor noise.
+EDGE_SAMPLES = 5
+# Steps solved at once by _linear_recurrence; with the decay floor below, exp(-cumsum) stays finite.
+_SCAN_BLOCK = 32
+_MIN_DECAY = 1e-9
+# Bounds of the output-error fit: RPM exponents of R and tau, and the shortest tau in sample intervals.
+MAX_RPM_EXPONENT = 2.0
+MIN_TAU_INTERVALS = 0.25
+
+
+def _lagged_design(df, poles):
+    """
+    One-step-ahead regression rows of the sampled RC network.
+
+    Returns:
+        tuple: (segment ids, design matrix, target, fan RPM, sample interval (s)),
+               using only steps inside one segment with finite readings at the nominal interval.
+    """
+    t = df[COL_ELAPSED].to_numpy(dtype=float)
+    rise = df[COL_CPU_TEMP].to_numpy(dtype=float) - df[COL_AMBIENT_TEMP].to_numpy(dtype=float)
+    power = df[COL_ACTUAL_PPT].to_numpy(dtype=float)
+    segments = df[COL_SEGMENT_ID].to_numpy()
+    rpm = df[COL_FAN_RPM].to_numpy(dtype=float)
+    dt = float(np.nanmedian(np.diff(t)))
+    k = np.arange(poles, len(df))
+    lags = [k - lag for lag in range(poles + 1)]  # k, k-1, ..., k-poles
+    valid = np.ones(len(k), dtype=bool)
+    for lag in lags:
+        valid &= (segments[lag] == segments[k]) & np.isfinite(rise[lag]) & np.isfinite(power[lag])
+    for newer, older in zip(lags, lags[1:]):
+        valid &= np.abs(t[newer] - t[older] - dt) <= 0.5 * dt
+    k = k[valid]
+    # y[k] = sum_i a_i y[k-i] + sum_i b_i P[k-i], i = 1..poles
+    columns = [rise[k - i] for i in range(1, poles + 1)] + [power[k - i] for i in range(1, poles + 1)]
+    return segments[k], np.column_stack(columns), rise[k], rpm[k], dt
+
+
+def _batched_least_squares(groups, X, y):
+    """
+    Solves one least-squares problem per group from accumulated normal equations.
+
+    Returns:
+        tuple: (group labels, coefficients (G, m), residual RMS (G,), rows per group, solvable mask).
+    """
+    labels, index = np.unique(groups, return_inverse=True)
+    m = X.shape[1]
+    xtx = np.zeros((len(labels), m, m))
+    xty = np.zeros((len(labels), m))
+    np.add.at(xtx, index, X[:, :, None] * X[:, None, :])
+    np.add.at(xty, index, X * y[:, None])
+    counts = np.bincount(index, minlength=len(labels))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        solvable = (counts >= max(MIN_SEGMENT_STEPS, 2 * m)) & (np.linalg.cond(xtx) < 1e12)
+    coef = np.full((len(labels), m), np.nan)
+    if solvable.any():
+        coef[solvable] = np.linalg.solve(xtx[solvable], xty[solvable][:, :, None])[:, :, 0]
+    residual = y - np.einsum('ij,ij->i', X, coef[index])
+    rms = np.sqrt(np.bincount(index, residual ** 2, minlength=len(labels)) / np.maximum(counts, 1))
+    return labels, coef, rms, counts, solvable
+
+
+def _continuous_params(coef, dt, poles):
+    """
+    Converts ARX coefficients to (R_1..R_p, tau_1..tau_p), fastest pole first.
+
+    Rows whose poles are not real and inside (0, 1), i.e. not a stable RC
+    network, become NaN.
+    """
+    n = len(coef)
+    resistances = np.full((n, poles), np.nan)
+    taus = np.full((n, poles), np.nan)
+    if poles == 1:
+        a, b = coef[:, 0], coef[:, 1]
+        ok = (a > 0) & (a < 1)
+        taus[ok, 0] = -dt / np.log(a[ok])
+        resistances[ok, 0] = b[ok] / (1 - a[ok])
+        return resistances, taus
+    a1, a2, b1, b2 = coef.T
+    disc = a1 * a1 + 4 * a2
+    root = np.sqrt(np.where(disc >= 0, disc, np.nan))
+    p = np.stack([(a1 - root) / 2, (a1 + root) / 2], axis=1)  # smaller pole = faster
+    ok = np.all((p > 0) & (p < 1), axis=1) & (np.abs(p[:, 1] - p[:, 0]) > 1e-9)
+    # Partial fractions of (b1 z + b2) / ((z - p0)(z - p1)); each term r/(z-p) has DC gain r/(1-p).
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r0 = (b1 * p[:, 0] + b2) / (p[:, 0] - p[:, 1])
+        r1 = (b1 * p[:, 1] + b2) / (p[:, 1] - p[:, 0])
+    resistances[ok] = np.stack([r0 / (1 - p[:, 0]), r1 / (1 - p[:, 1])], axis=1)[ok]
+    taus[ok] = -dt / np.log(p[ok])
+    return resistances, taus
+
+
+def _power_law(rpm, values, weights):
+    """Weighted fit of log(value) = log(k) + e * log(rpm). Returns (k, e); e = 0 without an RPM spread."""
+    ok = np.isfinite(values) & (values > 0) & (rpm > 0)
+    if not ok.any():
+        return math.nan, 0.0
+    log_rpm, log_v, w = np.log(rpm[ok]), np.log(values[ok]), weights[ok]
+    if ok.sum() < 2 or np.ptp(log_rpm) < 1e-6:
+        return float(np.exp(np.average(log_v, weights=w))), 0.0
+    exponent, intercept = np.polyfit(log_rpm, log_v, 1, w=np.sqrt(w))
+    return float(np.exp(intercept)), float(exponent)
+
+
+def _linear_recurrence(a, c, x0):
+    """
+    Solves x[0] = x0, x[k + 1] = a[k] * x[k] + c[k] without a Python loop per step.
+
+    Blocks of _SCAN_BLOCK steps are solved at once from cumulative products (from a
+    zero start), and the much shorter recurrence between block starts the same way,
+    recursively.
+
+    Returns:
+        np.ndarray: x, one longer than a.
+    """
+    n = len(a)
+    if n == 0:
+        return np.array([x0], dtype=float)
+    blocks = -(-n // _SCAN_BLOCK)
+    pad = blocks * _SCAN_BLOCK - n
+    log_a = np.log(np.clip(a, _MIN_DECAY, 1.0))
+    cum = np.cumsum(np.concatenate([log_a, np.zeros(pad)]).reshape(blocks, _SCAN_BLOCK), axis=1)
+    decay = np.exp(cum)
+    from_zero = decay * np.cumsum(np.concatenate([c, np.zeros(pad)]).reshape(blocks, _SCAN_BLOCK) * np.exp(-cum),
+                                  axis=1)
+    starts = _linear_recurrence(decay[:-1, -1], from_zero[:-1, -1], x0)
+    return np.concatenate([[x0], (decay * starts[:, None] + from_zero).ravel()[:n]])
+
+
+def _log_input(df, dt):
+    """
+    The log as runs of consecutive samples for simulation.
+
+    Returns:
+        dict: rise (°C over ambient), power, rpm, segment and step (s to the next sample)
+              per sample with finite readings, and `start`, True where a run begins
+              (first sample, or after a gap in time).
+    """
+    t = df[COL_ELAPSED].to_numpy(dtype=float)
+    rise = df[COL_CPU_TEMP].to_numpy(dtype=float) - df[COL_AMBIENT_TEMP].to_numpy(dtype=float)
+    power = df[COL_ACTUAL_PPT].to_numpy(dtype=float)
+    rpm = df[COL_FAN_RPM].to_numpy(dtype=float)
+    keep = np.isfinite(t) & np.isfinite(rise) & np.isfinite(power) & np.isfinite(rpm)
+    t, rise, power, rpm = t[keep], rise[keep], power[keep], rpm[keep]
+    step = np.append(np.diff(t), dt)
+    start = np.ones(len(t), dtype=bool)
+    start[1:] = np.abs(step[:-1] - dt) > 0.5 * dt
+    return {'rise': rise, 'power': power, 'rpm': np.maximum(rpm, 1.0), 'step': step, 'start': start,
+            'segment': df[COL_SEGMENT_ID].to_numpy()[keep]}
+
+
+def _simulate_log(log, r_laws, tau_laws):
+    """
+    Temperature rise the model predicts over the log from the logged power and fan speed.
+
+    Each run starts from its first logged sample, split across the poles as in
+    equilibrium (as TransientModel.simulate does).
+    """
+    rpm = log['rpm']
+    r = np.array([k * rpm ** e for k, e in r_laws])
+    tau = np.array([k * rpm ** e for k, e in tau_laws])
+    share = r / r.sum(axis=0)
+    restart = log['start'][1:]
+    predicted = np.zeros(len(rpm))
+    for i in range(len(r_laws)):
+        a = np.exp(-log['step'][:-1] / tau[i, :-1])
+        c = r[i, :-1] * (1 - a) * log['power'][:-1]
+        a[restart] = 0.0
+        c[restart] = (log['rise'] * share[i])[1:][restart]
+        predicted += _linear_recurrence(a, c, log['rise'][0] * share[i, 0])
+    return predicted
+
+
+def _laws(theta, poles, ref_rpm, fit_exponents):
+    """theta = (log value at ref_rpm[, exponent]) for each R, then each tau -> (r_laws, tau_laws)."""
+    size = 2 if fit_exponents else 1
+    laws = []
+    for i in range(2 * poles):
+        log_value = theta[i * size]
+        exponent = theta[i * size + 1] if fit_exponents else 0.0
+        laws.append((float(np.exp(log_value) * ref_rpm ** -exponent), float(exponent)))
+    return laws[:poles], laws[poles:]
+
+
+def _theta(r_laws, tau_laws, ref_rpm, fit_exponents):
+    theta = []
+    for k, e in list(r_laws) + list(tau_laws):
+        theta += [math.log(k * ref_rpm ** e), e] if fit_exponents else [math.log(k * ref_rpm ** e)]
+    return np.array(theta)
+
+
+def _refine(log, poles, starts, ref_rpm, fit_exponents, dt):
+    """
+    Output-error fit: the power laws minimising the simulated vs. logged temperature error.
+
+    RPM exponents are kept within ±MAX_RPM_EXPONENT and every tau above
+    MIN_TAU_INTERVALS sample intervals, so a pole the log cannot resolve does not
+    wander off to absurd laws.
+
+    Args:
+        starts (list): Candidate (r_laws, tau_laws); the fit starts from the best of them.
+
+    Returns:
+        tuple: (r_laws, tau_laws, relative standard error of each tau at ref_rpm).
+    """
+    def residual(theta):
+        return _simulate_log(log, *_laws(theta, poles, ref_rpm, fit_exponents)) - log['rise']
+
+    size = 2 if fit_exponents else 1
+    lower = np.full(2 * poles * size, -np.inf)
+    upper = np.full(2 * poles * size, np.inf)
+    if fit_exponents:
+        lower[1::2], upper[1::2] = -MAX_RPM_EXPONENT, MAX_RPM_EXPONENT
+    lower[poles * size::size] = math.log(MIN_TAU_INTERVALS * dt)
+    candidates = [np.clip(_theta(r_laws, tau_laws, ref_rpm, fit_exponents), lower + 1e-9, upper - 1e-9)
+                  for r_laws, tau_laws in starts]
+    sse = [float(np.sum(residual(theta) ** 2)) for theta in candidates]
+    best = candidates[int(np.nanargmin(sse))]
+    # dogbox copes better than trf with an exponent resting on its bound.
+    fit = least_squares(residual, best, bounds=(lower, upper), x_scale='jac', method='dogbox')
+    # Covariance of the log-parameters from the Jacobian at the optimum.
+    dof = max(len(fit.fun) - len(fit.x), 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = np.linalg.pinv(fit.jac.T @ fit.jac) * float(fit.fun @ fit.fun) / dof
+    tau_se = [float(np.sqrt(max(cov[(poles + i) * size, (poles + i) * size], 0.0))) for i in range(poles)]
+    r_laws, tau_laws = _laws(fit.x, poles, ref_rpm, fit_exponents)
+    # Fastest pole first, as in the per-segment table.
+    order = np.argsort([k * ref_rpm ** e for k, e in tau_laws])
+    return [r_laws[i] for i in order], [tau_laws[i] for i in order], [tau_se[i] for i in order]
+
+
+@dataclass
+class TransientModel:
+    """RC network whose R_i and tau_i are power laws of fan RPM, plus a linear fan curve."""
+    poles: int
+    r_laws: list  # [(k, exponent)] per pole: R_i(rpm) = k * rpm^exponent (°C/W)
+    tau_laws: list  # [(k, exponent)] per pole: tau_i(rpm) = k * rpm^exponent (s)
+    fan_curve: tuple  # (intercept, slope, min_rpm, max_rpm): RPM = clip(intercept + slope * T)
+    sample_interval_s: float
+    segments: pd.DataFrame = field(default=None, repr=False)
+    # Simulated vs. logged temperature over the log: rms_c, max_c, samples, tau_rel_se (per pole).
+    fit: dict = field(default=None, repr=False)
+
+    def parameters(self, rpm):
+        """(R array, tau array) of the poles at a fan speed."""
+        rpm = max(float(rpm), 1.0)
+        r = np.array([k * rpm ** e for k, e in self.r_laws])
+        tau = np.array([k * rpm ** e for k, e in self.tau_laws])
+        return r, tau
+
+    def fan_rpm(self, temp_c):
+        intercept, slope, low, high = self.fan_curve
+        return min(high, max(low, intercept + slope * temp_c))
+
+    def steady_temp(self, power_w, ambient_c, rpm=None, iterations=50):
+        """Equilibrium temperature; with the fan curve, the fixed point of T = T_amb + R(RPM(T)) * P."""
+        temp = ambient_c
+        for _ in range(iterations if rpm is None else 1):
+            r, _ = self.parameters(self.fan_rpm(temp) if rpm is None else rpm)
+            new_temp = ambient_c + r.sum() * power_w
+            if abs(new_temp - temp) < 1e-6:
+                break
+            temp = new_temp
+        return new_temp
+
+    def simulate(self, t_s, power_w, ambient_c, temp0_c=None, rpm=None):
+        """
+        Predicts the temperature trajectory for a power schedule.
+
+        Args:
+            t_s (array): Sample times (s), increasing.
+            power_w (array): Package power held from each sample to the next.
+            ambient_c (float or array): Ambient temperature.
+            temp0_c (float): Initial temperature; None starts in equilibrium at power_w[0].
+            rpm (array): Fan speed per sample; None follows the fitted fan curve.
+
+        Returns:
+            tuple: (temperature array, fan RPM array).
+        """
+        t_s = np.asarray(t_s, dtype=float)
+        power_w = np.broadcast_to(np.asarray(power_w, dtype=float), t_s.shape)
+        ambient = np.broadcast_to(np.asarray(ambient_c, dtype=float), t_s.shape)
+        temps = np.empty(len(t_s))
+        rpms = np.empty(len(t_s))
+        if temp0_c is None:
+            temp0_c = self.steady_temp(power_w[0], ambient[0], None if rpm is None else rpm[0])
+        speed = self.fan_rpm(temp0_c) if rpm is None else rpm[0]
+        r, _ = self.parameters(speed)
+        # Split the initial rise across the poles as in equilibrium.
+        states = (temp0_c - ambient[0]) * r / r.sum() if r.sum() else np.zeros(self.poles)
+        for k in range(len(t_s)):
+            temps[k] = ambient[k] + states.sum()
+            rpms[k] = speed = self.fan_rpm(temps[k]) if rpm is None else rpm[k]
+            if k + 1 < len(t_s):
+                r, tau = self.parameters(speed)
+                decay = np.exp(-(t_s[k + 1] - t_s[k]) / tau)
+                states = decay * states + r * (1 - decay) * power_w[k]
+        return temps, rpms
+
+
+def identify(df, poles=1, min_temp_range_c=MIN_TEMP_RANGE_C):
+    """
+    Identifies a TransientModel from a log with derived columns (see analysis.load_dataset).
+
+    Per-segment ARX fits of the segments holding a transient give the starting
+    power laws; the laws are then refined by an output-error fit over the whole log.
+
+    Args:
+        df (pd.DataFrame): All phases of the log (load with measurement_only=False).
+        poles (int): 1 or 2.
+        min_temp_range_c (float): Segments whose temperature changes less from start to
+                                  end (noise averaged out) do not seed the fit.
+
+    Returns:
+        TransientModel: Its `segments` table holds the per-segment fits and the
+                        simulated vs. logged error, `fit` the overall fit quality.
+
+    Raises:
+        ValueError: If poles is not 1 or 2, or the log holds no temperature transient.
+    """
+    if poles not in (1, 2):
+        raise ValueError(f"poles must be 1 or 2, got {poles}")
+    if COL_ELAPSED not in df.columns:
+        raise ValueError("the log has no timestamps; a transient fit needs Elapsed_S")
+    groups, X, y, rpm, dt = _lagged_design(df, poles)
+    if len(y) == 0:
+        raise ValueError("no consecutive samples to fit")
+    labels, coef, rms, counts, solvable = _batched_least_squares(groups, X, y)
+    resistances, taus = _continuous_params(coef, dt, poles)
+
+    by_group = pd.DataFrame({'g': groups, 'rpm': rpm, 'y': y}).groupby('g')
+    rise = pd.DataFrame({'g': df[COL_SEGMENT_ID].to_numpy(),
+                         'rise': (df[COL_CPU_TEMP] - df[COL_AMBIENT_TEMP]).to_numpy(dtype=float)}).groupby('g')
+    # Start-to-end change with EDGE_SAMPLES averaged at each end, so noise alone does not count.
+    transient = (rise.head(EDGE_SAMPLES).groupby('g')['rise'].mean().reindex(labels)
+                 - rise.tail(EDGE_SAMPLES).groupby('g')['rise'].mean().reindex(labels)).abs()
+    table = pd.DataFrame({COL_SEGMENT_ID: labels, 'Steps': counts,
+                          COL_FAN_RPM: by_group['rpm'].median().reindex(labels).to_numpy(),
+                          'Temp_Range_C': (by_group['y'].max() - by_group['y'].min()).reindex(labels).to_numpy(),
+                          'Transient_C': transient.to_numpy(),
+                          'One_Step_RMS_C': rms})
+    for i in range(poles):
+        table[f'R{i + 1}'] = resistances[:, i]
+        table[f'Tau{i + 1}_S'] = taus[:, i]
+    table['R_Total'] = resistances.sum(axis=1)
+    has_transient = table['Transient_C'].to_numpy() >= min_temp_range_c
+    if not has_transient.any():
+        largest = table.loc[table['Transient_C'].idxmax()] if table['Transient_C'].notna().any() else None
+        raise ValueError(
+            f"no segment holds a temperature transient of {min_temp_range_c:g}°C or more"
+            + (f" (largest: {largest['Transient_C']:.2f}°C in segment {int(largest[COL_SEGMENT_ID])})"
+               if largest is not None else '')
+            + "; tau can only be identified from the curve right after a PPT change, so log the "
+              "warm-up and cool-down phases (not just steady measurements) with large enough PPT steps, "
+              "or lower --min_temp_range")
+    table['Usable'] = (solvable & np.all(np.isfinite(taus), axis=1) & np.all(resistances > 0, axis=1)
+                       & has_transient & (table[COL_FAN_RPM].to_numpy() > 0))
+
+    log = _log_input(df, dt)
+    ref_rpm = float(np.median(log['rpm']))
+    fit_exponents = np.ptp(np.log(log['rpm'])) > 1e-6
+    starts = []
+    usable = table[table['Usable']]
+    if not usable.empty:
+        # Weighted by the squared transient: what a segment tells about tau grows with its swing, not its length.
+        segment_rpm = usable[COL_FAN_RPM].to_numpy(dtype=float)
+        weights = usable['Transient_C'].to_numpy(dtype=float) ** 2
+        starts.append(([_power_law(segment_rpm, usable[f'R{i + 1}'].to_numpy(), weights) for i in range(poles)],
+                       [_power_law(segment_rpm, usable[f'Tau{i + 1}_S'].to_numpy(), weights)
+                        for i in range(poles)]))
+    # Fixed-RPM starts from the steady gain and a spread of time constants, for when the
+    # one-step fits are unstable or far off.
+    loaded = log['power'] > 1.0
+    r_total = float(np.median(log['rise'][loaded] / log['power'][loaded])) if loaded.any() else 0.5
+    r_total = r_total if r_total > 0 else 0.5
+    longest_run_s = max(float(np.max(np.diff(np.flatnonzero(np.append(log['start'], True))))) * dt, 4 * dt)
+    for tau in np.geomspace(2 * dt, longest_run_s / 2, 6):
+        if poles == 1:
+            starts.append(([(r_total, 0.0)], [(tau, 0.0)]))
+        else:
+            starts.append(([(0.3 * r_total, 0.0), (0.7 * r_total, 0.0)], [(tau / 5, 0.0), (tau, 0.0)]))
+    r_laws, tau_laws, tau_rel_se = _refine(log, poles, starts, ref_rpm, fit_exponents, dt)
+
+    error = _simulate_log(log, r_laws, tau_laws) - log['rise']
+    sim_rms = pd.Series(error ** 2).groupby(log['segment']).mean() ** 0.5
+    table['Sim_RMS_C'] = sim_rms.reindex(labels).to_numpy()
+    fit = {'rms_c': float(np.sqrt(np.mean(error ** 2))), 'max_c': float(np.max(np.abs(error))),
+           'samples': len(error), 'tau_rel_se': tau_rel_se}
+
+    fan = df[[COL_CPU_TEMP, COL_FAN_RPM]].dropna()
+    fan = fan[fan[COL_FAN_RPM] > 0]
+    if len(fan) >= 2 and np.ptp(fan[COL_CPU_TEMP].to_numpy()) > 0:
+        slope, intercept = np.polyfit(fan[COL_CPU_TEMP].to_numpy(float), fan[COL_FAN_RPM].to_numpy(float), 1)
+    else:
+        slope, intercept = 0.0, ref_rpm
+    fan_curve = (float(intercept), float(slope),
+                 float(fan[COL_FAN_RPM].min()) if len(fan) else intercept,
+                 float(fan[COL_FAN_RPM].max()) if len(fan) else intercept)
+    return TransientModel(poles, r_laws, tau_laws, fan_curve, dt, table, fit)
+
+
+def parse_schedule(text):
+    """'t0:W0,t1:W1,...' (seconds:watts, held until the next change) -> sorted list of (t, W)."""
+    steps = []
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        t, sep, watts = item.partition(':')
+        if not sep:
+            raise ValueError(f"schedule entries are 'seconds:watts', got '{item}'")
+        steps.append((float(t), float(watts)))
+    if not steps:
+        raise ValueError("empty schedule")
+    return sorted(steps)
+
+
+def schedule_power(steps, t_s):
+    """Power (W) of a step schedule at each time; before the first step, its power applies."""
+    times = np.array([t for t, _ in steps])
+    watts = np.array([w for _, w in steps])
+    return watts[np.maximum(np.searchsorted(times, t_s, side='right') - 1, 0)]
+
+
+def settle_times(model_t, temps, steps, tolerance_c=0.5):
+    """
+    How long each schedule step takes to settle.
+
+    Returns:
+        list: (start_s, watts, seconds until the temperature stays within tolerance_c of
+              the step's final value or None if it never does, final temperature) per step.
+    """
+    result = []
+    bounds = [t for t, _ in steps] + [model_t[-1] + 1]
+    for (start, watts), end in zip(steps, bounds[1:]):
+        in_step = (model_t >= start) & (model_t < end)
+        if not in_step.any():
+            continue
+        t, temp = model_t[in_step], temps[in_step]
+        outside = np.flatnonzero(np.abs(temp - temp[-1]) > tolerance_c)
+        settle = 0.0 if len(outside) == 0 else (t[outside[-1] + 1] - start if outside[-1] + 1 < len(t) else None)
+        result.append((start, watts, settle, float(temp[-1])))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit a transient RC thermal model to a logger time series and simulate PPT schedules.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("log_file", nargs='?', default=DEFAULT_LOG_FILE,
+                        help="Logger CSV or .cpulog (all phases are used).")
+    parser.add_argument("--poles", type=int, choices=[1, 2], default=1,
+                        help="Number of RC stages.")
+    parser.add_argument("--min_temp_range", type=float, default=MIN_TEMP_RANGE_C,
+                        help="Segments whose temperature changes less than this (°C) from start to end "
+                             "do not seed the fit.")
+    parser.add_argument("--schedule", default=None,
+                        help="PPT schedule to simulate as 'seconds:watts,...', e.g. 0:15,60:95,660:15.")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Seconds to simulate (default: last schedule step + 600).")
+    parser.add_argument("--ambient", type=float, default=None,
+                        help="Ambient temperature for the simulation (default: median of the log).")
+    parser.add_argument("--settle_tolerance", type=float, default=0.5,
+                        help="°C band used to report how long each schedule step takes to settle.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="CSV to write the simulated trajectory to.")
+
+    args = parser.parse_args()
+    try:
+        dataset = load_dataset(args.log_file, measurement_only=False)
+        model = identify(dataset.df, args.poles, args.min_temp_range)
+        steps = parse_schedule(args.schedule) if args.schedule else None
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    segments = model.segments
+    print(f"{args.poles}-pole RC fit (sample interval {model.sample_interval_s:g}s), seeded by the one-step fits of "
+          f"{int(segments['Usable'].sum())} of {len(segments)} segments and refined over the whole log:")
+    print(segments.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    for i in range(model.poles):
+        (rk, re_), (tk, te) = model.r_laws[i], model.tau_laws[i]
+        print(f"  R{i + 1}(RPM) = {rk:.4g} * RPM^{re_:.3f} °C/W,  tau{i + 1}(RPM) = {tk:.4g} * RPM^{te:.3f} s"
+              f" (±{100 * model.fit['tau_rel_se'][i]:.1f}%)")
+    intercept, slope, low, high = model.fan_curve
+    print(f"  Fan curve: RPM = {intercept:.0f} + {slope:.1f} * T, clipped to [{low:.0f}, {high:.0f}]")
+    print(f"  Simulated vs. logged temperature (logged power and fan speed): RMS {model.fit['rms_c']:.3f}°C, "
+          f"max {model.fit['max_c']:.2f}°C over {model.fit['samples']} samples")
+    if max(model.fit['tau_rel_se']) > 0.5:
+        print("  Warning: a time constant is poorly determined; the log needs more or larger transients "
+              "(warm-up/cool-down curves after PPT steps)" + (", or use --poles 1" if model.poles == 2 else '') + ".")
+
+    if steps:
+        duration = args.duration if args.duration is not None else steps[-1][0] + 600.0
+        t = np.arange(0.0, duration + model.sample_interval_s / 2, model.sample_interval_s)
+        ambient = args.ambient if args.ambient is not None else float(dataset.df[COL_AMBIENT_TEMP].median())
+        power = schedule_power(steps, t)
+        temps, rpms = model.simulate(t, power, ambient)
+        print(f"\nSimulated {duration:.0f}s at ambient {ambient:.1f}°C:")
+        for start, watts, settle, end_temp in settle_times(t, temps, steps, args.settle_tolerance):
+            settled = f"settles within {args.settle_tolerance}°C after {settle:.0f}s" if settle is not None \
+                else "does not settle before the next step"
+            print(f"  from {start:6.0f}s at {watts:5.1f} W: {settled}; ends at {end_temp:.1f}°C")
+        if args.output:
+            pd.DataFrame({'Time_S': t, 'Power_W': power, COL_FAN_RPM: np.round(rpms),
+                          'Predicted_Temp_C': np.round(temps, 3)}).to_csv(args.output, index=False)
+            print(f"Trajectory written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()